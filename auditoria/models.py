@@ -17,6 +17,10 @@ class HistorialPrecioArticulo(models.Model):
     class Meta:
         db_table = 'historial_precios_articulos'
         ordering = ["-fecha_cambio"]
+        indexes = [
+            # Orden de la paginación por keyset (HistorialPrecioArticuloViewSet.ordering_keyset)
+            models.Index(fields=['-fecha_cambio', '-historial_id'], name='historial_fecha_keyset_idx'),
+        ]
         verbose_name = "Historial de Precio de Artículo"
         verbose_name_plural = "Historial de Precios de Artículos"
 
@@ -39,6 +43,9 @@ class DescuentoProveedorAutorizado(models.Model):
     class Meta:
         db_table = 'descuentos_proveedores_autorizados'
         ordering = ["-fecha_autorizacion"]
+        indexes = [
+            models.Index(fields=['estado', 'fecha_inicio', 'fecha_fin'], name='descuentos_vigencia_idx'),
+        ]
         verbose_name = "Descuento de Proveedor Autorizado"
         verbose_name_plural = "Descuentos de Proveedores Autorizados"
 
@@ -59,6 +66,10 @@ class AuditoriaReglaPrecio(models.Model):
     class Meta:
         db_table = 'auditoria_reglas_precios'
         ordering = ["-fecha_cambio"]
+        indexes = [
+            # Orden de la paginación por keyset (AuditoriaReglaPrecioViewSet.ordering_keyset)
+            models.Index(fields=['-fecha_cambio', '-auditoria_id'], name='auditoria_fecha_keyset_idx'),
+        ]
         verbose_name = "Auditoría de Regla de Precio"
         verbose_name_plural = "Auditorías de Reglas de Precios"
 
@@ -1,10 +1,17 @@
 import json
-from django.db.models.signals import pre_save, post_save, pre_delete
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 
-from precios.models import PrecioArticulo, ReglaPrecio
-from auditoria.models import HistorialPrecioArticulo, AuditoriaReglaPrecio
+from core.intervalos import invalidar_vigencias
+from precios.models import ListaPrecio, PrecioArticulo, ReglaPrecio, CombinacionProducto, DetalleCombinacionProducto
+from precios.combos import invalidar_indice_combos
+from precios.indice import invalidar_indice
+from precios.refresco import programar_refresco, articulos_en_alcance, listas_con_articulo
+from productos.models import Articulo
+from ventas.cache_cotizaciones import invalidar_cotizaciones
+from auditoria.models import HistorialPrecioArticulo, AuditoriaReglaPrecio, DescuentoProveedorAutorizado
 from trading_system.choices import AccionAuditoria
 
 
@@ -33,6 +40,43 @@ def get_audit_motivo():
     return getattr(_thread_locals, 'motivo', 'Cambio realizado desde el sistema')
 
 
+def _invalidar_indices_precios(*lista_precio_ids):
+    """
+    Invalida el índice compilado de las listas afectadas. Se repite al confirmar
+    la transacción para descartar índices reconstruidos antes del commit.
+    """
+    lista_precio_ids = {str(lista_id) for lista_id in lista_precio_ids if lista_id}
+
+    def invalidar():
+        for lista_id in lista_precio_ids:
+            invalidar_indice(lista_id)
+
+    invalidar()
+    transaction.on_commit(invalidar)
+
+
+def _invalidar_cotizaciones(lista_precio_id, articulo_ids):
+    """
+    Desaloja de la cache de cotizaciones los artículos afectados de una lista,
+    ahora y otra vez al confirmar la transacción.
+    """
+    articulo_ids = [str(articulo_id) for articulo_id in articulo_ids]
+    if not lista_precio_id or not articulo_ids:
+        return
+
+    def invalidar():
+        invalidar_cotizaciones(lista_precio_id, articulo_ids)
+
+    invalidar()
+    transaction.on_commit(invalidar)
+
+
+def _refrescar_precios(lista_precio_id, articulo_ids):
+    """Desaloja las cotizaciones y programa el refresco de los precios efectivos"""
+    _invalidar_cotizaciones(lista_precio_id, articulo_ids)
+    programar_refresco(lista_precio_id, articulo_ids)
+
+
 @receiver(pre_save, sender=PrecioArticulo)
 def precio_articulo_pre_save(sender, instance, **kwargs):
     """
@@ -53,6 +97,15 @@ def precio_articulo_post_save(sender, instance, created, **kwargs):
     """
     Registra en el historial cuando se crea o actualiza un PrecioArticulo
     """
+    precio_anterior_obj = getattr(instance, '_precio_anterior', None)
+    _invalidar_indices_precios(
+        instance.lista_precio_id,
+        precio_anterior_obj.lista_precio_id if precio_anterior_obj else None
+    )
+    _refrescar_precios(instance.lista_precio_id, [instance.articulo_id])
+    if precio_anterior_obj:
+        _refrescar_precios(precio_anterior_obj.lista_precio_id, [precio_anterior_obj.articulo_id])
+
     usuario = get_current_user()
     motivo = get_audit_motivo()
     
@@ -83,6 +136,15 @@ def precio_articulo_post_save(sender, instance, created, **kwargs):
         )
 
 
+@receiver(pre_delete, sender=PrecioArticulo)
+def precio_articulo_pre_delete(sender, instance, **kwargs):
+    """
+    Invalida el índice de precios de la lista antes de eliminar el precio
+    """
+    _invalidar_indices_precios(instance.lista_precio_id)
+    _refrescar_precios(instance.lista_precio_id, [instance.articulo_id])
+
+
 def _serialize_regla_precio(regla):
     """
     Serializa una instancia de ReglaPrecio a un diccionario para auditoría
@@ -108,6 +170,16 @@ def _serialize_regla_precio(regla):
     }
 
 
+def _refrescar_alcance_regla(regla):
+    """
+    Programa el refresco de los precios efectivos de los artículos que cubre la regla
+    """
+    _refrescar_precios(
+        regla.lista_precio_id,
+        articulos_en_alcance(regla.aplica_articulo_id, regla.aplica_grupo_id, regla.aplica_linea_id)
+    )
+
+
 @receiver(pre_save, sender=ReglaPrecio)
 def regla_precio_pre_save(sender, instance, **kwargs):
     """
@@ -127,6 +199,15 @@ def regla_precio_post_save(sender, instance, created, **kwargs):
     """
     Registra en auditoría cuando se crea o actualiza una ReglaPrecio
     """
+    regla_anterior = getattr(instance, '_regla_anterior', None)
+    _invalidar_indices_precios(
+        instance.lista_precio_id,
+        regla_anterior.lista_precio_id if regla_anterior else None
+    )
+    _refrescar_alcance_regla(instance)
+    if regla_anterior:
+        _refrescar_alcance_regla(regla_anterior)
+
     usuario = get_current_user()
     
     if not usuario:
@@ -164,6 +245,9 @@ def regla_precio_pre_delete(sender, instance, **kwargs):
     Registra en auditoría cuando se elimina una ReglaPrecio
     Se ejecuta antes de eliminar para poder acceder a la relación FK
     """
+    _invalidar_indices_precios(instance.lista_precio_id)
+    _refrescar_alcance_regla(instance)
+
     usuario = get_current_user()
     
     if usuario:
@@ -182,3 +266,88 @@ def regla_precio_pre_delete(sender, instance, **kwargs):
             valor_nuevo=None,
             usuario=usuario
         )
+
+
+@receiver(pre_save, sender=Articulo)
+def articulo_pre_save(sender, instance, **kwargs):
+    """
+    Captura el costo y grupo anteriores para detectar cambios que afectan precios
+    """
+    instance._valores_precio_anteriores = None
+    if instance.pk:
+        instance._valores_precio_anteriores = Articulo.objects.filter(
+            pk=instance.pk
+        ).values('costo_actual', 'grupo_id').first()
+
+
+@receiver(post_save, sender=Articulo)
+def articulo_post_save(sender, instance, created, **kwargs):
+    """
+    Refresca los precios efectivos del artículo si cambió su costo o su grupo
+    """
+    anteriores = getattr(instance, '_valores_precio_anteriores', None)
+    if created or not anteriores:
+        return
+
+    # Un cambio de grupo (y de línea) cambia las reglas que alcanzan al artículo
+    if anteriores['grupo_id'] == instance.grupo_id_id and anteriores['costo_actual'] == instance.costo_actual:
+        return
+
+    for lista_precio_id in listas_con_articulo(instance.pk):
+        _refrescar_precios(lista_precio_id, [instance.pk])
+
+
+def _invalidar_combos(lista_precio_id):
+    """Invalida el índice de combinaciones de la lista, ahora y al confirmar"""
+    if not lista_precio_id:
+        return
+    invalidar_indice_combos(lista_precio_id)
+    transaction.on_commit(lambda: invalidar_indice_combos(lista_precio_id))
+
+
+@receiver(post_save, sender=CombinacionProducto)
+@receiver(pre_delete, sender=CombinacionProducto)
+def combinacion_producto_cambiada(sender, instance, **kwargs):
+    """
+    Invalida el índice de combinaciones de la lista del combo
+    """
+    _invalidar_combos(instance.lista_precio_id)
+
+
+@receiver(post_save, sender=DetalleCombinacionProducto)
+@receiver(pre_delete, sender=DetalleCombinacionProducto)
+def detalle_combinacion_cambiado(sender, instance, **kwargs):
+    """
+    Invalida el índice de combinaciones de la lista del combo del detalle
+    """
+    _invalidar_combos(
+        CombinacionProducto.objects.filter(
+            combinacion_id=instance.combinacion_producto_id
+        ).values_list('lista_precio_id', flat=True).first()
+    )
+
+
+# Modelo -> entidad del índice de vigencias (core.intervalos)
+_ENTIDADES_VIGENCIA = {
+    ListaPrecio: 'listas_precio',
+    ReglaPrecio: 'reglas_precio',
+    CombinacionProducto: 'combinaciones',
+    DescuentoProveedorAutorizado: 'descuentos_proveedor',
+}
+
+
+@receiver(post_save, sender=ListaPrecio)
+@receiver(post_delete, sender=ListaPrecio)
+@receiver(post_save, sender=ReglaPrecio)
+@receiver(post_delete, sender=ReglaPrecio)
+@receiver(post_save, sender=CombinacionProducto)
+@receiver(post_delete, sender=CombinacionProducto)
+@receiver(post_save, sender=DescuentoProveedorAutorizado)
+@receiver(post_delete, sender=DescuentoProveedorAutorizado)
+def vigencia_cambiada(sender, instance, **kwargs):
+    """
+    Invalida el índice de vigencias de la entidad, ahora y al confirmar la transacción
+    """
+    entidad = _ENTIDADES_VIGENCIA[sender]
+    invalidar_vigencias(entidad)
+    transaction.on_commit(lambda: invalidar_vigencias(entidad))
@@ -15,6 +15,8 @@ from auditoria.serializers import (
 )
 from productos.models import Articulo
 from precios.models import ReglaPrecio, ListaPrecio
+from core.intervalos import filtrar_vigentes
+from core.pagination import PaginacionSeleccionable
 
 
 class HistorialPrecioArticuloViewSet(viewsets.ReadOnlyModelViewSet):
@@ -26,6 +28,9 @@ class HistorialPrecioArticuloViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     ordering_fields = ['fecha_cambio', 'precio_anterior', 'precio_nuevo']
     ordering = ['-fecha_cambio']
+    # ?paginacion=keyset pagina por (fecha_cambio, id) sin COUNT ni OFFSET
+    pagination_class = PaginacionSeleccionable
+    ordering_keyset = ('-fecha_cambio', '-historial_id')
 
     def get_queryset(self):
         queryset = HistorialPrecioArticulo.objects.select_related(
@@ -101,6 +106,9 @@ class AuditoriaReglaPrecioViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     ordering_fields = ['fecha_cambio', 'accion']
     ordering = ['-fecha_cambio']
+    # ?paginacion=keyset pagina por (fecha_cambio, id) sin COUNT ni OFFSET
+    pagination_class = PaginacionSeleccionable
+    ordering_keyset = ('-fecha_cambio', '-auditoria_id')
 
     def get_queryset(self):
         queryset = AuditoriaReglaPrecio.objects.select_related(
@@ -221,11 +229,7 @@ class DescuentoProveedorAutorizadoViewSet(viewsets.ModelViewSet):
         vigente = self.request.query_params.get('vigente')
         if vigente and vigente.lower() == 'true':
             hoy = timezone.now().date()
-            queryset = queryset.filter(
-                estado=1,
-                fecha_inicio__lte=hoy,
-                fecha_fin__gte=hoy
-            )
+            queryset = filtrar_vigentes(queryset, 'descuentos_proveedor', hoy)
         
         return queryset
 
@@ -240,11 +244,7 @@ class DescuentoProveedorAutorizadoViewSet(viewsets.ModelViewSet):
         Obtiene los descuentos vigentes en la fecha actual
         """
         hoy = timezone.now().date()
-        queryset = self.get_queryset().filter(
-            estado=1,
-            fecha_inicio__lte=hoy,
-            fecha_fin__gte=hoy
-        )
+        queryset = filtrar_vigentes(self.get_queryset(), 'descuentos_proveedor', hoy)
         
         serializer = self.get_serializer(queryset, many=True)
         
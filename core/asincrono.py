@@ -0,0 +1,67 @@
+"""
+Vista base asíncrona con la autenticación, permisos y formato de errores de DRF.
+
+Las APIView de DRF son síncronas. AsyncAPIView es una View de Django con
+handlers `async def` que arma un Request de DRF, autentica y evalúa los
+permisos en un hilo (pueden consultar la base de datos) y renderiza la
+respuesta con el JSONRenderer de DRF, de modo que el cuerpo es el mismo que
+el de la vista síncrona equivalente.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+class AsyncAPIView(View):
+    permission_classes = [IsAuthenticated]
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Como en APIView, la verificación CSRF la hace SessionAuthentication
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def _autorizar(self, request):
+        """Autentica y verifica permisos (síncrono: puede consultar la base de datos)"""
+        request.user
+        for permiso in (permission() for permission in self.permission_classes):
+            if not permiso.has_permission(request, self):
+                if request.successful_authenticator is None and not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permiso, 'message', None))
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(
+            request,
+            parsers=[JSONParser()],
+            authenticators=[authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+        )
+        handler = getattr(self, request.method.lower(), None)
+        try:
+            if handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+            await sync_to_async(self._autorizar)(request)
+            return await handler(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.manejar_excepcion(request, exc)
+
+    def manejar_excepcion(self, request, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            # Igual que APIView: 401 solo si el autenticador define el encabezado
+            autenticadores = request.authenticators
+            encabezado = autenticadores[0].authenticate_header(request) if autenticadores else None
+            if not encabezado:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+        detalle = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return self.respuesta(detalle, status=exc.status_code)
+
+    @staticmethod
+    def respuesta(data, status=status.HTTP_200_OK):
+        return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
@@ -0,0 +1,61 @@
+"""
+Contadores de generación compartidos entre procesos.
+
+Los índices y caches que viven en memoria del proceso (precios.indice,
+ventas.cache_cotizaciones) se invalidan desde los signals, pero los signals
+solo corren en el proceso que guardó. Por eso cada invalidación sube además
+un contador en el alias de cache GENERACIONES_CACHE, y cada estructura guarda
+la generación con la que se construyó: antes de reutilizarla la compara con
+la actual, con una lectura de cache y sin consultas a la base.
+
+El alias debe ser compartido entre los workers (redis, memcached, base de
+datos o archivo). Con el locmem por defecto los contadores son del proceso y
+solo alcanzan con un único worker.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def _cache():
+    return caches[getattr(settings, 'GENERACIONES_CACHE', 'default')]
+
+
+def en_memoria():
+    """True si los contadores viven en memoria del proceso (locmem): leerlos no hace I/O"""
+    return isinstance(_cache(), LocMemCache)
+
+
+def _clave(nombre):
+    return f'generacion:{nombre}'
+
+
+def _inicial():
+    # Un contador nuevo o desalojado de la cache no vuelve a un valor ya usado
+    return time.time_ns()
+
+
+def actuales(*nombres):
+    """Generación actual de cada contador, en el orden pedido"""
+    cache = _cache()
+    claves = [_clave(nombre) for nombre in nombres]
+    valores = cache.get_many(claves)
+    faltantes = [clave for clave in claves if clave not in valores]
+    if faltantes:
+        for clave in faltantes:
+            cache.add(clave, _inicial(), timeout=None)
+        valores.update(cache.get_many(faltantes))
+    return tuple(valores.get(clave) for clave in claves)
+
+
+def subir(*nombres):
+    """Invalida todo lo construido con la generación actual de los contadores"""
+    cache = _cache()
+    for nombre in nombres:
+        clave = _clave(nombre)
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.add(clave, _inicial(), timeout=None)
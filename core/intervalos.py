@@ -0,0 +1,191 @@
+"""
+Índice de vigencias por tipo de entidad y alcance.
+
+Listas de precios, reglas, combinaciones y descuentos de proveedor tienen una
+ventana de vigencia [inicio, fin] (ambos inclusive). Para cada tipo y alcance
+(la empresa de las listas, la lista de las reglas y combinaciones) se mantiene
+en memoria un árbol de intervalos centrado con las filas activas que no han
+vencido, de modo que "vigentes en la fecha D" se responde en O(log n + k) y la
+base de datos solo recibe un filtro por clave primaria sobre las filas de ese
+alcance. Sin alcance (p. ej. combinaciones de todas las listas) se usa el
+filtro por rango, que resuelven los índices compuestos de vigencia.
+
+El índice se construye con una consulta la primera vez que se usa en el día:
+al pasar la medianoche se descarta y se reconstruye sin las filas vencidas.
+Los signals de los modelos lo invalidan (auditoria/signals.py) subiendo la
+generación compartida de la entidad (core.generaciones), que cada proceso
+compara antes de reutilizar sus índices. Para fechas anteriores a la
+construcción el índice no tiene las filas vencidas y se recurre al filtro
+por rango en la base de datos.
+"""
+import threading
+from datetime import date
+
+from django.apps import apps
+
+from core import generaciones
+from trading_system.choices import EstadoEntidades
+
+
+class _Nodo:
+    __slots__ = ('centro', 'por_inicio', 'por_fin', 'izquierdo', 'derecho')
+
+    def __init__(self, centro, intervalos):
+        self.centro = centro
+        # Los que contienen al centro, ordenados por inicio ascendente y por fin descendente
+        self.por_inicio = sorted(intervalos, key=lambda intervalo: intervalo[0])
+        self.por_fin = sorted(intervalos, key=lambda intervalo: intervalo[1], reverse=True)
+        self.izquierdo = None
+        self.derecho = None
+
+
+class ArbolIntervalos:
+    """
+    Árbol de intervalos centrado e inmutable sobre intervalos cerrados
+    (inicio, fin, valor).
+    """
+
+    def __init__(self, intervalos):
+        intervalos = [intervalo for intervalo in intervalos if intervalo[0] <= intervalo[1]]
+        self.total = len(intervalos)
+        self.raiz = self._construir(intervalos)
+
+    @classmethod
+    def _construir(cls, intervalos):
+        if not intervalos:
+            return None
+
+        extremos = sorted(extremo for inicio, fin, _ in intervalos for extremo in (inicio, fin))
+        centro = extremos[len(extremos) // 2]
+
+        izquierda, derecha, contienen = [], [], []
+        for intervalo in intervalos:
+            if intervalo[1] < centro:
+                izquierda.append(intervalo)
+            elif intervalo[0] > centro:
+                derecha.append(intervalo)
+            else:
+                contienen.append(intervalo)
+
+        nodo = _Nodo(centro, contienen)
+        nodo.izquierdo = cls._construir(izquierda)
+        nodo.derecho = cls._construir(derecha)
+        return nodo
+
+    def en(self, punto):
+        """Valores de los intervalos que contienen al punto"""
+        valores = []
+        nodo = self.raiz
+        while nodo is not None:
+            if punto < nodo.centro:
+                for inicio, _, valor in nodo.por_inicio:
+                    if inicio > punto:
+                        break
+                    valores.append(valor)
+                nodo = nodo.izquierdo
+            elif punto > nodo.centro:
+                for _, fin, valor in nodo.por_fin:
+                    if fin < punto:
+                        break
+                    valores.append(valor)
+                nodo = nodo.derecho
+            else:
+                valores.extend(valor for _, _, valor in nodo.por_inicio)
+                break
+        return valores
+
+    def __len__(self):
+        return self.total
+
+
+# Entidades con vigencia: nombre -> (modelo, campo de inicio, campo de fin, campo de alcance)
+ENTIDADES = {
+    'listas_precio': ('precios.ListaPrecio', 'fecha_vigencia_inicio', 'fecha_vigencia_fin', 'empresa_id'),
+    'reglas_precio': ('precios.ReglaPrecio', 'fecha_inicio', 'fecha_fin', 'lista_precio_id'),
+    'combinaciones': ('precios.CombinacionProducto', 'fecha_inicio', 'fecha_fin', 'lista_precio_id'),
+    'descuentos_proveedor': ('auditoria.DescuentoProveedorAutorizado', 'fecha_inicio', 'fecha_fin', None),
+}
+
+
+class IndiceVigencias:
+    """Filas activas de una entidad (y alcance) que siguen vigentes en o después de `fecha`"""
+
+    def __init__(self, entidad, fecha, arbol, alcance=None, generacion=None):
+        self.entidad = entidad
+        self.fecha = fecha
+        self.arbol = arbol
+        self.alcance = alcance
+        self.generacion = generacion
+
+    @classmethod
+    def construir(cls, entidad, fecha, alcance=None, generacion=None):
+        modelo, campo_inicio, campo_fin, campo_alcance = ENTIDADES[entidad]
+        modelo = apps.get_model(modelo)
+        filas = modelo.objects.filter(
+            estado=EstadoEntidades.ACTIVO,
+            **{f'{campo_fin}__gte': fecha}
+        )
+        if campo_alcance:
+            filas = filas.filter(**{campo_alcance: alcance})
+        filas = filas.order_by().values_list(campo_inicio, campo_fin, 'pk')
+        return cls(entidad, fecha, ArbolIntervalos(filas), alcance, generacion)
+
+    def vigentes(self, fecha):
+        """
+        Claves primarias vigentes en la fecha, o None si la fecha es anterior
+        a la construcción del índice (las filas vencidas no están en el árbol).
+        """
+        if fecha < self.fecha:
+            return None
+        return self.arbol.en(fecha)
+
+
+# Registro de índices del proceso: (entidad, alcance) -> IndiceVigencias
+_indices = {}
+_lock = threading.Lock()
+
+
+def obtener_indice_vigencias(entidad, alcance=None):
+    """
+    Retorna el índice de vigencias de la entidad en el alcance para hoy. Se
+    construye bajo demanda y se reutiliza hasta la medianoche o hasta que
+    cualquier proceso lo invalide.
+    """
+    hoy = date.today()
+    clave = (entidad, str(alcance) if alcance is not None else None)
+    generacion = generaciones.actuales(f'vigencias:{entidad}')
+    indice = _indices.get(clave)
+    if indice is not None and indice.fecha == hoy and indice.generacion == generacion:
+        return indice
+
+    indice = IndiceVigencias.construir(entidad, hoy, alcance, generacion)
+    with _lock:
+        _indices[clave] = indice
+    return indice
+
+
+def invalidar_vigencias(entidad=None):
+    """Descarta los índices de vigencias de una entidad, o de todas, en todos los procesos"""
+    entidades = [entidad] if entidad else list(ENTIDADES)
+    with _lock:
+        generaciones.subir(*(f'vigencias:{nombre}' for nombre in entidades))
+        for clave in [clave for clave in _indices if clave[0] in entidades]:
+            del _indices[clave]
+
+
+def filtrar_vigentes(queryset, entidad, fecha, alcance=None):
+    """
+    Restringe el queryset a las filas activas vigentes en la fecha usando el
+    índice de vigencias del alcance, o el filtro por rango si la entidad
+    requiere alcance y no se indica, o si el índice no cubre la fecha.
+    """
+    _, campo_inicio, campo_fin, campo_alcance = ENTIDADES[entidad]
+    if alcance is not None or campo_alcance is None:
+        ids = obtener_indice_vigencias(entidad, alcance).vigentes(fecha)
+        if ids is not None:
+            return queryset.filter(pk__in=ids)
+
+    return queryset.filter(
+        estado=EstadoEntidades.ACTIVO,
+        **{f'{campo_inicio}__lte': fecha, f'{campo_fin}__gte': fecha}
+    )
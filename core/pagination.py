@@ -1,22 +1,115 @@
-from rest_framework.pagination import PageNumberPagination, LimitOffsetPagination, CursorPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, LimitOffsetPagination, CursorPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import F, Field, Func, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from django.utils.functional import cached_property
 from collections import OrderedDict
+from functools import partial
+import base64
+import binascii
+import json
+
+
+def estimar_filas(queryset):
+    """Filas que el planificador de Postgres estima para el queryset (EXPLAIN, sin ejecutarlo)"""
+    plan = json.loads(queryset.explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class PaginaEstimada(Page):
+    """Página de un PaginadorEstimado con conteo aproximado: sabe si hay otra sin usar el total"""
+    hay_siguiente = None
+
+    def has_next(self):
+        if self.hay_siguiente is not None:
+            return self.hay_siguiente
+        return super().has_next()
+
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginator que, para querysets grandes, reemplaza el COUNT(*) por la
+    estimación del planificador de Postgres. Si la estimación es menor que
+    PAGINACION_CONTEO_ESTIMADO_DESDE (o exacto=True) cuenta las filas como
+    siempre: con filtros selectivos el conteo exacto es barato. Con conteo
+    aproximado (aproximado=True) las páginas no se validan contra el total:
+    cada una lee una fila de más para saber si hay siguiente.
+    """
+
+    def __init__(self, *args, exacto=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exacto = exacto
+        self.aproximado = False
+
+    @cached_property
+    def count(self):
+        desde = getattr(settings, 'PAGINACION_CONTEO_ESTIMADO_DESDE', None)
+        object_list = self.object_list
+        if (not self.exacto and desde is not None and hasattr(object_list, 'explain')
+                and connections[object_list.db].vendor == 'postgresql'):
+            estimado = estimar_filas(object_list)
+            if estimado >= desde:
+                self.aproximado = True
+                return estimado
+        return super().count
+
+    def validate_number(self, number):
+        if not (self.count and self.aproximado):
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Número de página inválido')
+        if number < 1:
+            raise EmptyPage('Número de página menor que 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.aproximado:
+            return super().page(number)
+        inicio = (number - 1) * self.per_page
+        filas = list(self.object_list[inicio:inicio + self.per_page + 1])
+        if not filas and number > 1:
+            raise EmptyPage('Página sin resultados')
+        pagina = self._get_page(filas[:self.per_page], number, self)
+        pagina.hay_siguiente = len(filas) > self.per_page
+        return pagina
+
+    def _get_page(self, *args, **kwargs):
+        return PaginaEstimada(*args, **kwargs)
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     """
     Paginación estándar con parámetros configurables.
     Uso: ?page=1&page_size=20
+
+    En listados grandes count y total_pages son la estimación de Postgres
+    (count_is_approximate: true, ver PaginadorEstimado); ?exact_count=1
+    fuerza el conteo exacto.
     """
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
     page_query_param = 'page'
-    
+    exact_count_query_param = 'exact_count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        exacto = request.query_params.get(self.exact_count_query_param, '').lower() in ('1', 'true')
+        self.django_paginator_class = partial(PaginadorEstimado, exacto=exacto)
+        return super().paginate_queryset(queryset, request, view)
+
     def get_paginated_response(self, data):
         """Respuesta personalizada con metadatos adicionales"""
         return Response(OrderedDict([
             ('count', self.page.paginator.count),
+            ('count_is_approximate', self.page.paginator.aproximado),
             ('next', self.get_next_link()),
             ('previous', self.get_previous_link()),
             ('total_pages', self.page.paginator.num_pages),
@@ -77,4 +170,134 @@ class CustomCursorPagination(CursorPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
     ordering = '-fecha_creacion'  # Campo por el que se ordena
-    cursor_query_param = 'cursor'
\ No newline at end of file
+    cursor_query_param = 'cursor'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por keyset sobre un orden compuesto y único, p. ej.
+    ('-fecha_cambio', '-historial_id'), tomado de view.ordering_keyset.
+    Cada página filtra por la posición (los valores de esos campos) de la
+    última fila de la anterior en lugar de contar y saltear filas: con un
+    índice sobre el mismo orden, el costo de una página no depende de su
+    profundidad. No informa el total. Ignora ?ordering.
+    Uso: ?cursor=<enlace next/previous>&page_size=20
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def get_page_size(self, request):
+        try:
+            tamano = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(tamano, 1), self.max_page_size)
+
+    def _codificar(self, posicion, atras):
+        datos = json.dumps({'p': posicion, 'a': int(atras)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(datos.encode()).decode()
+
+    def _decodificar(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            posicion, atras = datos['p'], bool(datos['a'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound('Cursor inválido')
+        if not isinstance(posicion, list) or len(posicion) != len(self.campos):
+            raise NotFound('Cursor inválido')
+        return posicion, atras
+
+    def _posterior(self, posicion, menor):
+        """
+        Filas después de la posición en el orden compuesto, como comparación de
+        filas (c0, c1) < (v0, v1): a diferencia de la cadena equivalente
+        (c0 < v0) OR (c0 = v0 AND c1 < v1), Postgres la usa como condición
+        del índice y empieza a leerlo en la posición.
+        """
+        campos = [self.modelo._meta.get_field(campo) for campo in self.campos]
+        fila = Func(*(F(campo) for campo in self.campos), template='(%(expressions)s)', output_field=Field())
+        valores = Func(
+            *(Value(campo.to_python(valor), output_field=campo) for campo, valor in zip(campos, posicion)),
+            template='(%(expressions)s)', output_field=Field()
+        )
+        return LessThan(fila, valores) if menor else GreaterThan(fila, valores)
+
+    def _posicion(self, instancia):
+        return [self.modelo._meta.get_field(campo).value_to_string(instancia) for campo in self.campos]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.modelo = queryset.model
+        orden = list(view.ordering_keyset)
+        self.descendente = orden[0].startswith('-')
+        self.campos = [
+            self.modelo._meta.pk.name if campo.lstrip('-') == 'pk' else campo.lstrip('-') for campo in orden
+        ]
+        self.tamano = self.get_page_size(request)
+        posicion, atras = self._decodificar(request)
+
+        # Hacia atrás se recorre el orden inverso y se da vuelta la página
+        descendente = self.descendente != atras
+        queryset = queryset.order_by(*(('-' if descendente else '') + campo for campo in self.campos))
+        if posicion is not None:
+            queryset = queryset.filter(self._posterior(posicion, menor=descendente))
+        filas = list(queryset[:self.tamano + 1])
+        hay_mas = len(filas) > self.tamano
+        filas = filas[:self.tamano]
+        if atras:
+            filas.reverse()
+
+        self.siguiente = self.anterior = None
+        if filas:
+            if hay_mas or atras:
+                self.siguiente = self._codificar(self._posicion(filas[-1]), False)
+            if (hay_mas and atras) or (posicion is not None and not atras):
+                self.anterior = self._codificar(self._posicion(filas[0]), True)
+        return filas
+
+    def _enlace(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._enlace(self.siguiente)
+
+    def get_previous_link(self):
+        return self._enlace(self.anterior)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('page_size', self.tamano),
+            ('results', data)
+        ]))
+
+
+class PaginacionSeleccionable(StandardResultsSetPagination):
+    """
+    Paginación estándar por número de página, o por keyset (KeysetPagination)
+    con ?paginacion=keyset o al seguir un enlace con ?cursor=. La vista define
+    ordering_keyset, un orden compuesto y único respaldado por un índice.
+    """
+    paginacion_query_param = 'paginacion'
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if (request.query_params.get(self.paginacion_query_param) == 'keyset'
+                or self.keyset_class.cursor_query_param in request.query_params):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,104 @@
+"""
+Plan de carga (select_related / prefetch_related) derivado de un serializador.
+
+Recorre los campos de lectura del serializador: cada serializador anidado
+sobre una FK u OneToOne se agrega a select_related, y cada relación múltiple
+(many=True sobre una relación inversa o ManyToMany) se carga con un Prefetch
+cuyo queryset lleva, a su vez, el plan del serializador hijo. Así el número
+de consultas depende de la forma del serializador y no de cuántas instancias
+se serializan.
+
+Los campos cuyo source no es una relación del modelo (propiedades, métodos,
+SerializerMethodField) no se pueden planificar: si consultan la base, deben
+resolverse aparte.
+"""
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def _relacion(modelo, source):
+    """Campo de relación del modelo para el source de un campo, o None si no es una relación directa"""
+    if not source or '.' in source or source == '*':
+        return None
+    try:
+        campo = modelo._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    return campo if campo.is_relation else None
+
+
+@lru_cache(maxsize=None)
+def _plan(serializer_class, modelo):
+    """
+    Returns:
+        tuple: (select_related, prefetch) donde prefetch son tuplas
+            (ruta, modelo relacionado, plan del hijo o None).
+    """
+    select, prefetch = [], []
+    for campo in serializer_class().fields.values():
+        if campo.write_only:
+            continue
+        relacion = _relacion(modelo, campo.source)
+        if relacion is None:
+            continue
+
+        if isinstance(campo, serializers.ListSerializer):
+            hijo = type(campo.child)
+            plan_hijo = _plan(hijo, relacion.related_model) if isinstance(campo.child, serializers.ModelSerializer) else None
+            prefetch.append((campo.source, relacion.related_model, plan_hijo))
+        elif isinstance(campo, serializers.ManyRelatedField):
+            prefetch.append((campo.source, relacion.related_model, None))
+        elif isinstance(campo, serializers.ModelSerializer) and (relacion.many_to_one or relacion.one_to_one):
+            select.append(campo.source)
+            select_hijo, prefetch_hijo = _plan(type(campo), relacion.related_model)
+            select.extend(f'{campo.source}__{ruta}' for ruta in select_hijo)
+            prefetch.extend((f'{campo.source}__{ruta}', modelo_rel, plan) for ruta, modelo_rel, plan in prefetch_hijo)
+    return tuple(select), tuple(prefetch)
+
+
+def _aplicar(queryset, plan):
+    select, prefetch = plan
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*(
+            # Un Prefetch nuevo por consulta: no se comparten querysets entre solicitudes
+            Prefetch(ruta, queryset=_aplicar(modelo._default_manager.all(), plan_hijo)) if plan_hijo else ruta
+            for ruta, modelo, plan_hijo in prefetch
+        ))
+    return queryset
+
+
+def plan_de_carga(serializer_class, modelo=None):
+    """select_related y rutas de prefetch que necesita el serializador (para inspección y pruebas)"""
+    select, prefetch = _plan(serializer_class, modelo or serializer_class.Meta.model)
+    return list(select), [ruta for ruta, _, _ in prefetch]
+
+
+def aplicar_plan(queryset, serializer_class):
+    """Agrega al queryset el plan de carga del serializador"""
+    return _aplicar(queryset, _plan(serializer_class, queryset.model))
+
+
+class PlanCargaMixin:
+    """
+    Para ViewSets: planes_carga declara, por acción, el serializador de la
+    respuesta. list y retrieve aplican su plan en get_queryset; las acciones
+    que escriben responden con serializar_cargado, que relee la instancia con
+    el plan de la acción en lugar de cargar cada relación por separado.
+    """
+    planes_carga = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve') and self.action in self.planes_carga:
+            queryset = aplicar_plan(queryset, self.planes_carga[self.action])
+        return queryset
+
+    def serializar_cargado(self, instancia):
+        serializer_class = self.planes_carga[self.action]
+        instancia = aplicar_plan(type(instancia)._default_manager.all(), serializer_class).get(pk=instancia.pk)
+        return serializer_class(instancia).data
@@ -0,0 +1,328 @@
+"""
+Análisis de solapamientos, reglas muertas, sombreadas y redundantes de una
+ListaPrecio.
+
+Las reglas de una lista se acumulan: al cotizar se aplican todas las que
+cubren al artículo en orden de prioridad y al final el precio se ajusta al
+precio mínimo. Sobre las reglas activas de la lista se reporta:
+
+- solapamientos: pares de reglas con vigencias que se cruzan, canales
+  compatibles y alcances que comparten artículos. Las reglas por línea se
+  agrupan por la línea a la que pertenece su alcance y en cada grupo se hace un
+  barrido por fecha de inicio con un heap de fechas de fin: O(n log n + k),
+  con k los pares que se cruzan en fecha dentro de la misma línea.
+- muertas: reglas que nunca cambian un precio (ver motivos en MOTIVOS).
+  Las que no dependen de la fecha ni de los artículos ya se descartan al
+  construir el índice de precios (precios.indice.motivos_descarte).
+- sombreadas: reglas que en todos los artículos con precio de su alcance
+  llegan con el precio ya por debajo del mínimo por reglas de mayor prioridad
+  que siempre se aplican junto con ellas, por lo que el ajuste al mínimo
+  anula su descuento.
+- redundantes: reglas con la misma condición y el mismo descuento que otra
+  cuya vigencia se solapa; se aplican las dos.
+"""
+import heapq
+from datetime import date
+
+from precios.indice import TIPOS_REGLA_PEDIDO, IndiceReglas, PrecioCompilado, compilar_regla, motivos_descarte
+from precios.models import PrecioArticulo, ReglaPrecio
+from productos.models import Articulo, GrupoArticulo
+from trading_system.choices import EstadoEntidades, TipoDescuento
+
+MOTIVOS = {
+    'descuento_cero': 'El valor del descuento es cero.',
+    'canal_invalido': 'El canal indicado no corresponde a ningún canal de venta.',
+    'sin_alcance': 'No indica artículo, grupo ni línea: al cotizar una línea nunca se busca.',
+    'vigencia_invalida': 'La fecha de fin es anterior a la de inicio.',
+    'vencida': 'La vigencia terminó antes de la fecha de análisis.',
+    'sin_precios': 'Ningún artículo de su alcance tiene precio en la lista.',
+}
+
+
+class Jerarquia:
+    """Rutas (línea, grupo, artículo) de los elementos que alcanzan las reglas"""
+
+    def __init__(self, articulos, grupos):
+        # articulo_id -> (grupo_id, linea_id); grupo_id -> linea_id
+        self.articulos = articulos
+        self.grupos = grupos
+
+    def rutas(self, regla):
+        """Una ruta por cada alcance de la regla: (linea,), (linea, grupo) o (linea, grupo, articulo)"""
+        rutas = []
+        if regla.articulo_id and regla.articulo_id in self.articulos:
+            grupo_id, linea_id = self.articulos[regla.articulo_id]
+            rutas.append((linea_id, grupo_id, regla.articulo_id))
+        if regla.grupo_id and regla.grupo_id in self.grupos:
+            rutas.append((self.grupos[regla.grupo_id], regla.grupo_id))
+        if regla.linea_id:
+            rutas.append((regla.linea_id,))
+        return rutas
+
+
+def _comparten_alcance(rutas_a, rutas_b):
+    """Dos alcances comparten artículos si una ruta es prefijo de la otra"""
+    for ruta_a in rutas_a:
+        for ruta_b in rutas_b:
+            corta, larga = (ruta_a, ruta_b) if len(ruta_a) <= len(ruta_b) else (ruta_b, ruta_a)
+            if larga[:len(corta)] == corta:
+                return True
+    return False
+
+
+def _canales_compatibles(regla_a, regla_b):
+    return not regla_a.aplica_canal or not regla_b.aplica_canal or regla_a.aplica_canal == regla_b.aplica_canal
+
+
+def _barrido(reglas, compatibles):
+    """
+    Pares de reglas con vigencias que se cruzan y que cumplen `compatibles`.
+    Barrido por fecha de inicio con un heap de las vigencias abiertas.
+    """
+    pares = []
+    abiertas = []
+    for regla in sorted(reglas, key=lambda regla: (regla.fecha_inicio, regla.codigo)):
+        while abiertas and abiertas[0][0] < regla.fecha_inicio:
+            heapq.heappop(abiertas)
+        for _, _, otra in abiertas:
+            if compatibles(otra, regla):
+                pares.append((otra, regla, regla.fecha_inicio, min(otra.fecha_fin, regla.fecha_fin)))
+        heapq.heappush(abiertas, (regla.fecha_fin, regla.codigo, regla))
+    return pares
+
+
+def _solapamientos(reglas, rutas):
+    """Pares de reglas que pueden aplicarse a la vez sobre los mismos artículos"""
+    pedido = [regla for regla in reglas if regla.tipo_regla in TIPOS_REGLA_PEDIDO]
+    por_linea = {}
+    for regla in reglas:
+        if regla.tipo_regla in TIPOS_REGLA_PEDIDO:
+            continue
+        for linea_id in {ruta[0] for ruta in rutas[regla.regla_precio_id]}:
+            por_linea.setdefault(linea_id, []).append(regla)
+
+    def compatibles_linea(regla_a, regla_b):
+        return _canales_compatibles(regla_a, regla_b) and _comparten_alcance(
+            rutas[regla_a.regla_precio_id], rutas[regla_b.regla_precio_id]
+        )
+
+    def compatibles_pedido(regla_a, regla_b):
+        # Sin alcance, una regla de pedido cubre todos los artículos
+        rutas_a, rutas_b = rutas[regla_a.regla_precio_id], rutas[regla_b.regla_precio_id]
+        return _canales_compatibles(regla_a, regla_b) and (
+            not rutas_a or not rutas_b or _comparten_alcance(rutas_a, rutas_b)
+        )
+
+    pares = {}
+    for reglas_linea in por_linea.values():
+        for par in _barrido(reglas_linea, compatibles_linea):
+            # Una regla con alcances en varias líneas aparece en más de un grupo
+            pares.setdefault(frozenset((par[0].regla_precio_id, par[1].regla_precio_id)), par)
+    for par in _barrido(pedido, compatibles_pedido):
+        pares.setdefault(frozenset((par[0].regla_precio_id, par[1].regla_precio_id)), par)
+
+    return sorted(pares.values(), key=lambda par: (par[0].codigo, par[1].codigo))
+
+
+def _redundantes(reglas):
+    """(regla, regla que duplica) con la misma condición y descuento y vigencias solapadas"""
+    por_condicion = {}
+    for regla in reglas:
+        condicion = (
+            regla.tipo_regla, regla.tipo_descuento, regla.valor_descuento, regla.articulo_id, regla.grupo_id,
+            regla.linea_id, regla.aplica_canal, regla.cantidad_minima, regla.monto_minimo
+        )
+        por_condicion.setdefault(condicion, []).append(regla)
+
+    redundantes = []
+    for grupo in por_condicion.values():
+        if len(grupo) < 2:
+            continue
+        # La primera en prioridad es la original; el resto la duplica si se cruzan en fecha
+        grupo.sort()
+        for i, regla in enumerate(grupo[1:], start=1):
+            for original in grupo[:i]:
+                if original.fecha_inicio <= regla.fecha_fin and regla.fecha_inicio <= original.fecha_fin:
+                    redundantes.append((regla, original))
+                    break
+    return redundantes
+
+
+def _siempre_junto(previa, regla):
+    """La regla previa se aplica siempre que se aplica `regla`"""
+    return (
+        (not previa.aplica_canal or previa.aplica_canal == regla.aplica_canal)
+        and (previa.cantidad_minima or 0) <= (regla.cantidad_minima or 0)
+        and previa.fecha_inicio <= regla.fecha_inicio
+        and regla.fecha_fin <= previa.fecha_fin
+    )
+
+
+def _descontar(precio, regla):
+    if regla.tipo_descuento == TipoDescuento.PORCENTAJE:
+        return precio - precio * regla.valor_descuento / 100
+    if regla.tipo_descuento == TipoDescuento.MONTO_FIJO:
+        return precio - regla.valor_descuento
+    return precio
+
+
+def _sombreadas(indice, articulos_con_precio):
+    """
+    regla_precio_id -> códigos de las reglas que la sombrean, para las reglas
+    anuladas por el ajuste al precio mínimo en todos los artículos de su
+    alcance. Costo: suma sobre los artículos del cuadrado de sus reglas candidatas.
+    """
+    sombreada_en = {}
+    con_efecto = set()
+
+    for articulo_id, grupo_id, linea_id in articulos_con_precio:
+        candidatas = indice.reglas_candidatas(articulo_id, grupo_id, linea_id)
+        if not candidatas:
+            continue
+        # Con recargos o descuentos mayores al 100% el precio no es monótono
+        # y no se puede concluir nada sobre el artículo
+        monotono = all(
+            regla.valor_descuento > 0
+            and (regla.tipo_descuento != TipoDescuento.PORCENTAJE or regla.valor_descuento <= 100)
+            for regla in candidatas
+        )
+        precio_info = indice.precio(articulo_id)
+
+        for i, regla in enumerate(candidatas):
+            if not monotono:
+                con_efecto.add(regla.regla_precio_id)
+                continue
+            precio = precio_info.precio_base
+            previas = []
+            for previa in candidatas[:i]:
+                if _siempre_junto(previa, regla):
+                    precio = _descontar(precio, previa)
+                    previas.append(previa.codigo)
+            if precio < precio_info.precio_minimo:
+                sombreada_en.setdefault(regla.regla_precio_id, set()).update(previas)
+            else:
+                con_efecto.add(regla.regla_precio_id)
+
+    return {
+        regla_id: sorted(codigos) for regla_id, codigos in sombreada_en.items()
+        if regla_id not in con_efecto
+    }
+
+
+def analizar_reglas(lista_precio_id, fecha=None, limite=500):
+    """
+    Analiza las reglas activas de una lista de precios.
+
+    Args:
+        lista_precio_id: ID de la lista de precios.
+        fecha (date): Fecha de análisis (por defecto hoy); las reglas que
+            vencen antes se reportan como muertas.
+        limite (int): Máximo de pares de solapamiento a detallar.
+
+    Returns:
+        dict: {
+                "total_reglas": int,
+                "solapamientos": {"cantidad": int, "pares": list[dict]},
+                "muertas": list[dict],
+                "sombreadas": list[dict],
+                "redundantes": list[dict],
+                "podables": list[str]   # IDs de reglas muertas o sombreadas: quitarlas no cambia ningún precio final
+            }
+    """
+    fecha = fecha or date.today()
+    reglas = [
+        compilar_regla(regla) for regla in ReglaPrecio.objects.filter(
+            lista_precio_id=lista_precio_id,
+            estado=EstadoEntidades.ACTIVO
+        ).order_by()
+    ]
+
+    articulos_con_precio = []
+    precios = {}
+    for articulo_id, grupo_id, linea_id, precio_base, precio_minimo in PrecioArticulo.objects.filter(
+        lista_precio_id=lista_precio_id,
+        estado=EstadoEntidades.ACTIVO
+    ).values_list('articulo_id', 'articulo__grupo_id', 'articulo__grupo_id__linea_id', 'precio_base', 'precio_minimo'):
+        articulos_con_precio.append((str(articulo_id), str(grupo_id), str(linea_id)))
+        precios[str(articulo_id)] = PrecioCompilado(precio_base, precio_minimo)
+
+    jerarquia = Jerarquia(
+        articulos={
+            str(articulo_id): (str(grupo_id), str(linea_id))
+            for articulo_id, grupo_id, linea_id in Articulo.objects.filter(
+                articulo_id__in={regla.articulo_id for regla in reglas if regla.articulo_id}
+            ).values_list('articulo_id', 'grupo_id', 'grupo_id__linea_id')
+        },
+        grupos={
+            str(grupo_id): str(linea_id)
+            for grupo_id, linea_id in GrupoArticulo.objects.filter(
+                grupo_id__in={regla.grupo_id for regla in reglas if regla.grupo_id}
+            ).values_list('grupo_id', 'linea_id')
+        },
+    )
+    rutas = {regla.regla_precio_id: jerarquia.rutas(regla) for regla in reglas}
+
+    # Elementos de la jerarquía con al menos un artículo con precio
+    con_precio = set()
+    for articulo_id, grupo_id, linea_id in articulos_con_precio:
+        con_precio.update(((linea_id,), (linea_id, grupo_id), (linea_id, grupo_id, articulo_id)))
+
+    muertas = {}
+    for regla in reglas:
+        motivos = motivos_descarte(regla)
+        if regla.fecha_fin < regla.fecha_inicio:
+            motivos.append('vigencia_invalida')
+        elif regla.fecha_fin < fecha:
+            motivos.append('vencida')
+        if (
+            regla.tipo_regla not in TIPOS_REGLA_PEDIDO and 'sin_alcance' not in motivos
+            and not any(ruta in con_precio for ruta in rutas[regla.regla_precio_id])
+        ):
+            motivos.append('sin_precios')
+        if motivos:
+            muertas[regla.regla_precio_id] = motivos
+
+    vivas = [regla for regla in reglas if regla.regla_precio_id not in muertas]
+    pares = _solapamientos(vivas, rutas)
+    redundantes = _redundantes(vivas)
+
+    # Todas las reglas vivas, sin filtrar por fecha: el ajuste se evalúa por vigencia
+    indice = IndiceReglas(lista_precio_id, fecha, precios, [
+        regla for regla in vivas if regla.tipo_regla not in TIPOS_REGLA_PEDIDO
+    ])
+    sombreadas = _sombreadas(indice, articulos_con_precio)
+
+    por_id = {regla.regla_precio_id: regla for regla in reglas}
+
+    def resumen(regla):
+        return {'regla_precio_id': regla.regla_precio_id, 'codigo': regla.codigo, 'prioridad': regla.prioridad}
+
+    return {
+        "total_reglas": len(reglas),
+        "solapamientos": {
+            "cantidad": len(pares),
+            "pares": [
+                {
+                    "regla_a": resumen(regla_a),
+                    "regla_b": resumen(regla_b),
+                    "desde": desde,
+                    "hasta": hasta,
+                }
+                for regla_a, regla_b, desde, hasta in pares[:limite]
+            ],
+        },
+        "muertas": [
+            {**resumen(por_id[regla_id]), "motivos": [{"codigo": motivo, "detalle": MOTIVOS[motivo]} for motivo in motivos]}
+            for regla_id, motivos in sorted(muertas.items(), key=lambda item: por_id[item[0]].codigo)
+        ],
+        "sombreadas": [
+            {**resumen(por_id[regla_id]), "sombreada_por": codigos}
+            for regla_id, codigos in sorted(sombreadas.items(), key=lambda item: por_id[item[0]].codigo)
+        ],
+        "redundantes": [
+            {**resumen(regla), "duplica_a": resumen(original)}
+            for regla, original in sorted(redundantes, key=lambda par: par[0].codigo)
+        ],
+        # Las redundantes no se incluyen: se aplican las dos y quitar una cambia el precio
+        "podables": sorted(set(muertas) | set(sombreadas)),
+    }
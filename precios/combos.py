@@ -0,0 +1,307 @@
+"""
+Índice compilado de combinaciones de productos por ListaPrecio.
+
+Las combinaciones vigentes de una lista y sus detalles se cargan con dos
+consultas y se indexan por artículo, grupo y línea. Evaluar un carrito pasa a
+ser una búsqueda en diccionarios por cada artículo del carrito: se acumula lo
+que aporta a cada detalle y se obtienen todas las combinaciones que cumple.
+
+La asignación sin solapamiento (cada unidad del carrito cuenta para un solo
+combo) es voraz: se aplican primero los combos de mayor beneficio estimado,
+tantas veces como alcancen las unidades restantes. Dentro de un combo los
+detalles por artículo toman unidades antes que los de grupo y de línea, para
+que los detalles más amplios usen lo que sobra.
+
+El índice se invalida desde los signals de CombinacionProducto y
+DetalleCombinacionProducto (auditoria/signals.py), que suben además la
+generación compartida de la lista (core.generaciones): los demás procesos la
+comparan con la del índice que tienen en memoria antes de reutilizarlo.
+"""
+import threading
+from datetime import date
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from core import generaciones
+from precios.models import CombinacionProducto, DetalleCombinacionProducto
+from trading_system.choices import EstadoEntidades, TipoBeneficio, TipoItem
+
+
+class DetalleCompilado(NamedTuple):
+    detalle_combinacion_id: str
+    tipo_item: int
+    alcance_id: Optional[str]
+    cantidad_requerida: int
+
+    def cubre(self, articulo_id, grupo_id, linea_id):
+        if self.tipo_item == TipoItem.ARTICULO:
+            return self.alcance_id == str(articulo_id)
+        if self.tipo_item == TipoItem.GRUPO:
+            return self.alcance_id == str(grupo_id)
+        if self.tipo_item == TipoItem.LINEA:
+            return self.alcance_id == str(linea_id)
+        return False
+
+
+class ComboCompilado(NamedTuple):
+    combinacion_id: str
+    nombre: str
+    tipo_beneficio: int
+    valor_beneficio: Decimal
+    detalles: tuple
+
+    def veces_posibles(self, cantidades):
+        """
+        Cuántas veces se cumple el combo con las cantidades acumuladas por
+        detalle (detalle_combinacion_id -> cantidad).
+        """
+        if not self.detalles:
+            return 0
+        return min(
+            cantidades.get(detalle.detalle_combinacion_id, 0) // max(detalle.cantidad_requerida, 1)
+            for detalle in self.detalles
+        )
+
+
+def compilar_detalle(detalle):
+    alcance_id = {
+        TipoItem.ARTICULO: detalle.articulo_id,
+        TipoItem.GRUPO: detalle.grupo_id,
+        TipoItem.LINEA: detalle.linea_id,
+    }.get(detalle.tipo_item)
+    return DetalleCompilado(
+        detalle_combinacion_id=str(detalle.detalle_combinacion_id),
+        tipo_item=detalle.tipo_item,
+        alcance_id=str(alcance_id) if alcance_id else None,
+        cantidad_requerida=detalle.cantidad_requerida,
+    )
+
+
+def compilar_combo(combo, detalles):
+    # Artículo antes que grupo y línea: los detalles más amplios toman lo que sobra
+    detalles = sorted((compilar_detalle(detalle) for detalle in detalles), key=lambda d: d.tipo_item)
+    return ComboCompilado(
+        combinacion_id=str(combo.combinacion_id),
+        nombre=combo.nombre,
+        tipo_beneficio=combo.tipo_beneficio,
+        valor_beneficio=combo.valor_beneficio,
+        detalles=tuple(detalles),
+    )
+
+
+class IndiceCombos:
+    """
+    Combinaciones vigentes de una lista para una fecha, con sus detalles
+    indexados por artículo, grupo y línea.
+    """
+
+    def __init__(self, lista_precio_id, fecha, combos, generacion=None):
+        self.lista_precio_id = str(lista_precio_id)
+        self.fecha = fecha
+        self.generacion = generacion
+        self.combos = {combo.combinacion_id: combo for combo in combos}
+        # alcance_id -> [(combo, detalle)]
+        self.por_articulo = {}
+        self.por_grupo = {}
+        self.por_linea = {}
+
+        por_tipo = {
+            TipoItem.ARTICULO: self.por_articulo,
+            TipoItem.GRUPO: self.por_grupo,
+            TipoItem.LINEA: self.por_linea,
+        }
+        for combo in combos:
+            for detalle in combo.detalles:
+                if detalle.alcance_id and detalle.tipo_item in por_tipo:
+                    por_tipo[detalle.tipo_item].setdefault(detalle.alcance_id, []).append((combo, detalle))
+
+    @classmethod
+    def construir(cls, lista_precio_id, fecha, generacion=None):
+        combos = list(CombinacionProducto.objects.filter(
+            lista_precio_id=lista_precio_id,
+            estado=EstadoEntidades.ACTIVO,
+            fecha_inicio__lte=fecha,
+            fecha_fin__gte=fecha
+        ).order_by('nombre'))
+
+        detalles = {}
+        for detalle in DetalleCombinacionProducto.objects.filter(
+            combinacion_producto_id__in=[combo.combinacion_id for combo in combos]
+        ).order_by():
+            detalles.setdefault(detalle.combinacion_producto_id, []).append(detalle)
+
+        return cls(lista_precio_id, fecha, [
+            compilar_combo(combo, detalles.get(combo.combinacion_id, [])) for combo in combos
+        ], generacion)
+
+    def detalles_de(self, articulo_id, grupo_id, linea_id):
+        """(combo, detalle) que cubren al artículo por artículo, grupo o línea"""
+        return (
+            self.por_articulo.get(str(articulo_id), [])
+            + (self.por_grupo.get(str(grupo_id), []) if grupo_id else [])
+            + (self.por_linea.get(str(linea_id), []) if linea_id else [])
+        )
+
+
+def beneficio_estimado(combo, unidades, precios):
+    """
+    Beneficio de una aplicación del combo.
+
+    Args:
+        combo (ComboCompilado): El combo.
+        unidades (dict): articulo_id -> unidades que consume la aplicación.
+        precios (dict): articulo_id -> precio unitario (Decimal).
+    """
+    if combo.tipo_beneficio == TipoBeneficio.DESCUENTO_PORCENTAJE:
+        importe = sum((precios.get(articulo_id, Decimal('0')) * cantidad for articulo_id, cantidad in unidades.items()), Decimal('0'))
+        return (importe * combo.valor_beneficio / 100).quantize(Decimal('0.01'))
+    # Monto fijo, o el valor declarado del regalo
+    return combo.valor_beneficio
+
+
+def evaluar_carrito(indice, items, precios=None):
+    """
+    Evalúa todas las combinaciones de la lista contra un carrito.
+
+    Args:
+        indice (IndiceCombos): Índice de la lista.
+        items (list[tuple]): (articulo_id, grupo_id, linea_id, cantidad).
+        precios (dict): articulo_id -> precio unitario, para estimar el
+            beneficio de los descuentos porcentuales.
+
+    Returns:
+        dict: {
+                "cumplidos": list[dict],   # cada combo que el carrito cumple
+                "asignacion": list[dict],  # combos aplicados sin compartir unidades
+                "beneficio_total": Decimal
+            }
+    """
+    precios = precios or {}
+
+    # Unidades del carrito por artículo, en el orden en que aparecen
+    disponibles = {}
+    jerarquia = {}
+    for articulo_id, grupo_id, linea_id, cantidad in items:
+        articulo_id = str(articulo_id)
+        disponibles[articulo_id] = disponibles.get(articulo_id, 0) + cantidad
+        jerarquia[articulo_id] = (grupo_id, linea_id)
+
+    # Una pasada sobre el carrito: lo que aporta cada artículo a cada detalle
+    cantidades = {}
+    tocados = {}
+    for articulo_id, cantidad in disponibles.items():
+        grupo_id, linea_id = jerarquia[articulo_id]
+        for combo, detalle in indice.detalles_de(articulo_id, grupo_id, linea_id):
+            por_detalle = cantidades.setdefault(combo.combinacion_id, {})
+            por_detalle[detalle.detalle_combinacion_id] = por_detalle.get(detalle.detalle_combinacion_id, 0) + cantidad
+            tocados[combo.combinacion_id] = combo
+
+    cumplidos = []
+    for combinacion_id, combo in tocados.items():
+        veces = combo.veces_posibles(cantidades[combinacion_id])
+        if veces:
+            cumplidos.append((combo, veces))
+
+    def consumir(combo, restantes):
+        """Unidades de una aplicación del combo, o None si ya no alcanzan"""
+        unidades = {}
+        for detalle in combo.detalles:
+            faltante = detalle.cantidad_requerida
+            for articulo_id, cantidad in restantes.items():
+                if faltante == 0:
+                    break
+                libres = cantidad - unidades.get(articulo_id, 0)
+                if libres <= 0 or not detalle.cubre(articulo_id, *jerarquia[articulo_id]):
+                    continue
+                tomadas = min(libres, faltante)
+                unidades[articulo_id] = unidades.get(articulo_id, 0) + tomadas
+                faltante -= tomadas
+            if faltante:
+                return None
+        return unidades
+
+    # Asignación voraz por beneficio estimado de una aplicación
+    candidatos = []
+    for combo, veces in cumplidos:
+        unidades = consumir(combo, disponibles)
+        if unidades is None:
+            # Los detalles se cumplen solo contando las mismas unidades dos veces
+            continue
+        candidatos.append((beneficio_estimado(combo, unidades, precios), combo))
+    candidatos.sort(key=lambda candidato: (-candidato[0], candidato[1].nombre))
+
+    restantes = dict(disponibles)
+    asignacion = []
+    beneficio_total = Decimal('0.00')
+    for _, combo in candidatos:
+        veces = 0
+        beneficio = Decimal('0.00')
+        consumidas = {}
+        while True:
+            unidades = consumir(combo, restantes)
+            if unidades is None:
+                break
+            for articulo_id, cantidad in unidades.items():
+                restantes[articulo_id] -= cantidad
+                consumidas[articulo_id] = consumidas.get(articulo_id, 0) + cantidad
+            beneficio += beneficio_estimado(combo, unidades, precios)
+            veces += 1
+
+        if veces:
+            beneficio_total += beneficio
+            asignacion.append({
+                "combo": combo,
+                "veces": veces,
+                "beneficio": beneficio,
+                "unidades": consumidas,
+            })
+
+    return {
+        "cumplidos": [{"combo": combo, "veces": veces} for combo, veces in cumplidos],
+        "asignacion": asignacion,
+        "beneficio_total": beneficio_total,
+    }
+
+
+# Registro de índices del proceso: lista_precio_id -> IndiceCombos
+_indices = {}
+_lock = threading.Lock()
+
+
+def generacion_combos(lista_precio_id):
+    """Generación compartida (entre procesos) del índice de combinaciones de la lista"""
+    return generaciones.actuales('combos', f'combos:{lista_precio_id}')
+
+
+def obtener_indice_combos(lista_precio, fecha=None):
+    """
+    Retorna el índice de combinaciones de la lista para la fecha (por defecto hoy).
+    Se construye bajo demanda y se reutiliza mientras su generación sea la
+    actual: una invalidación en cualquier proceso lo descarta.
+    """
+    fecha = fecha or date.today()
+    lista_precio_id = str(getattr(lista_precio, 'lista_precio_id', lista_precio))
+    # Se lee antes de construir, como en precios.indice.obtener_indice
+    generacion = generacion_combos(lista_precio_id)
+
+    indice = _indices.get(lista_precio_id)
+    if indice is not None and indice.fecha == fecha and indice.generacion == generacion:
+        return indice
+
+    indice = IndiceCombos.construir(lista_precio_id, fecha, generacion)
+    if fecha == date.today():
+        with _lock:
+            _indices[lista_precio_id] = indice
+    return indice
+
+
+def invalidar_indice_combos(lista_precio_id=None):
+    """Descarta el índice de combinaciones de una lista, o todos si no se indica lista, en todos los procesos"""
+    with _lock:
+        if lista_precio_id is None:
+            generaciones.subir('combos')
+            _indices.clear()
+        else:
+            lista_precio_id = str(lista_precio_id)
+            generaciones.subir(f'combos:{lista_precio_id}')
+            _indices.pop(lista_precio_id, None)
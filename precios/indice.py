@@ -0,0 +1,320 @@
+"""
+Índice compilado de precios y reglas por ListaPrecio.
+
+Cada índice se construye para una fecha concreta con dos consultas (precios
+activos y reglas activas vigentes) y queda en memoria del proceso. Cotizar una
+línea pasa a ser una búsqueda en diccionarios: precio base/mínimo por artículo
+y reglas agrupadas por artículo, grupo y línea, ya ordenadas por prioridad.
+
+El índice se invalida desde los signals de PrecioArticulo y ReglaPrecio
+(auditoria/signals.py) y se reconstruye solo al cambiar de día. La
+invalidación sube además la generación compartida de la lista
+(core.generaciones): los demás procesos la comparan con la del índice que
+tienen en memoria antes de reutilizarlo.
+"""
+import bisect
+import heapq
+import threading
+from datetime import date
+from typing import NamedTuple, Optional
+from decimal import Decimal
+
+from core import generaciones
+from precios.models import PrecioArticulo, ReglaPrecio
+from trading_system.choices import CanalVenta, EstadoEntidades, TipoRegla
+
+# Tipos de regla que dependen del monto total del pedido
+TIPOS_REGLA_PEDIDO = (TipoRegla.MONTO_PEDIDO, TipoRegla.ESCALA_MONTO)
+
+_CANALES = {str(canal) for canal in CanalVenta.values}
+
+
+class PrecioCompilado(NamedTuple):
+    precio_base: Decimal
+    precio_minimo: Decimal
+
+
+class ReglaCompilada(NamedTuple):
+    """Copia inmutable de los campos de ReglaPrecio que usa el cálculo"""
+    prioridad: int
+    codigo: str
+    regla_precio_id: str
+    tipo_regla: int
+    tipo_descuento: int
+    valor_descuento: Decimal
+    aplica_canal: Optional[str]
+    cantidad_minima: Optional[int]
+    monto_minimo: Optional[Decimal]
+    articulo_id: Optional[str]
+    grupo_id: Optional[str]
+    linea_id: Optional[str]
+    fecha_inicio: date
+    fecha_fin: date
+    descripcion: str
+
+    def aplica_a_canal(self, canal):
+        return not self.aplica_canal or self.aplica_canal == str(canal)
+
+    def aplica_a_cantidad(self, cantidad):
+        return self.cantidad_minima is None or self.cantidad_minima <= cantidad
+
+    def aplica_a_monto(self, monto):
+        return self.monto_minimo is None or self.monto_minimo <= monto
+
+    def aplica_a_articulo(self, articulo_id, grupo_id, linea_id):
+        """Sin alcance definido, la regla cubre todos los artículos"""
+        if not (self.articulo_id or self.grupo_id or self.linea_id):
+            return True
+        return (
+            (self.articulo_id is not None and self.articulo_id == str(articulo_id))
+            or (self.grupo_id is not None and self.grupo_id == str(grupo_id))
+            or (self.linea_id is not None and self.linea_id == str(linea_id))
+        )
+
+
+def motivos_descarte(regla):
+    """
+    Motivos por los que una regla nunca cambia un precio, sin importar la fecha
+    ni los artículos de la lista. Lista vacía si la regla puede aplicarse.
+    """
+    motivos = []
+    if regla.valor_descuento == 0:
+        motivos.append('descuento_cero')
+    if regla.aplica_canal and regla.aplica_canal not in _CANALES:
+        motivos.append('canal_invalido')
+    if regla.tipo_regla not in TIPOS_REGLA_PEDIDO and not (regla.articulo_id or regla.grupo_id or regla.linea_id):
+        # Al cotizar una línea solo se buscan reglas por artículo, grupo o línea
+        motivos.append('sin_alcance')
+    return motivos
+
+
+def compilar_regla(regla):
+    return ReglaCompilada(
+        prioridad=regla.prioridad,
+        codigo=regla.codigo,
+        regla_precio_id=str(regla.regla_precio_id),
+        tipo_regla=regla.tipo_regla,
+        tipo_descuento=regla.tipo_descuento,
+        valor_descuento=regla.valor_descuento,
+        aplica_canal=regla.aplica_canal,
+        cantidad_minima=regla.cantidad_minima,
+        monto_minimo=regla.monto_minimo,
+        articulo_id=str(regla.aplica_articulo_id) if regla.aplica_articulo_id else None,
+        grupo_id=str(regla.aplica_grupo_id) if regla.aplica_grupo_id else None,
+        linea_id=str(regla.aplica_linea_id) if regla.aplica_linea_id else None,
+        fecha_inicio=regla.fecha_inicio,
+        fecha_fin=regla.fecha_fin,
+        descripcion=regla.descripcion,
+    )
+
+
+class IndiceReglas:
+    """
+    Precios y reglas activas de una lista de precios para una fecha.
+
+    Las reglas se guardan en tres diccionarios (por artículo, grupo y línea)
+    con listas ordenadas por (prioridad, código), de modo que las reglas
+    candidatas de un artículo se obtienen con un merge de tres listas.
+    """
+
+    def __init__(self, lista_precio_id, fecha, precios, reglas, generacion=None):
+        self.lista_precio_id = str(lista_precio_id)
+        self.fecha = fecha
+        # Generación compartida de la lista con la que se construyó (ver obtener_indice)
+        self.generacion = generacion
+        self.precios = precios
+        # Las reglas que nunca cambian un precio no se evalúan ni crean tramos
+        reglas = [regla for regla in reglas if not motivos_descarte(regla)]
+        self.por_articulo = {}
+        self.por_grupo = {}
+        self.por_linea = {}
+        # Reglas por monto del pedido: se aplican sobre el pedido completo
+        # (ver ventas.utils.calculate_order_prices), no al cotizar una línea
+        self.reglas_pedido = sorted(regla for regla in reglas if regla.tipo_regla in TIPOS_REGLA_PEDIDO)
+        reglas = [regla for regla in reglas if regla.tipo_regla not in TIPOS_REGLA_PEDIDO]
+        # Cantidades mínimas de toda la lista: dentro de un mismo tramo el
+        # conjunto de reglas aplicables de cualquier artículo no cambia
+        self.tramos = sorted({1} | {
+            regla.cantidad_minima for regla in reglas
+            if regla.cantidad_minima and regla.cantidad_minima > 1
+        })
+
+        for regla in sorted(reglas):
+            if regla.articulo_id:
+                self.por_articulo.setdefault(regla.articulo_id, []).append(regla)
+            if regla.grupo_id:
+                self.por_grupo.setdefault(regla.grupo_id, []).append(regla)
+            if regla.linea_id:
+                self.por_linea.setdefault(regla.linea_id, []).append(regla)
+
+        # Escalas de cantidad (cantidad_minima > 1) por artículo, grupo y línea
+        self.escalas_articulo = self._escalas(self.por_articulo)
+        self.escalas_grupo = self._escalas(self.por_grupo)
+        self.escalas_linea = self._escalas(self.por_linea)
+        # (articulo, grupo, linea, canal, tramo) -> reglas aplicables
+        self._aplicables = {}
+
+    def __getstate__(self):
+        # La copia serializada (p. ej. para otro proceso) no lleva la memoización
+        estado = self.__dict__.copy()
+        estado['_aplicables'] = {}
+        return estado
+
+    @staticmethod
+    def _escalas(por_alcance):
+        return {
+            alcance: sorted({
+                regla.cantidad_minima for regla in reglas
+                if regla.cantidad_minima and regla.cantidad_minima > 1
+            })
+            for alcance, reglas in por_alcance.items()
+        }
+
+    @classmethod
+    def construir(cls, lista_precio_id, fecha, generacion=None):
+        precios = {
+            str(articulo_id): PrecioCompilado(precio_base, precio_minimo)
+            for articulo_id, precio_base, precio_minimo in PrecioArticulo.objects.filter(
+                lista_precio_id=lista_precio_id,
+                estado=EstadoEntidades.ACTIVO
+            ).values_list('articulo_id', 'precio_base', 'precio_minimo')
+        }
+
+        reglas = [
+            compilar_regla(regla)
+            for regla in ReglaPrecio.objects.filter(
+                lista_precio_id=lista_precio_id,
+                estado=EstadoEntidades.ACTIVO,
+                fecha_inicio__lte=fecha,
+                fecha_fin__gte=fecha
+            ).order_by()
+        ]
+
+        return cls(lista_precio_id, fecha, precios, reglas, generacion)
+
+    def precio(self, articulo_id):
+        """Retorna el PrecioCompilado del artículo o None si no tiene precio activo"""
+        return self.precios.get(str(articulo_id))
+
+    def reglas_candidatas(self, articulo_id, grupo_id, linea_id):
+        """
+        Reglas de la jerarquía del artículo (artículo, grupo o línea) en orden
+        de prioridad, sin filtrar todavía por canal ni cantidad.
+        """
+        buckets = [
+            self.por_articulo.get(str(articulo_id), []),
+            self.por_grupo.get(str(grupo_id), []) if grupo_id else [],
+            self.por_linea.get(str(linea_id), []) if linea_id else [],
+        ]
+        buckets = [bucket for bucket in buckets if bucket]
+
+        if len(buckets) == 1:
+            return list(buckets[0])
+
+        # Una regla puede estar en varios buckets si define más de un alcance
+        vistas = set()
+        reglas = []
+        for regla in heapq.merge(*buckets):
+            if regla.regla_precio_id not in vistas:
+                vistas.add(regla.regla_precio_id)
+                reglas.append(regla)
+        return reglas
+
+    def tramo_lista(self, cantidad):
+        """Inicio del tramo de cantidad de la lista que contiene a la cantidad"""
+        return self.tramos[max(bisect.bisect_right(self.tramos, cantidad) - 1, 0)]
+
+    def tramos_cantidad(self, articulo_id, grupo_id, linea_id):
+        """
+        Cantidades desde las que cambia el conjunto de reglas del artículo,
+        ordenadas y comenzando siempre en 1.
+        """
+        escalas = heapq.merge(
+            self.escalas_articulo.get(str(articulo_id), []),
+            self.escalas_grupo.get(str(grupo_id), []) if grupo_id else [],
+            self.escalas_linea.get(str(linea_id), []) if linea_id else [],
+        )
+        tramos = [1]
+        for cantidad in escalas:
+            if cantidad != tramos[-1]:
+                tramos.append(cantidad)
+        return tramos
+
+    def tramo_articulo(self, articulo_id, grupo_id, linea_id, cantidad):
+        """Inicio del tramo de cantidad del artículo que contiene a la cantidad"""
+        tramos = self.tramos_cantidad(articulo_id, grupo_id, linea_id)
+        return tramos[max(bisect.bisect_right(tramos, cantidad) - 1, 0)]
+
+    def reglas_aplicables(self, articulo_id, grupo_id, linea_id, canal, cantidad):
+        """
+        Reglas del artículo para el canal y la cantidad, en orden de prioridad.
+        El tramo se resuelve por bisección y el resultado se reutiliza para
+        todas las cantidades del mismo tramo.
+        """
+        tramo = self.tramo_lista(cantidad) if cantidad >= 1 else cantidad
+        clave = (str(articulo_id), str(grupo_id), str(linea_id), str(canal), tramo)
+        reglas = self._aplicables.get(clave)
+        if reglas is None:
+            reglas = self._aplicables[clave] = tuple(
+                regla for regla in self.reglas_candidatas(articulo_id, grupo_id, linea_id)
+                if regla.aplica_a_canal(canal) and regla.aplica_a_cantidad(tramo)
+            )
+        return list(reglas)
+
+
+# Registro de índices del proceso: lista_precio_id -> IndiceReglas
+_indices = {}
+_lock = threading.Lock()
+
+
+def generacion_indice(lista_precio_id):
+    """Generación compartida (entre procesos) del índice de la lista"""
+    return generaciones.actuales('indices', f'indice:{lista_precio_id}')
+
+
+def obtener_indice(lista_precio, fecha=None):
+    """
+    Retorna el índice compilado de la lista para la fecha (por defecto hoy).
+    Se construye bajo demanda y se reutiliza mientras su generación sea la
+    actual: una invalidación en cualquier proceso lo descarta.
+    """
+    fecha = fecha or date.today()
+    lista_precio_id = str(getattr(lista_precio, 'lista_precio_id', lista_precio))
+    # Se lee antes de construir: un índice construido durante una invalidación
+    # queda con la generación anterior y se descarta en la próxima llamada
+    generacion = generacion_indice(lista_precio_id)
+
+    indice = _indices.get(lista_precio_id)
+    if indice is not None and indice.fecha == fecha and indice.generacion == generacion:
+        return indice
+
+    indice = IndiceReglas.construir(lista_precio_id, fecha, generacion)
+    if fecha == date.today():
+        with _lock:
+            _indices[lista_precio_id] = indice
+    return indice
+
+
+def indice_cargado(lista_precio, fecha=None):
+    """
+    Retorna el índice de la lista si ya está construido para la fecha (por
+    defecto hoy) y vigente, o None. No consulta la base de datos.
+    """
+    lista_precio_id = str(getattr(lista_precio, 'lista_precio_id', lista_precio))
+    indice = _indices.get(lista_precio_id)
+    if (indice is not None and indice.fecha == (fecha or date.today())
+            and indice.generacion == generacion_indice(lista_precio_id)):
+        return indice
+    return None
+
+
+def invalidar_indice(lista_precio_id=None):
+    """Descarta el índice de una lista, o todos si no se indica lista, en todos los procesos"""
+    with _lock:
+        if lista_precio_id is None:
+            generaciones.subir('indices')
+            _indices.clear()
+        else:
+            lista_precio_id = str(lista_precio_id)
+            generaciones.subir(f'indice:{lista_precio_id}')
+            _indices.pop(lista_precio_id, None)
@@ -0,0 +1,39 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from precios.analisis import analizar_reglas
+from precios.models import ListaPrecio
+from trading_system.choices import EstadoEntidades
+
+
+class Command(BaseCommand):
+    help = 'Reporta solapamientos, reglas muertas, sombreadas y redundantes de las listas de precios (salida JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lista', dest='lista_precio_id', help='ID de la lista a analizar (por defecto todas las activas)')
+        parser.add_argument('--fecha', help='Fecha de análisis YYYY-MM-DD (por defecto hoy)')
+        parser.add_argument('--limite', type=int, default=500, help='Máximo de pares de solapamiento a detallar por lista')
+
+    def handle(self, *args, **options):
+        fecha = None
+        if options['fecha']:
+            try:
+                fecha = datetime.strptime(options['fecha'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Formato de fecha inválido, usa YYYY-MM-DD')
+
+        lista_precio_id = options.get('lista_precio_id')
+        if lista_precio_id:
+            lista_ids = [lista_precio_id]
+        else:
+            lista_ids = ListaPrecio.objects.filter(
+                estado=EstadoEntidades.ACTIVO
+            ).values_list('lista_precio_id', flat=True)
+
+        resultado = {
+            str(lista_id): analizar_reglas(lista_id, fecha, limite=options['limite'])
+            for lista_id in lista_ids
+        }
+        self.stdout.write(json.dumps(resultado, indent=2, default=str))
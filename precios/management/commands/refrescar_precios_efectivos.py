@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from precios.models import ListaPrecio
+from precios.refresco import refrescar_precios_efectivos
+from trading_system.choices import EstadoEntidades
+
+
+class Command(BaseCommand):
+    help = 'Regenera la tabla de precios efectivos (ejecutar a diario por la vigencia de las reglas)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lista', dest='lista_precio_id', help='ID de la lista a refrescar (por defecto todas las activas)')
+
+    def handle(self, *args, **options):
+        lista_precio_id = options.get('lista_precio_id')
+        if lista_precio_id:
+            lista_ids = [lista_precio_id]
+        else:
+            lista_ids = ListaPrecio.objects.filter(
+                estado=EstadoEntidades.ACTIVO
+            ).values_list('lista_precio_id', flat=True)
+
+        for lista_id in lista_ids:
+            filas = refrescar_precios_efectivos(lista_id)
+            self.stdout.write(f'Lista {lista_id}: {filas} precios efectivos')
@@ -0,0 +1,31 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from precios.models import ListaPrecio
+from precios.paralelo import recalcular_lista
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula todos los precios efectivos de una lista (todos los canales y tramos) '
+        'repartiendo los artículos por línea entre varios procesos (salida JSON)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lista', dest='lista_precio_id', required=True, help='ID de la lista a recalcular')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Procesos de cálculo (por defecto, uno por núcleo)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Filas por sentencia de upsert')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers debe ser al menos 1')
+        if not ListaPrecio.objects.filter(lista_precio_id=options['lista_precio_id']).exists():
+            raise CommandError('Lista de precios no encontrada')
+
+        resultado = recalcular_lista(
+            options['lista_precio_id'], workers=options['workers'], batch_size=options['batch_size']
+        )
+        self.stdout.write(json.dumps(resultado, indent=2))
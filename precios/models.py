@@ -26,6 +26,9 @@ class ListaPrecio(models.Model):
     class Meta:
         db_table = 'listas_precios'
         ordering = ['codigo']
+        indexes = [
+            models.Index(fields=['empresa', 'estado', 'fecha_vigencia_inicio', 'fecha_vigencia_fin'], name='listas_vigencia_idx'),
+        ]
 
 class PrecioArticulo(models.Model):
     precio_articulo_id = models.UUIDField(primary_key=True)
@@ -74,6 +77,9 @@ class ReglaPrecio(models.Model):
     class Meta:
         db_table = 'reglas_precios'
         ordering = ['descripcion']
+        indexes = [
+            models.Index(fields=['lista_precio', 'estado', 'fecha_inicio', 'fecha_fin'], name='reglas_vigencia_idx'),
+        ]
 
 class CombinacionProducto(models.Model):
     combinacion_id = models.UUIDField(primary_key=True)
@@ -94,6 +100,9 @@ class CombinacionProducto(models.Model):
         db_table = 'combinaciones_productos'
         unique_together = ('lista_precio', 'nombre')
         ordering = ['nombre']
+        indexes = [
+            models.Index(fields=['lista_precio', 'estado', 'fecha_inicio', 'fecha_fin'], name='combos_vigencia_idx'),
+        ]
 
 class DetalleCombinacionProducto(models.Model):
     detalle_combinacion_id = models.UUIDField(primary_key=True)
@@ -112,4 +121,31 @@ class DetalleCombinacionProducto(models.Model):
     class Meta:
         db_table = 'detalles_combinaciones_productos'
         unique_together = ('combinacion_producto', 'articulo', 'grupo', 'linea')
-        ordering = ['combinacion_producto__nombre']
\ No newline at end of file
+        ordering = ['combinacion_producto__nombre']
+
+
+class PrecioEfectivo(models.Model):
+    """
+    Precio final precalculado por (lista, artículo, canal, tramo de cantidad).
+    Lo mantiene precios.refresco a partir de PrecioArticulo y ReglaPrecio.
+    """
+    precio_efectivo_id = models.BigAutoField(primary_key=True)
+    lista_precio = models.ForeignKey(ListaPrecio, on_delete=models.CASCADE, null=False, related_name='precios_efectivos_lista')
+    articulo = models.ForeignKey('productos.Articulo', on_delete=models.CASCADE, null=False, related_name='precios_efectivos_articulo')
+    canal = models.IntegerField(choices=CanalVenta, null=False)
+    cantidad_desde = models.IntegerField(null=False, default=1)
+    precio_base = models.DecimalField(max_digits=10, decimal_places=2, null=False)
+    precio_final = models.DecimalField(max_digits=10, decimal_places=2, null=False)
+    descuento_total = models.DecimalField(max_digits=10, decimal_places=2, null=False, default=0)
+    reglas_aplicadas = models.JSONField(default=list, blank=True)
+    vendido_bajo_costo = models.BooleanField(default=False)
+    fecha_calculo = models.DateField(null=False)
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.articulo_id} - {self.get_canal_display()} - desde {self.cantidad_desde}: {self.precio_final}"
+
+    class Meta:
+        db_table = 'precios_efectivos'
+        unique_together = ('lista_precio', 'articulo', 'canal', 'cantidad_desde')
+        ordering = ['lista_precio', 'articulo', 'canal', 'cantidad_desde']
@@ -0,0 +1,145 @@
+"""
+Recálculo completo de los precios efectivos de una lista en varios procesos.
+
+Cotizar todos los artículos de una lista en todos los canales y tramos es
+trabajo de CPU en Python puro, así que con un solo proceso no escala con los
+núcleos. El recálculo paralelo:
+
+1. Construye el índice de la lista en el proceso principal y lo serializa una
+   sola vez; cada proceso del pool lo recibe al iniciar.
+2. Reparte los artículos en particiones por LineaArticulo (las reglas de una
+   línea quedan en un mismo proceso; si hay pocas líneas, las grandes se
+   dividen en bloques) y las envía de mayor a menor tamaño.
+3. Cada proceso devuelve tuplas (precios.refresco.calcular_valores), no
+   instancias del ORM, y el proceso principal las escribe con upserts por lotes
+   a medida que llegan, mientras los demás siguen calculando.
+4. Al final borra las filas de la lista que no se reescribieron (artículos sin
+   precio o tramos que ya no existen). La escritura ocurre en una sola
+   transacción.
+"""
+import pickle
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+from django.db import connection, connections, transaction
+from django.db.transaction import TransactionManagementError
+from django.utils import timezone
+
+from precios.indice import IndiceReglas, invalidar_indice
+from precios.models import PrecioEfectivo
+from precios.refresco import CAMPOS_VALORES, articulos_de_lista, calcular_valores, filas_precio_efectivo
+
+# Campos que el upsert actualiza cuando la fila ya existe
+CAMPOS_ACTUALIZABLES = [
+    campo for campo in CAMPOS_VALORES if campo not in ('articulo_id', 'canal', 'cantidad_desde')
+] + ['fecha_calculo', 'fecha_modificacion']
+
+# Índice de la lista en cada proceso del pool
+_indice = None
+
+
+def _iniciar_proceso(indice_serializado):
+    global _indice
+    import django
+    django.setup()
+    _indice = pickle.loads(indice_serializado)
+
+
+def _calcular_particion(articulos):
+    return calcular_valores(_indice, articulos)
+
+
+def particionar_por_linea(articulos, minimo_particiones=1):
+    """
+    Agrupa las tuplas de artículos por linea_id, de la partición más grande a la
+    más chica. Si hay menos líneas que minimo_particiones, las líneas grandes se
+    dividen en bloques para que todos los procesos tengan trabajo.
+    """
+    por_linea = defaultdict(list)
+    for articulo in articulos:
+        por_linea[articulo[2]].append(articulo)
+
+    tamanio = max(-(-len(articulos) // minimo_particiones), 1) if len(por_linea) < minimo_particiones else None
+    particiones = []
+    for grupo in por_linea.values():
+        if tamanio is None:
+            particiones.append(grupo)
+        else:
+            particiones.extend(grupo[inicio:inicio + tamanio] for inicio in range(0, len(grupo), tamanio))
+    return sorted(particiones, key=len, reverse=True)
+
+
+def _guardar(indice, valores, batch_size):
+    PrecioEfectivo.objects.bulk_create(
+        filas_precio_efectivo(indice, valores),
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['lista_precio', 'articulo', 'canal', 'cantidad_desde'],
+        update_fields=CAMPOS_ACTUALIZABLES,
+    )
+    return len(valores)
+
+
+def _borrar_no_recalculadas(lista_precio_id, inicio_recalculo):
+    borradas, _ = PrecioEfectivo.objects.filter(
+        lista_precio_id=lista_precio_id,
+        fecha_modificacion__lt=inicio_recalculo,
+    ).delete()
+    return borradas
+
+
+def recalcular_lista(lista_precio_id, workers=1, fecha=None, batch_size=1000):
+    """
+    Recalcula todas las filas de PrecioEfectivo de una lista.
+
+    Args:
+        lista_precio_id: ID de la lista.
+        workers (int): Procesos de cálculo; con 1 se calcula en este proceso.
+            Con más de uno no puede llamarse dentro de una transacción.
+        fecha (date): Fecha de vigencia de las reglas (por defecto hoy).
+        batch_size (int): Filas por sentencia de upsert.
+
+    Returns:
+        dict: filas escritas, filas borradas, particiones y segundos por etapa.
+    """
+    fecha = fecha or date.today()
+    inicio = time.perf_counter()
+    invalidar_indice(lista_precio_id)
+    indice = IndiceReglas.construir(lista_precio_id, fecha)
+    # Varias particiones por proceso equilibran la carga cuando las líneas son desiguales
+    particiones = particionar_por_linea(articulos_de_lista(lista_precio_id), minimo_particiones=workers * 4)
+    segundos_carga = time.perf_counter() - inicio
+
+    escritas = 0
+    inicio_recalculo = timezone.now()
+    if workers <= 1:
+        with transaction.atomic():
+            for particion in particiones:
+                escritas += _guardar(indice, calcular_valores(indice, particion), batch_size)
+            borradas = _borrar_no_recalculadas(lista_precio_id, inicio_recalculo)
+    else:
+        if connection.in_atomic_block:
+            raise TransactionManagementError('El recálculo en varios procesos no puede ejecutarse dentro de una transacción')
+        # Los procesos se crean con el primer submit: no deben heredar conexiones abiertas
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_iniciar_proceso, initargs=(pickle.dumps(indice),)
+        ) as pool:
+            futuros = [pool.submit(_calcular_particion, particion) for particion in particiones]
+            with transaction.atomic():
+                for futuro in as_completed(futuros):
+                    escritas += _guardar(indice, futuro.result(), batch_size)
+                borradas = _borrar_no_recalculadas(lista_precio_id, inicio_recalculo)
+
+    return {
+        'lista_precio_id': str(lista_precio_id),
+        'workers': workers,
+        'particiones': len(particiones),
+        'articulos': sum(len(particion) for particion in particiones),
+        'filas': escritas,
+        'borradas': borradas,
+        'segundos_carga': round(segundos_carga, 3),
+        'segundos': round(time.perf_counter() - inicio, 3),
+    }
@@ -0,0 +1,205 @@
+"""
+Mantenimiento de la tabla materializada PrecioEfectivo.
+
+Cada fila guarda el resultado de calculate_price para un artículo de una lista,
+un canal y un tramo de cantidad (desde cantidad_desde hasta el siguiente tramo).
+Los signals de auditoria/signals.py programan el refresco de la porción afectada
+al confirmar la transacción:
+
+- PrecioArticulo: el artículo en su lista.
+- ReglaPrecio: los artículos de su alcance (artículo, grupo o línea) en su lista.
+- Articulo (costo_actual o grupo): el artículo en todas las listas donde tiene precio.
+
+Como las reglas tienen vigencia por fecha, las filas guardan fecha_calculo y
+deben regenerarse cada día con el comando refrescar_precios_efectivos.
+
+El refresco corre en el hilo de la solicitud, así que se limita a
+PRECIOS_EFECTIVOS_REFRESCO_MAXIMO artículos por lista. Una porción más grande
+(p. ej. una regla de una línea entera) solo borra sus filas, en una sentencia:
+mientras tanto las lecturas calculan el precio en línea, y el comando
+refrescar_precios_efectivos las vuelve a generar.
+"""
+import threading
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from precios.indice import invalidar_indice, obtener_indice
+from precios.models import PrecioArticulo, PrecioEfectivo
+from productos.models import Articulo
+from trading_system.choices import CanalVenta, EstadoEntidades
+from ventas.utils import aplicar_reglas
+
+
+# Campos de PrecioEfectivo en el orden de las tuplas de calcular_valores
+CAMPOS_VALORES = (
+    'articulo_id', 'canal', 'cantidad_desde', 'precio_base', 'precio_final',
+    'descuento_total', 'reglas_aplicadas', 'vendido_bajo_costo',
+)
+
+
+def calcular_valores(indice, articulos, canales=None):
+    """
+    Calcula los precios efectivos de los artículos dados como tuplas con los
+    campos de CAMPOS_VALORES. No usa el ORM, de modo que puede ejecutarse en
+    otro proceso con una copia del índice (ver precios.paralelo).
+
+    Args:
+        indice (IndiceReglas): Índice compilado de la lista.
+        articulos (list[tuple]): (articulo_id, grupo_id, linea_id, costo_actual).
+        canales (list[int]): Canales a calcular (por defecto todos).
+
+    Returns:
+        list[tuple]
+    """
+    canales = list(canales or CanalVenta.values)
+    valores = []
+
+    for articulo_id, grupo_id, linea_id, costo_actual in articulos:
+        precio_info = indice.precio(articulo_id)
+        if precio_info is None:
+            continue
+
+        for cantidad_desde in indice.tramos_cantidad(articulo_id, grupo_id, linea_id):
+            for canal in canales:
+                reglas = indice.reglas_aplicables(articulo_id, grupo_id, linea_id, canal, cantidad_desde)
+                resultado = aplicar_reglas(precio_info.precio_base, precio_info.precio_minimo, costo_actual, reglas)
+                valores.append((
+                    articulo_id,
+                    canal,
+                    cantidad_desde,
+                    resultado["precio_base"],
+                    resultado["precio_final"],
+                    resultado["descuento_total"],
+                    resultado["reglas_aplicadas"],
+                    resultado["vendido_bajo_costo"],
+                ))
+
+    return valores
+
+
+def filas_precio_efectivo(indice, valores):
+    """Convierte las tuplas de calcular_valores en filas de PrecioEfectivo (sin guardar)"""
+    return [
+        PrecioEfectivo(lista_precio_id=indice.lista_precio_id, fecha_calculo=indice.fecha,
+                       **dict(zip(CAMPOS_VALORES, fila)))
+        for fila in valores
+    ]
+
+
+def calcular_precios_efectivos(indice, articulos, canales=None):
+    """
+    Calcula las filas de PrecioEfectivo (sin guardar) para los artículos dados.
+
+    Args:
+        indice (IndiceReglas): Índice compilado de la lista.
+        articulos (list[tuple]): (articulo_id, grupo_id, linea_id, costo_actual).
+        canales (list[int]): Canales a calcular (por defecto todos).
+
+    Returns:
+        list[PrecioEfectivo]
+    """
+    return filas_precio_efectivo(indice, calcular_valores(indice, articulos, canales))
+
+
+def articulos_de_lista(lista_precio_id, articulo_ids=None):
+    """
+    Artículos con precio activo en la lista, como tuplas
+    (articulo_id, grupo_id, linea_id, costo_actual).
+    """
+    articulos_qs = Articulo.objects.filter(
+        precios_articulos_articulo__lista_precio_id=lista_precio_id,
+        precios_articulos_articulo__estado=EstadoEntidades.ACTIVO
+    )
+    if articulo_ids is not None:
+        articulos_qs = articulos_qs.filter(articulo_id__in=articulo_ids)
+    return [
+        (str(articulo_id), str(grupo_id), str(linea_id), costo_actual)
+        for articulo_id, grupo_id, linea_id, costo_actual in articulos_qs.values_list(
+            'articulo_id', 'grupo_id', 'grupo_id__linea_id', 'costo_actual'
+        )
+    ]
+
+
+def refrescar_precios_efectivos(lista_precio_id, articulo_ids=None, fecha=None):
+    """
+    Recalcula las filas de una lista, completa o solo para los artículos indicados.
+
+    Returns:
+        int: Cantidad de filas escritas.
+    """
+    fecha = fecha or date.today()
+    invalidar_indice(lista_precio_id)
+    indice = obtener_indice(lista_precio_id, fecha)
+
+    filas_qs = PrecioEfectivo.objects.filter(lista_precio_id=lista_precio_id)
+    if articulo_ids is not None:
+        articulo_ids = [str(articulo_id) for articulo_id in articulo_ids]
+        filas_qs = filas_qs.filter(articulo_id__in=articulo_ids)
+
+    filas = calcular_precios_efectivos(indice, articulos_de_lista(lista_precio_id, articulo_ids))
+
+    with transaction.atomic():
+        filas_qs.delete()
+        PrecioEfectivo.objects.bulk_create(filas, batch_size=1000)
+
+    return len(filas)
+
+
+def articulos_en_alcance(articulo_id=None, grupo_id=None, linea_id=None):
+    """IDs de los artículos cubiertos por un alcance de regla"""
+    condicion = Q()
+    if articulo_id:
+        condicion |= Q(articulo_id=articulo_id)
+    if grupo_id:
+        condicion |= Q(grupo_id=grupo_id)
+    if linea_id:
+        condicion |= Q(grupo_id__linea_id=linea_id)
+    if not condicion:
+        return []
+    return list(Articulo.objects.filter(condicion).values_list('articulo_id', flat=True))
+
+
+def listas_con_articulo(articulo_id):
+    """IDs de las listas donde el artículo tiene precio"""
+    return list(
+        PrecioArticulo.objects.filter(articulo_id=articulo_id)
+        .values_list('lista_precio_id', flat=True).distinct()
+    )
+
+
+# Porciones pendientes de refrescar en el hilo actual:
+# lista_precio_id -> set de articulo_ids
+_pendientes = threading.local()
+
+
+def programar_refresco(lista_precio_id, articulo_ids):
+    """
+    Acumula la porción afectada y la refresca al confirmar la transacción.
+    El primer callback que se ejecuta procesa todas las porciones acumuladas,
+    así varios signals sobre la misma lista generan un solo refresco.
+    """
+    articulo_ids = {str(articulo_id) for articulo_id in articulo_ids}
+    if not lista_precio_id or not articulo_ids:
+        return
+
+    pendientes = getattr(_pendientes, 'porciones', None)
+    if pendientes is None:
+        pendientes = _pendientes.porciones = {}
+    pendientes.setdefault(str(lista_precio_id), set()).update(articulo_ids)
+
+    transaction.on_commit(_ejecutar_refrescos)
+
+
+def _ejecutar_refrescos():
+    pendientes = getattr(_pendientes, 'porciones', None) or {}
+    _pendientes.porciones = None
+    maximo = getattr(settings, 'PRECIOS_EFECTIVOS_REFRESCO_MAXIMO', 200)
+    for lista_precio_id, articulo_ids in pendientes.items():
+        if maximo is not None and len(articulo_ids) > maximo:
+            # Demasiado para la solicitud: sin filas, se calcula en línea hasta el próximo refresco
+            PrecioEfectivo.objects.filter(lista_precio_id=lista_precio_id, articulo_id__in=articulo_ids).delete()
+        else:
+            refrescar_precios_efectivos(lista_precio_id, articulo_ids)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from precios.models import CombinacionProducto, DetalleCombinacionProducto
+from trading_system.choices import CanalVenta
 
 class DetalleCombinacionSerializer(serializers.ModelSerializer):
 
@@ -196,4 +197,15 @@ class CombinacionProductoCrearActualizarSerializer(serializers.ModelSerializer):
                     **detalle_data
                 )
 
-        return instance
\ No newline at end of file
+        return instance
+
+
+class ItemCarritoSerializer(serializers.Serializer):
+    articulo_id = serializers.UUIDField()
+    cantidad = serializers.IntegerField(min_value=1)
+
+
+class EvaluarCarritoSerializer(serializers.Serializer):
+    lista_precio_id = serializers.UUIDField()
+    canal = serializers.ChoiceField(choices=CanalVenta.choices, required=False)
+    items = ItemCarritoSerializer(many=True, allow_empty=False)
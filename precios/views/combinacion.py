@@ -4,8 +4,10 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
 
-from productos.models import Articulo
-from precios.models import CombinacionProducto
+from precios.models import CombinacionProducto, ListaPrecio
+from core.intervalos import filtrar_vigentes
+from precios.combos import obtener_indice_combos, evaluar_carrito
+from ventas.utils import cargar_articulos, calculate_prices
 from precios.serializers.combinacion import *
 
 
@@ -66,11 +68,7 @@ class CombinacionProductoViewSet(viewsets.ModelViewSet):
             fecha = timezone.now().date()
 
         #filtrar
-        queryset = self.get_queryset().filter(
-            estado=1,
-            fecha_inicio__lte=fecha,
-            fecha_fin__gte=fecha
-        )
+        queryset = filtrar_vigentes(self.get_queryset(), 'combinaciones', fecha, alcance=lista_id or None)
 
         if lista_id:
             queryset = queryset.filter(lista_precio_id=lista_id)
@@ -114,6 +112,11 @@ class CombinacionProductoViewSet(viewsets.ModelViewSet):
         cumple = True
         detalles_validacion = []
 
+        #articulos del pedido en una sola consulta
+        articulos = cargar_articulos(
+            item.get('articulo_id') for item in items_pedido if item.get('articulo_id')
+        )
+
         for detalle in detalles_combo:
             #cuantos items del pedido cumplen
             cantidad_cumplida = 0
@@ -121,27 +124,20 @@ class CombinacionProductoViewSet(viewsets.ModelViewSet):
             for item in items_pedido:
                 articulo_id = item.get('articulo_id')
                 cantidad = item.get('cantidad', 0)
+                articulo = articulos.get(str(articulo_id))
 
                 #sgun tipo de item
                 if detalle.tipo_item == 1:  #artículo específico
-                    if str(detalle.articulo.articulo_id) == str(articulo_id):
+                    if str(detalle.articulo_id) == str(articulo_id):
                         cantidad_cumplida += cantidad
 
                 elif detalle.tipo_item == 2:  #grupo
-                    try:
-                        articulo = Articulo.objects.get(pk=articulo_id)
-                        if articulo.grupo == detalle.grupo:
-                            cantidad_cumplida += cantidad
-                    except Articulo.DoesNotExist:
-                        pass
+                    if articulo and articulo.grupo_id_id == detalle.grupo_id:
+                        cantidad_cumplida += cantidad
 
                 elif detalle.tipo_item == 3:  #linea
-                    try:
-                        articulo = Articulo.objects.get(pk=articulo_id)
-                        if articulo.grupo.linea == detalle.linea:
-                            cantidad_cumplida += cantidad
-                    except Articulo.DoesNotExist:
-                        pass
+                    if articulo and articulo.grupo_id.linea_id == detalle.linea_id:
+                        cantidad_cumplida += cantidad
 
             #cumple
             cumple_detalle = cantidad_cumplida >= detalle.cantidad_requerida
@@ -164,4 +160,98 @@ class CombinacionProductoViewSet(viewsets.ModelViewSet):
             'tipo_beneficio': combo.get_tipo_beneficio_display(),
             'valor_beneficio': combo.valor_beneficio,
             'detalles': detalles_validacion
-        })
\ No newline at end of file
+        })
+    #evaluar carrito contra todos los combos de la lista
+    @action(detail=False, methods=['post'], url_path='evaluar-carrito')
+    def evaluar_carrito(self, request):
+        """
+        POST /api/combinaciones/evaluar-carrito/
+
+        Body:
+        {
+            "lista_precio_id": "uuid-lista",
+            "canal": 2,  (opcional, por defecto el de la lista)
+            "items": [
+                {"articulo_id": "uuid-1", "cantidad": 2},
+                {"articulo_id": "uuid-2", "cantidad": 1}
+            ]
+        }
+
+        Retorna todos los combos vigentes que cumple el carrito y la mejor
+        asignación sin compartir unidades entre combos
+        """
+        serializer = EvaluarCarritoSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {'error': 'Debe enviar lista_precio_id e items válidos para evaluar', 'detalles': serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        datos = serializer.validated_data
+
+        lista = ListaPrecio.objects.filter(lista_precio_id=datos['lista_precio_id']).first()
+        if lista is None:
+            return Response({'error': 'Lista de precios no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        canal = datos.get('canal', lista.canal)
+
+        lineas = [
+            {'articulo_id': str(item['articulo_id']), 'cantidad': item['cantidad']}
+            for item in datos['items']
+        ]
+
+        #articulos del carrito en una sola consulta
+        articulos = cargar_articulos(linea['articulo_id'] for linea in lineas)
+        faltantes = [linea['articulo_id'] for linea in lineas if linea['articulo_id'] not in articulos]
+        if faltantes:
+            return Response(
+                {'error': f'Artículos no encontrados: {", ".join(faltantes)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        #precio unitario de cada articulo para estimar beneficios porcentuales
+        precios = {
+            linea['articulo_id']: resultado['precio_final']
+            for linea, resultado in zip(lineas, calculate_prices(lineas, lista, canal))
+            if 'error' not in resultado
+        }
+
+        resultado = evaluar_carrito(
+            obtener_indice_combos(lista),
+            [
+                (
+                    linea['articulo_id'],
+                    articulos[linea['articulo_id']].grupo_id_id,
+                    articulos[linea['articulo_id']].grupo_id.linea_id,
+                    linea['cantidad']
+                )
+                for linea in lineas
+            ],
+            precios
+        )
+
+        return Response({
+            'lista_precio_id': str(lista.lista_precio_id),
+            'combos_cumplidos': [
+                {
+                    'combo_id': cumplido['combo'].combinacion_id,
+                    'combo_nombre': cumplido['combo'].nombre,
+                    'veces': cumplido['veces'],
+                }
+                for cumplido in resultado['cumplidos']
+            ],
+            'asignacion': [
+                {
+                    'combo_id': aplicado['combo'].combinacion_id,
+                    'combo_nombre': aplicado['combo'].nombre,
+                    'tipo_beneficio': aplicado['combo'].tipo_beneficio,
+                    'valor_beneficio': aplicado['combo'].valor_beneficio,
+                    'veces': aplicado['veces'],
+                    'beneficio_estimado': aplicado['beneficio'],
+                    'items': [
+                        {'articulo_id': articulo_id, 'cantidad': cantidad}
+                        for articulo_id, cantidad in aplicado['unidades'].items()
+                    ],
+                }
+                for aplicado in resultado['asignacion']
+            ],
+            'beneficio_total': resultado['beneficio_total'],
+        })
@@ -4,10 +4,15 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter, SearchFilter
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from datetime import datetime
 
 from precios.models import ListaPrecio
+from core.intervalos import filtrar_vigentes
+from productos.models import Articulo
+from trading_system.choices import CanalVenta
+from ventas.utils import escalas_precio
 from precios.serializers.lista_precio import *
 from precios.filters import ListaPrecioFilter
 
@@ -77,11 +82,8 @@ class ListaPrecioViewSet(viewsets.ModelViewSet):
             fecha = timezone.now().date()
 
         #listas vigentes
-        queryset = self.get_queryset().filter(
-            empresa_id=empresa_id,
-            estado=1,
-            fecha_vigencia_inicio__lte=fecha,
-            fecha_vigencia_fin__gte=fecha
+        queryset = filtrar_vigentes(self.get_queryset(), 'listas_precio', fecha, alcance=empresa_id).filter(
+            empresa_id=empresa_id
         )
 
         #opcionales
@@ -98,6 +100,58 @@ class ListaPrecioViewSet(viewsets.ModelViewSet):
             'listas': serializer.data
         })
 
+    @action(detail=True, methods=['get'], url_path='escalas')
+    def escalas(self, request, pk=None):
+        """
+            GET /api/listas/{id}/escalas/?articulo={articulo_id}&canal={canal}
+            Retorna la escala completa de precios por cantidad de un artículo
+
+            - articulo id
+            - canal de venta (opcional, por defecto el de la lista)
+        """
+        lista = self.get_object()
+        articulo_id = request.query_params.get('articulo')
+        canal = request.query_params.get('canal', lista.canal)
+
+        if not articulo_id:
+            return Response({'error': 'articulo id required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            canal = int(canal)
+        except (TypeError, ValueError):
+            canal = None
+        if canal not in CanalVenta.values:
+            return Response({'error': 'Canal de venta invalido'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            articulo = Articulo.objects.select_related('grupo_id__linea').filter(articulo_id=articulo_id).first()
+        except ValidationError:
+            articulo = None
+        if articulo is None:
+            return Response({'error': 'Artículo no encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+
+        escalas = escalas_precio(articulo, lista, canal)
+        if "error" in escalas[0]:
+            return Response({'error': escalas[0]['error']}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'articulo_id': str(articulo.articulo_id),
+            'descripcion_articulo': articulo.descripcion,
+            'canal': canal,
+            'escalas': [
+                {
+                    'cantidad_desde': escala['cantidad_desde'],
+                    'cantidad_hasta': escala['cantidad_hasta'],
+                    'precio_base': escala['precio_base'],
+                    'precio_final': escala['precio_final'],
+                    'descuento_total': escala['descuento_total'],
+                    'reglas_aplicadas': escala['reglas_aplicadas'],
+                    'vendido_bajo_costo': escala['vendido_bajo_costo'],
+                }
+                for escala in escalas
+            ]
+        })
+
     def destroy(self, request, *args, **kwargs):
         """
             DELETE /api/listas/{id}/
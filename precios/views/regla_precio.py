@@ -2,9 +2,12 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 
-from precios.models import ReglaPrecio
+from precios.analisis import analizar_reglas
+from precios.models import ReglaPrecio, ListaPrecio
+from core.intervalos import filtrar_vigentes
 from precios.serializers.regla_precio import ReglaPrecioSerializer
 from auditoria.signals import set_current_user
 
@@ -86,11 +89,8 @@ class ReglaPrecioViewSet(viewsets.ModelViewSet):
             fecha = timezone.now().date()
 
         #reglas activas
-        queryset = self.get_queryset().filter(
-            lista_precio_id=lista_id,
-            estado=1,
-            fecha_inicio__lte=fecha,
-            fecha_fin__gte=fecha
+        queryset = filtrar_vigentes(self.get_queryset(), 'reglas_precio', fecha, alcance=lista_id).filter(
+            lista_precio_id=lista_id
         ).order_by('prioridad')
 
         serializer = self.get_serializer(queryset, many=True)
@@ -101,6 +101,56 @@ class ReglaPrecioViewSet(viewsets.ModelViewSet):
             'reglas': serializer.data
         })
 
+    @action(detail=False, methods=['get'], url_path='analisis')
+    def analisis(self, request):
+        """
+        GET /api/reglas/analisis/
+
+        - lista_precio: ID de lista (requerido)
+        - fecha: Fecha de análisis (default: hoy) formato YYYY-MM-DD
+        - limite: Máximo de pares de solapamiento a detallar (default: 500)
+
+        Retorna solapamientos, reglas muertas, sombreadas y redundantes de la lista
+        """
+        lista_id = request.query_params.get('lista_precio')
+        fecha_str = request.query_params.get('fecha')
+
+        if not lista_id:
+            return Response(
+                {'error': 'El parámetro lista_precio es requerido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            lista = ListaPrecio.objects.filter(lista_precio_id=lista_id).first()
+        except ValidationError:
+            lista = None
+        if lista is None:
+            return Response({'error': 'Lista de precios no encontrada.'}, status=status.HTTP_404_NOT_FOUND)
+
+        if fecha_str:
+            try:
+                from datetime import datetime
+                fecha = datetime.strptime(fecha_str, '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {'error': 'Formato de fecha inválido. Use YYYY-MM-DD'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            fecha = timezone.now().date()
+
+        try:
+            limite = int(request.query_params.get('limite', 500))
+        except ValueError:
+            return Response({'error': 'limite debe ser un número entero'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'lista_precio_id': str(lista.lista_precio_id),
+            'fecha_consulta': fecha,
+            **analizar_reglas(lista.lista_precio_id, fecha, limite=max(limite, 0)),
+        })
+
     #activar regla
     @action(detail=True, methods=['post'], url_path='activar')
     def activar(self, request, pk=None):
@@ -0,0 +1,106 @@
+"""
+Stock fraccionado para artículos con mucha demanda concurrente.
+
+Un artículo fraccionado (stock_slots > 0) guarda su stock en N filas de
+SlotStock en lugar de la columna Articulo.stock. Cada reserva toma un slot al
+azar, con unidades suficientes y que no esté bloqueado por otra transacción
+(SELECT ... FOR UPDATE SKIP LOCKED), de modo que hasta N confirmaciones pueden
+descontar stock del mismo artículo a la vez sin esperarse. El stock total es
+Articulo.stock más la suma de los slots (Articulo.stock_disponible).
+
+Con el uso los slots se desequilibran; compactar_stock (comando compactar_stock,
+para ejecutar periódicamente) vuelve a repartir el total en partes iguales.
+
+La reserva y liberación están en ventas.stock. Las funciones de este módulo
+bloquean la fila del artículo y todos sus slots, y abren su propia transacción.
+
+No está activo por defecto (stock_slots = 0) y solo conviene activarlo
+después de medir con el comando bench_stock en el servidor de producción. En
+la única medición disponible, con una sola CPU, confirmar quedó limitado por
+la CPU (sobre todo la serialización de la respuesta) y no por la espera de
+bloqueos: los slots dieron entre 0,79 y 0,92 veces las confirmaciones por
+segundo del stock en la fila. La ganancia esperada, con varios núcleos y
+muchas confirmaciones concurrentes del mismo artículo, no está medida.
+"""
+from django.db import transaction
+from django.db.models import Max, Min
+
+from productos.models import Articulo, SlotStock
+
+
+def _repartir(total, slots):
+    """Cantidades de cada slot para repartir el total en partes iguales"""
+    base, resto = divmod(total, slots)
+    return [base + (1 if slot < resto else 0) for slot in range(slots)]
+
+
+def _bloquear(articulo_id):
+    """Bloquea el artículo y sus slots (en ese orden) y retorna (articulo, slots, total)"""
+    articulo = Articulo.objects.select_for_update().get(pk=articulo_id)
+    slots = list(SlotStock.objects.select_for_update().filter(articulo_id=articulo_id).order_by('slot'))
+    return articulo, slots, articulo.stock + sum(slot.cantidad for slot in slots)
+
+
+def _escribir(articulo, slots, total, cantidad_slots):
+    """Reparte el total en cantidad_slots slots, creando o borrando los que sobran o faltan"""
+    existentes = {slot.slot: slot for slot in slots}
+    SlotStock.objects.filter(articulo_id=articulo.pk, slot__gte=cantidad_slots).delete()
+
+    actualizados, nuevos = [], []
+    for numero, cantidad in enumerate(_repartir(total, cantidad_slots)):
+        slot = existentes.get(numero)
+        if slot is None:
+            nuevos.append(SlotStock(articulo_id=articulo.pk, slot=numero, cantidad=cantidad))
+        elif slot.cantidad != cantidad:
+            slot.cantidad = cantidad
+            actualizados.append(slot)
+    SlotStock.objects.bulk_update(actualizados, ['cantidad'])
+    SlotStock.objects.bulk_create(nuevos)
+    Articulo.objects.filter(pk=articulo.pk).update(stock=0, stock_slots=cantidad_slots)
+    return len(actualizados) + len(nuevos)
+
+
+def fraccionar_stock(articulo_id, slots):
+    """
+    Pasa el stock del artículo a `slots` slots, o lo devuelve a la columna
+    Articulo.stock con slots=0. También sirve para cambiar la cantidad de slots.
+
+    Returns:
+        int: Stock total del artículo (no cambia).
+    """
+    with transaction.atomic():
+        articulo, actuales, total = _bloquear(articulo_id)
+        if slots > 0:
+            _escribir(articulo, actuales, total, slots)
+        else:
+            SlotStock.objects.filter(articulo_id=articulo_id).delete()
+            Articulo.objects.filter(pk=articulo_id).update(stock=total, stock_slots=0)
+    return total
+
+
+def fijar_stock(articulo_id, total):
+    """Reemplaza el stock total de un artículo fraccionado, repartido en sus slots"""
+    with transaction.atomic():
+        articulo, slots, _ = _bloquear(articulo_id)
+        _escribir(articulo, slots, total, articulo.stock_slots)
+
+
+def compactar_stock(articulo_id):
+    """
+    Reparte en partes iguales el stock de un artículo fraccionado (incluido el
+    que hubiera quedado en Articulo.stock).
+
+    Returns:
+        int: Slots modificados (0 si ya estaba equilibrado).
+    """
+    with transaction.atomic():
+        articulo, slots, total = _bloquear(articulo_id)
+        if not articulo.stock_slots:
+            return 0
+        return _escribir(articulo, slots, total, articulo.stock_slots)
+
+
+def desequilibrio(articulo_id):
+    """Diferencia entre el slot con más unidades y el slot con menos"""
+    extremos = SlotStock.objects.filter(articulo_id=articulo_id).aggregate(maximo=Max('cantidad'), minimo=Min('cantidad'))
+    return (extremos['maximo'] - extremos['minimo']) if extremos['maximo'] is not None else 0
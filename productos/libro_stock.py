@@ -0,0 +1,169 @@
+"""
+Libro de stock por sucursal.
+
+Con STOCK_REGISTRO = 'libro' el stock de un artículo en una sucursal no es una
+columna que se actualiza: es la suma de sus movimientos (MovimientoStock), una
+tabla a la que solo se agregan filas. Confirmar o anular una orden inserta
+movimientos en la sucursal de la orden en lugar de modificar Articulo.stock.
+
+Para no sumar todo el historial en cada lectura, cortar_stock (comando
+cortar_stock, para ejecutar periódicamente) guarda cortes (CorteStock) con el
+saldo hasta un movimiento: el saldo actual es el del último corte más los
+movimientos posteriores. Los cortes anteriores se conservan, de modo que el
+stock a una fecha (saldos con fecha) tampoco recorre el historial ni las órdenes.
+
+Cada par (artículo, sucursal) se serializa con un advisory lock de Postgres
+que dura hasta el fin de la transacción, sin bloquear filas. Las reservas y los
+cortes lo toman exclusivo; las liberaciones, compartido (solo suman stock y no
+necesitan esperarse entre sí). Un corte espera a los movimientos en curso del
+par, así que ningún movimiento anterior al corte se confirma después de él.
+"""
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Exists, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from core.models import Sucursal
+from productos.models import Articulo, CorteStock, MovimientoStock
+from trading_system.choices import TipoMovimientoStock
+
+
+def _clave(articulo_id):
+    """Entero de 32 bits con signo que identifica al artículo en el advisory lock"""
+    return uuid.UUID(str(articulo_id)).int % 2 ** 32 - 2 ** 31
+
+
+def bloquear(articulo_ids, sucursal_id, compartido=False):
+    """
+    Toma el advisory lock de cada (artículo, sucursal) hasta el fin de la
+    transacción. Se toman siempre en el mismo orden para que dos transacciones
+    no formen un deadlock. Debe llamarse dentro de transaction.atomic().
+    """
+    funcion = 'pg_advisory_xact_lock_shared' if compartido else 'pg_advisory_xact_lock'
+    with connection.cursor() as cursor:
+        for clave in sorted({_clave(articulo_id) for articulo_id in articulo_ids}):
+            cursor.execute(f'SELECT {funcion}(%s, %s)', [clave, sucursal_id])
+
+
+def saldos(articulo_ids, sucursal_id, fecha=None):
+    """
+    Saldo de cada artículo en la sucursal: el último corte más los movimientos
+    posteriores, en dos consultas. Con fecha, el saldo a esa fecha y hora.
+
+    Returns:
+        dict: articulo_id (str) -> saldo (0 si no tiene movimientos).
+    """
+    articulo_ids = sorted({str(articulo_id) for articulo_id in articulo_ids})
+    if not articulo_ids:
+        return {}
+    cortes = CorteStock.objects.filter(articulo_id__in=articulo_ids, sucursal_id=sucursal_id)
+    movimientos = MovimientoStock.objects.filter(articulo_id__in=articulo_ids, sucursal_id=sucursal_id)
+    if fecha is not None:
+        cortes = cortes.filter(fecha__lte=fecha)
+        movimientos = movimientos.filter(fecha__lte=fecha)
+
+    ultimos = {
+        str(articulo_id): (saldo, hasta)
+        for articulo_id, saldo, hasta in cortes.order_by('articulo_id', '-hasta_movimiento').distinct(
+            'articulo_id'
+        ).values_list('articulo_id', 'saldo', 'hasta_movimiento')
+    }
+    resultado = {articulo_id: ultimos.get(articulo_id, (0, 0))[0] for articulo_id in articulo_ids}
+
+    posteriores = Q()
+    for articulo_id in articulo_ids:
+        posteriores |= Q(articulo_id=articulo_id, movimiento_stock_id__gt=ultimos.get(articulo_id, (0, 0))[1])
+    for articulo_id, suma in movimientos.filter(posteriores).values_list('articulo_id').annotate(
+        suma=Sum('cantidad')
+    ).order_by():
+        resultado[str(articulo_id)] += suma
+    return resultado
+
+
+def registrar(cantidades, sucursal_id, tipo, orden=None):
+    """Inserta un movimiento por artículo con su cantidad (con signo) en una sola sentencia"""
+    return MovimientoStock.objects.bulk_create([
+        MovimientoStock(articulo_id=articulo_id, sucursal_id=sucursal_id, cantidad=cantidad, tipo=tipo, orden=orden)
+        for articulo_id, cantidad in sorted(cantidades.items())
+        if cantidad
+    ])
+
+
+def cortar_stock(articulo_id, sucursal_id):
+    """
+    Guarda un corte con el saldo actual del artículo en la sucursal.
+
+    Returns:
+        CorteStock: El corte creado, o None si no hubo movimientos desde el último.
+    """
+    with transaction.atomic():
+        bloquear([articulo_id], sucursal_id)
+        ultimo = CorteStock.objects.filter(articulo_id=articulo_id, sucursal_id=sucursal_id).order_by(
+            '-hasta_movimiento'
+        ).first()
+        nuevos = MovimientoStock.objects.filter(
+            articulo_id=articulo_id, sucursal_id=sucursal_id,
+            movimiento_stock_id__gt=ultimo.hasta_movimiento if ultimo else 0,
+        ).aggregate(suma=Sum('cantidad'), hasta=Max('movimiento_stock_id'))
+        if nuevos['hasta'] is None:
+            return None
+        return CorteStock.objects.create(
+            articulo_id=articulo_id,
+            sucursal_id=sucursal_id,
+            saldo=(ultimo.saldo if ultimo else 0) + nuevos['suma'],
+            hasta_movimiento=nuevos['hasta'],
+        )
+
+
+def pendientes_de_corte(minimo=1):
+    """
+    Pares (articulo_id, sucursal_id) con al menos `minimo` movimientos
+    posteriores a su último corte.
+
+    Recorre los pares del catálogo (artículos por sucursal) y no el libro: para
+    cada par busca el último corte y el movimiento número `minimo` posterior a
+    él en el índice (articulo, sucursal, movimiento_stock_id), así que el costo
+    depende del tamaño del catálogo y de `minimo`, no del historial.
+    """
+    minimo = max(minimo, 1)
+    pendientes = []
+    for sucursal_id in Sucursal.objects.order_by('sucursal_id').values_list('sucursal_id', flat=True):
+        ultimo_corte = CorteStock.objects.filter(
+            articulo_id=OuterRef('articulo_id'), sucursal_id=sucursal_id
+        ).order_by('-hasta_movimiento').values('hasta_movimiento')[:1]
+        nuevos = MovimientoStock.objects.filter(
+            articulo_id=OuterRef('articulo_id'), sucursal_id=sucursal_id,
+            movimiento_stock_id__gt=OuterRef('ultimo_corte'),
+        )[minimo - 1:minimo]
+        pendientes.extend(
+            (articulo_id, sucursal_id)
+            for articulo_id in Articulo.objects.alias(ultimo_corte=Coalesce(Subquery(ultimo_corte), 0))
+            .filter(Exists(nuevos))
+            .order_by()
+            .values_list('articulo_id', flat=True)
+        )
+    return pendientes
+
+
+def abrir_libro(sucursal_id, articulo_ids=None):
+    """
+    Registra como apertura en la sucursal el stock actual de los artículos
+    (Articulo.stock más sus slots) que todavía no tienen movimientos en ella.
+    El stock de Articulo no tiene sucursal: se asigna entero a la indicada.
+
+    Returns:
+        int: Cantidad de artículos abiertos (los de stock 0 no necesitan apertura).
+    """
+    articulos = Articulo.objects.con_stock().exclude(movimientos_stock__sucursal_id=sucursal_id)
+    if articulo_ids is not None:
+        articulos = articulos.filter(articulo_id__in=articulo_ids)
+    with transaction.atomic():
+        candidatos = list(articulos.values_list('articulo_id', flat=True))
+        bloquear(candidatos, sucursal_id)
+        # Se vuelve a filtrar con los locks tomados por si otra apertura se adelantó
+        apertura = {
+            str(articulo.articulo_id): articulo.stock_disponible
+            for articulo in articulos.filter(articulo_id__in=candidatos)
+        }
+        return len(registrar(apertura, sucursal_id, TipoMovimientoStock.APERTURA))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from productos.libro_stock import abrir_libro
+
+
+class Command(BaseCommand):
+    help = (
+        'Registra el stock actual de los artículos como apertura del libro de stock de una sucursal '
+        '(antes de pasar a STOCK_REGISTRO = "libro")'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sucursal', dest='sucursal_id', type=int, required=True)
+        parser.add_argument('--articulo', dest='articulo_ids', action='append',
+                            help='ID del artículo (repetible; por defecto todos)')
+
+    def handle(self, *args, **options):
+        abiertos = abrir_libro(options['sucursal_id'], options['articulo_ids'])
+        self.stdout.write(f"{abiertos} artículos abiertos en la sucursal {options['sucursal_id']}")
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from productos.fraccionado import compactar_stock, desequilibrio
+from productos.models import Articulo
+
+
+class Command(BaseCommand):
+    help = 'Reequilibra los slots de los artículos con stock fraccionado (ejecutar periódicamente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articulo', dest='articulo_id', help='ID del artículo (por defecto todos los fraccionados)')
+        parser.add_argument('--umbral', type=int, default=0,
+                            help='Solo compacta si la diferencia entre el slot mayor y el menor supera este valor')
+        parser.add_argument('--intervalo', type=float,
+                            help='Segundos entre pasadas; sin este parámetro hace una sola pasada')
+
+    def handle(self, *args, **options):
+        while True:
+            self._pasada(options)
+            if not options['intervalo']:
+                return
+            time.sleep(options['intervalo'])
+
+    def _pasada(self, options):
+        articulos = Articulo.objects.filter(stock_slots__gt=0)
+        if options['articulo_id']:
+            articulos = articulos.filter(articulo_id=options['articulo_id'])
+
+        for articulo_id in articulos.values_list('articulo_id', flat=True):
+            if desequilibrio(articulo_id) <= options['umbral']:
+                continue
+            modificados = compactar_stock(articulo_id)
+            self.stdout.write(f'Artículo {articulo_id}: {modificados} slots reequilibrados')
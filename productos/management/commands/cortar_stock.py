@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from productos.libro_stock import cortar_stock, pendientes_de_corte
+
+
+class Command(BaseCommand):
+    help = 'Guarda cortes de saldo del libro de stock por sucursal (ejecutar periódicamente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minimo', type=int, default=1,
+                            help='Solo corta los pares artículo/sucursal con al menos estos movimientos nuevos')
+        parser.add_argument('--intervalo', type=float,
+                            help='Segundos entre pasadas; sin este parámetro hace una sola pasada')
+
+    def handle(self, *args, **options):
+        while True:
+            self._pasada(options)
+            if not options['intervalo']:
+                return
+            time.sleep(options['intervalo'])
+
+    def _pasada(self, options):
+        cortes = 0
+        for articulo_id, sucursal_id in pendientes_de_corte(options['minimo']):
+            if cortar_stock(articulo_id, sucursal_id) is not None:
+                cortes += 1
+        self.stdout.write(f'{cortes} cortes de stock guardados')
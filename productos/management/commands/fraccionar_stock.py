@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from productos.fraccionado import fraccionar_stock
+from productos.models import Articulo
+
+
+class Command(BaseCommand):
+    help = 'Reparte el stock de un artículo en slots para confirmaciones concurrentes (--slots 0 lo unifica)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articulo', dest='articulo_id', required=True, help='ID del artículo')
+        parser.add_argument('--slots', type=int, default=16, help='Cantidad de slots (0 = sin fraccionar)')
+
+    def handle(self, *args, **options):
+        if options['slots'] < 0:
+            raise CommandError('--slots no puede ser negativo')
+        if not Articulo.objects.filter(articulo_id=options['articulo_id']).exists():
+            raise CommandError('Artículo no encontrado')
+
+        total = fraccionar_stock(options['articulo_id'], options['slots'])
+        self.stdout.write(f"Artículo {options['articulo_id']}: stock {total} en {options['slots']} slots")
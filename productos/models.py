@@ -1,5 +1,7 @@
-from django.db import models
-from trading_system.choices import EstadoEntidades, EstadoOrden
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from trading_system.choices import EstadoEntidades, EstadoOrden, TipoMovimientoStock
 
 
 class LineaArticulo(models.Model):
@@ -33,12 +35,23 @@ class GrupoArticulo(models.Model):
         db_table = 'grupos_articulos'
         ordering = ["codigo_grupo"]
 
+class ArticuloQuerySet(models.QuerySet):
+    def con_stock(self):
+        """Anota suma_slots (stock de los slots) para leer stock_disponible sin una consulta por artículo"""
+        suma = SlotStock.objects.filter(articulo=models.OuterRef('pk')).order_by().values('articulo').annotate(
+            suma=models.Sum('cantidad')
+        ).values('suma')
+        return self.annotate(suma_slots=Coalesce(models.Subquery(suma), 0))
+
+
 class Articulo(models.Model):
     articulo_id = models.UUIDField(primary_key=True)
     codigo_articulo = models.CharField(max_length=10, null=False, blank=False)
     codigo_barras = models.CharField(max_length=50, null=True, blank=True)
     descripcion = models.CharField(max_length=200, null=False)
     stock = models.IntegerField(default=0)
+    # Cantidad de slots del stock fraccionado (ver productos.fraccionado); 0 = el stock está en esta fila
+    stock_slots = models.PositiveSmallIntegerField(default=0)
     unidad_medida = models.CharField(max_length=20, null=False)
     costo_actual = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     precio_sugerido = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -47,7 +60,96 @@ class Articulo(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True, null=False)
     fecha_modificacion = models.DateTimeField(auto_now=True, null=False)
 
+    objects = ArticuloQuerySet.as_manager()
+
+    @property
+    def stock_disponible(self):
+        """Stock total del artículo: la fila más sus slots si está fraccionado"""
+        if not self.stock_slots:
+            return self.stock
+        suma = getattr(self, 'suma_slots', None)
+        if suma is None:
+            suma = self.slots_stock.aggregate(suma=models.Sum('cantidad'))['suma'] or 0
+        return self.stock + suma
+
+    @stock_disponible.setter
+    def stock_disponible(self, valor):
+        # En un artículo fraccionado el nuevo total se reparte entre los slots al guardar
+        if self.stock_slots:
+            self._stock_fijado = valor
+        else:
+            self.stock = valor
+
+    def save(self, *args, **kwargs):
+        stock_fijado = getattr(self, '_stock_fijado', None)
+        if stock_fijado is None:
+            return super().save(*args, **kwargs)
+
+        from productos.fraccionado import fijar_stock
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            fijar_stock(self.pk, stock_fijado)
+        self._stock_fijado = None
+        self.stock = 0
+        self.suma_slots = stock_fijado
 
     class Meta:
         db_table = 'articulos'
-        ordering = ["codigo_articulo"]
\ No newline at end of file
+        ordering = ["codigo_articulo"]
+
+
+class SlotStock(models.Model):
+    """Porción del stock de un artículo fraccionado (ver productos.fraccionado)"""
+    slot_stock_id = models.BigAutoField(primary_key=True)
+    articulo = models.ForeignKey(Articulo, on_delete=models.CASCADE, null=False, related_name='slots_stock')
+    slot = models.PositiveSmallIntegerField(null=False)
+    cantidad = models.IntegerField(null=False, default=0)
+
+    def __str__(self):
+        return f"{self.articulo_id} - slot {self.slot}: {self.cantidad}"
+
+    class Meta:
+        db_table = 'slots_stock'
+        unique_together = ('articulo', 'slot')
+        ordering = ['articulo', 'slot']
+
+
+class MovimientoStock(models.Model):
+    """Entrada o salida de stock de un artículo en una sucursal (ver productos.libro_stock). Nunca se modifica."""
+    movimiento_stock_id = models.BigAutoField(primary_key=True)
+    articulo = models.ForeignKey(Articulo, on_delete=models.RESTRICT, null=False, related_name='movimientos_stock')
+    sucursal = models.ForeignKey('core.Sucursal', on_delete=models.RESTRICT, null=False, related_name='movimientos_stock')
+    # Positiva para entradas, negativa para salidas
+    cantidad = models.IntegerField(null=False)
+    tipo = models.IntegerField(choices=TipoMovimientoStock, null=False)
+    orden = models.ForeignKey('ventas.OrdenCompraCliente', on_delete=models.RESTRICT, null=True, blank=True,
+                              related_name='movimientos_stock')
+    fecha = models.DateTimeField(default=timezone.now, null=False)
+
+    def __str__(self):
+        return f"{self.articulo_id} @ {self.sucursal_id}: {self.cantidad:+d}"
+
+    class Meta:
+        db_table = 'movimientos_stock'
+        ordering = ['movimiento_stock_id']
+        indexes = [
+            models.Index(fields=['articulo', 'sucursal', 'movimiento_stock_id'], name='mov_stock_art_suc_idx'),
+        ]
+
+
+class CorteStock(models.Model):
+    """Saldo de un artículo en una sucursal incluyendo todos los movimientos hasta hasta_movimiento"""
+    corte_stock_id = models.BigAutoField(primary_key=True)
+    articulo = models.ForeignKey(Articulo, on_delete=models.RESTRICT, null=False, related_name='cortes_stock')
+    sucursal = models.ForeignKey('core.Sucursal', on_delete=models.RESTRICT, null=False, related_name='cortes_stock')
+    saldo = models.IntegerField(null=False)
+    hasta_movimiento = models.BigIntegerField(null=False)
+    fecha = models.DateTimeField(default=timezone.now, null=False)
+
+    def __str__(self):
+        return f"{self.articulo_id} @ {self.sucursal_id}: {self.saldo} (hasta {self.hasta_movimiento})"
+
+    class Meta:
+        db_table = 'cortes_stock'
+        unique_together = ('articulo', 'sucursal', 'hasta_movimiento')
+        ordering = ['articulo', 'sucursal', 'hasta_movimiento']
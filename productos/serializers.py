@@ -64,6 +64,9 @@ class ArticuloSerializer(serializers.ModelSerializer):
     Muestra grupo y línea anidados en lectura
     Permite escritura con grupo_id
     """
+    # Stock total, también para artículos con stock fraccionado en slots
+    stock = serializers.IntegerField(source='stock_disponible', required=False)
+
     # Campos anidados de solo lectura
     grupo_detalle = GrupoArticuloSerializer(source='grupo_id', read_only=True)
     linea_detalle = serializers.SerializerMethodField()
@@ -116,6 +119,7 @@ class ArticuloListSerializer(serializers.ModelSerializer):
     """
     grupo_nombre = serializers.CharField(source='grupo_id.nombre_grupo', read_only=True)
     linea_nombre = serializers.CharField(source='grupo_id.linea.nombre_linea', read_only=True)
+    stock = serializers.IntegerField(source='stock_disponible', read_only=True)
     
     class Meta:
         model = Articulo
@@ -155,7 +159,7 @@ class JerarquiaSerializer(serializers.Serializer):
                     'articulo_id': str(articulo.articulo_id),
                     'codigo_articulo': articulo.codigo_articulo,
                     'descripcion': articulo.descripcion,
-                    'stock': articulo.stock,
+                    'stock': articulo.stock_disponible,
                     'unidad_medida': articulo.unidad_medida,
                     'precio_sugerido': str(articulo.precio_sugerido),
                     'estado': articulo.estado
@@ -8,8 +8,13 @@ from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.db.models import Prefetch
+from django.http import Http404
+from django.utils import timezone
+from datetime import datetime, time
+import uuid
 
-from productos.models import LineaArticulo, GrupoArticulo, Articulo
+from productos import libro_stock
+from productos.models import LineaArticulo, GrupoArticulo, Articulo, MovimientoStock
 from productos.serializers import (
     LineaArticuloSerializer,
     GrupoArticuloSerializer,
@@ -18,6 +23,8 @@ from productos.serializers import (
     JerarquiaSerializer
 )
 from trading_system.choices import EstadoEntidades
+from ventas.retenciones import disponibles
+from ventas.stock import libro_activo
 
 
 class LineaArticuloViewSet(viewsets.ModelViewSet):
@@ -279,6 +286,8 @@ class ArticuloViewSet(viewsets.ModelViewSet):
     - GET /api/catalogo/articulos/{id}/ - Obtener detalle
     - PUT/PATCH /api/catalogo/articulos/{id}/ - Actualizar artículo
     - DELETE /api/catalogo/articulos/{id}/ - Soft delete
+    - GET /api/catalogo/articulos/{id}/existencias/ - Saldo por sucursal según el libro de stock
+    - GET /api/catalogo/articulos/{id}/disponible/ - Stock disponible para prometer
     
     Filtros:
     - ?grupo={grupo_id} (filtra por grupo)
@@ -288,7 +297,7 @@ class ArticuloViewSet(viewsets.ModelViewSet):
     queryset = Articulo.objects.select_related(
         'grupo_id',
         'grupo_id__linea'
-    ).all()
+    ).con_stock()
     serializer_class = ArticuloSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -387,6 +396,88 @@ class ArticuloViewSet(viewsets.ModelViewSet):
             }
         }, status=status.HTTP_200_OK)
     
+    @action(detail=True, methods=['get'], url_path='existencias')
+    def existencias(self, request, articulo_id=None):
+        """
+        GET /api/catalogo/articulos/{id}/existencias/
+
+        - sucursal: ID de sucursal (default: todas las que tienen movimientos)
+        - fecha: Saldo al final de ese día, formato YYYY-MM-DD (default: actual)
+        """
+        articulo = self.get_object()
+        sucursal_id = request.query_params.get('sucursal')
+        fecha_str = request.query_params.get('fecha')
+
+        fecha = None
+        if fecha_str:
+            try:
+                fecha = timezone.make_aware(datetime.combine(datetime.strptime(fecha_str, '%Y-%m-%d').date(), time.max))
+            except ValueError:
+                return Response(
+                    {'error': 'Formato de fecha inválido. Use YYYY-MM-DD'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        if sucursal_id:
+            if not sucursal_id.isdigit():
+                return Response(
+                    {'error': 'El parámetro sucursal debe ser un ID numérico'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            sucursales = [int(sucursal_id)]
+        else:
+            sucursales = MovimientoStock.objects.filter(articulo=articulo).values_list(
+                'sucursal_id', flat=True
+            ).distinct().order_by('sucursal_id')
+
+        clave = str(articulo.articulo_id)
+        return Response({
+            'success': True,
+            'articulo_id': clave,
+            'fecha': fecha_str,
+            'data': [
+                {'sucursal_id': sucursal, 'saldo': libro_stock.saldos([clave], sucursal, fecha)[clave]}
+                for sucursal in sucursales
+            ]
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='disponible')
+    def disponible(self, request, articulo_id=None):
+        """
+        GET /api/catalogo/articulos/{id}/disponible/
+
+        - sucursal: ID de sucursal (requerido con el libro de stock)
+
+        Stock menos las retenciones vigentes de las órdenes pendientes. No
+        carga el artículo con su serializador: son dos o tres consultas por índice.
+        """
+        sucursal_id = request.query_params.get('sucursal')
+        if sucursal_id and not sucursal_id.isdigit():
+            return Response(
+                {'error': 'El parámetro sucursal debe ser un ID numérico'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        sucursal_id = int(sucursal_id) if sucursal_id else None
+        if sucursal_id is None and libro_activo():
+            return Response(
+                {'error': 'El parámetro sucursal es requerido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            clave = str(uuid.UUID(articulo_id))
+        except ValueError:
+            raise Http404
+        resultado = disponibles([clave], sucursal_id).get(clave)
+        if resultado is None:
+            raise Http404
+        return Response({
+            'success': True,
+            'articulo_id': clave,
+            'sucursal_id': sucursal_id,
+            'data': resultado
+        }, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['get'], url_path='activos')
     def activos(self, request):
         """Listar solo artículos activos"""
@@ -429,7 +520,7 @@ class ArticuloViewSet(viewsets.ModelViewSet):
             queryset=GrupoArticulo.objects.prefetch_related(
                 Prefetch(
                     'grupo_articulo',
-                    queryset=Articulo.objects.all()
+                    queryset=Articulo.objects.con_stock()
                 )
             )
         )
@@ -56,4 +56,10 @@ class TipoItem(models.IntegerChoices):
 class AccionAuditoria(models.IntegerChoices):
     CREACION = 1, "Creación"
     MODIFICACION = 2, "Modificación"
-    ELIMINACION = 3, "Eliminación"
\ No newline at end of file
+    ELIMINACION = 3, "Eliminación"
+
+class TipoMovimientoStock(models.IntegerChoices):
+    APERTURA = 1, "Apertura"
+    RESERVA = 2, "Reserva"
+    LIBERACION = 3, "Liberación"
+    AJUSTE = 4, "Ajuste"
@@ -181,3 +181,39 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
     ],
 }
+
+# Alias de CACHES con los contadores de generación de los índices y caches en memoria (core/generaciones.py).
+# Con varios workers debe ser un backend compartido (redis, memcached, base de datos o archivo); con un backend
+# que no sea locmem las vistas asíncronas cotizan en un hilo (ventas/asincrono.py)
+GENERACIONES_CACHE = 'default'
+
+# Cache de cotizaciones (ventas/cache_cotizaciones.py)
+COTIZACIONES_CACHE = {
+    'HABILITADO': True,
+    'MAXIMO_ENTRADAS': 10000,
+    # Alias de CACHES para un nivel compartido (locmem o archivo), None para desactivarlo
+    'ALIAS_COMPARTIDO': None,
+}
+
+# Artículos por lista que los signals refrescan en PrecioEfectivo durante la solicitud (precios/refresco.py);
+# por encima solo se borran sus filas hasta el comando refrescar_precios_efectivos. None para no limitar
+PRECIOS_EFECTIVOS_REFRESCO_MAXIMO = 200
+
+# Aritmética del cálculo de precios: 'decimal' o 'enteros' (ventas/aritmetica.py)
+PRECIOS_ARITMETICA = 'decimal'
+
+# Registro del stock: 'articulo' (columna Articulo.stock) o 'libro' (movimientos por sucursal, productos/libro_stock.py)
+STOCK_REGISTRO = 'articulo'
+
+# Minutos que una orden PENDIENTE retiene el stock de sus líneas (ventas/retenciones.py)
+RETENCION_STOCK_MINUTOS = 60
+
+# Números de orden que cada proceso reserva por consulta a la secuencia (ventas/numeracion.py)
+NUMERACION_ORDENES_BLOQUE = 20
+
+# Horas que se recuerda una Idempotency-Key de creación de órdenes (ventas/idempotencia.py)
+IDEMPOTENCIA_HORAS = 24
+
+# Desde cuántas filas estimadas los listados paginados informan un conteo aproximado en lugar de COUNT(*)
+# (core/pagination.py); None para contar siempre
+PAGINACION_CONTEO_ESTIMADO_DESDE = 10000
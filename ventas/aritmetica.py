@@ -0,0 +1,184 @@
+"""
+Aritmética de precios en enteros escalados.
+
+Alternativa a la versión Decimal de ventas.utils.aplicar_reglas que se
+selecciona con settings.PRECIOS_ARITMETICA = 'enteros'. Cada monto se
+representa como un par (n, s) con valor n / 10**s, de modo que sumas, restas y
+productos son operaciones sobre int de Python.
+
+El resultado coincide con el de Decimal bajo el contexto por defecto:
+- Cada operación se redondea a 28 dígitos significativos (ROUND_HALF_EVEN),
+  como hace Decimal, aunque en la práctica los precios nunca llegan a ese
+  tamaño.
+- El redondeo final a centavos replica quantize(Decimal('0.01')), que usa
+  ROUND_HALF_EVEN (no half-up), incluido el signo de -0.00.
+"""
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from trading_system.choices import TipoDescuento
+
+PRECISION = 28
+_LIMITE_PRECISION = 10 ** PRECISION
+_CENTAVO = Decimal('0.01')
+_PORCENTAJE = int(TipoDescuento.PORCENTAJE)
+_MONTO_FIJO = int(TipoDescuento.MONTO_FIJO)
+
+
+class _Potencias(dict):
+    """Potencias de 10 para alinear escalas, calculadas una sola vez"""
+
+    def __missing__(self, k):
+        self[k] = potencia = 10 ** k
+        return potencia
+
+
+_POTENCIAS = _Potencias((i, 10 ** i) for i in range(64))
+
+
+def _dividir_par(n, divisor):
+    """n / divisor redondeado a entero con ROUND_HALF_EVEN (divisor > 0)"""
+    cociente, resto = divmod(abs(n), divisor)
+    if resto * 2 > divisor or (resto * 2 == divisor and cociente & 1):
+        cociente += 1
+    return -cociente if n < 0 else cociente
+
+
+def _ajustar(n, s):
+    """Redondea a PRECISION dígitos significativos, como el contexto de Decimal"""
+    if -_LIMITE_PRECISION < n < _LIMITE_PRECISION:
+        return n, s
+    sobrantes = len(str(abs(n))) - PRECISION
+    return _dividir_par(n, _POTENCIAS[sobrantes]), s - sobrantes
+
+
+def _restar(n1, s1, n2, s2):
+    if s1 > s2:
+        return _ajustar(n1 - n2 * _POTENCIAS[s1 - s2], s1)
+    if s1 < s2:
+        return _ajustar(n1 * _POTENCIAS[s2 - s1] - n2, s2)
+    return _ajustar(n1 - n2, s1)
+
+
+def _menor(n1, s1, n2, s2):
+    if s1 > s2:
+        return n1 < n2 * _POTENCIAS[s1 - s2]
+    if s1 < s2:
+        return n1 * _POTENCIAS[s2 - s1] < n2
+    return n1 < n2
+
+
+_enteros = {}
+
+
+def a_entero(valor):
+    """Convierte un Decimal (o int/float, de forma exacta) al par (n, s)"""
+    try:
+        return _enteros[valor]
+    except KeyError:
+        pass
+    convertido = Decimal(valor) if not isinstance(valor, Decimal) else valor
+    exponente = convertido.as_tuple().exponent
+    if exponente >= 0:
+        par = int(convertido), 0
+    else:
+        par = int(convertido.scaleb(-exponente)), -exponente
+    if len(_enteros) > 65536:
+        _enteros.clear()
+    _enteros[valor] = par
+    return par
+
+
+def a_centavos(n, s):
+    """Equivalente a Decimal(n / 10**s).quantize(Decimal('0.01'))"""
+    if s >= 2:
+        centavos = _dividir_par(n, _POTENCIAS[s - 2]) if s > 2 else n
+    else:
+        centavos = n * _POTENCIAS[2 - s]
+    if not -_LIMITE_PRECISION < centavos < _LIMITE_PRECISION:
+        # quantize no puede representar el resultado con la precisión del contexto
+        raise InvalidOperation
+    if centavos == 0 and n < 0:
+        return Decimal('-0.00')
+    return _CENTAVO * centavos
+
+
+def _a_decimal(n, s):
+    return Decimal(n).scaleb(-s)
+
+
+def aplicar_reglas_enteros(precio_base, precio_minimo, costo_actual, reglas, pasos=None):
+    """
+    Misma firma y resultado que ventas.utils.aplicar_reglas, calculado con
+    enteros escalados.
+    """
+    base_n, base_s = a_entero(precio_base)
+    n, s = base_n, base_s
+    descuento_n, descuento_s = 0, 0
+    reglas_aplicadas = []
+
+    for regla in reglas:
+        tipo_descuento = regla.tipo_descuento
+        if tipo_descuento == _PORCENTAJE:
+            valor_n, valor_s = a_entero(regla.valor_descuento)
+            # (precio * valor) / 100: el producto se redondea, dividir por 100 es exacto
+            regla_n, regla_s = n * valor_n, s + valor_s
+            if not -_LIMITE_PRECISION < regla_n < _LIMITE_PRECISION:
+                regla_n, regla_s = _ajustar(regla_n, regla_s)
+            regla_s += 2
+        elif tipo_descuento == _MONTO_FIJO:
+            regla_n, regla_s = a_entero(regla.valor_descuento)
+        else:
+            regla_n, regla_s = 0, 0
+
+        # Restar o sumar cero no cambia el valor
+        if regla_n == 0:
+            if pasos is not None:
+                pasos.append((regla, _a_decimal(n, s), Decimal(0), _a_decimal(n, s)))
+            continue
+        antes_n, antes_s = n, s
+
+        # Las escalas son chicas: se alinean con la tabla de potencias y solo
+        # se redondea si el resultado supera la precisión de Decimal
+        if regla_s > s:
+            n = n * _POTENCIAS[regla_s - s] - regla_n
+            s = regla_s
+        elif regla_s < s:
+            n -= regla_n * _POTENCIAS[s - regla_s]
+        else:
+            n -= regla_n
+        if not -_LIMITE_PRECISION < n < _LIMITE_PRECISION:
+            n, s = _ajustar(n, s)
+        if pasos is not None:
+            pasos.append((regla, _a_decimal(antes_n, antes_s), _a_decimal(regla_n, regla_s), _a_decimal(n, s)))
+
+        if regla_s > descuento_s:
+            descuento_n = descuento_n * _POTENCIAS[regla_s - descuento_s] + regla_n
+            descuento_s = regla_s
+        elif regla_s < descuento_s:
+            descuento_n += regla_n * _POTENCIAS[descuento_s - regla_s]
+        else:
+            descuento_n += regla_n
+        if not -_LIMITE_PRECISION < descuento_n < _LIMITE_PRECISION:
+            descuento_n, descuento_s = _ajustar(descuento_n, descuento_s)
+
+        reglas_aplicadas.append(regla.descripcion)
+
+    # Validar contra el precio mínimo
+    minimo_n, minimo_s = a_entero(precio_minimo)
+    if _menor(n, s, minimo_n, minimo_s):
+        descuento_n, descuento_s = _restar(base_n, base_s, minimo_n, minimo_s)
+        n, s = minimo_n, minimo_s
+        reglas_aplicadas.append("Ajustado a precio mínimo de venta.")
+
+    # Determinar si la venta es bajo costo
+    costo_n, costo_s = a_entero(costo_actual)
+    vendido_bajo_costo = _menor(n, s, costo_n, costo_s)
+
+    return {
+        "precio_base": precio_base,
+        "precio_final": a_centavos(n, s),
+        "descuento_total": a_centavos(descuento_n, descuento_s),
+        "reglas_aplicadas": reglas_aplicadas,
+        "vendido_bajo_costo": vendido_bajo_costo
+    }
@@ -0,0 +1,68 @@
+"""
+Cálculo de precios para las vistas asíncronas (ASGI).
+
+Cotizar lee los contadores de generación (core.generaciones) para validar el
+índice y las claves de la cache de cotizaciones. Si viven en memoria del
+proceso (locmem) y el índice de la lista ya está construido, cotizar no hace
+I/O y se ejecuta directamente en el event loop; solo la construcción del
+índice va a un hilo, y los artículos se cargan con el ORM asíncrono. Si los
+contadores o la cache de cotizaciones usan un backend compartido (base de
+datos o red), la búsqueda del índice y la cotización se hacen en un hilo.
+"""
+from asgiref.sync import sync_to_async
+
+from core import generaciones
+from precios.indice import indice_cargado, obtener_indice
+from productos.models import Articulo
+from ventas.cache_cotizaciones import obtener_cache
+from ventas.utils import precio_linea, aplicar_reglas_pedido, cotizar_lineas
+
+
+def _cotizar_en_hilo():
+    """True si cotizar hace I/O: contadores de generación o cache de cotizaciones compartidos"""
+    cache = obtener_cache()
+    return not generaciones.en_memoria() or (cache is not None and cache.alias_compartido)
+
+
+async def aobtener_indice(lista_precio):
+    """Versión asíncrona de obtener_indice"""
+    indice = indice_cargado(lista_precio) if generaciones.en_memoria() else None
+    if indice is None:
+        indice = await sync_to_async(obtener_indice)(lista_precio)
+    return indice
+
+
+async def acargar_articulos(articulo_ids):
+    """Versión asíncrona de ventas.utils.cargar_articulos"""
+    articulos = Articulo.objects.select_related('grupo_id__linea').filter(
+        articulo_id__in={str(articulo_id) for articulo_id in articulo_ids}
+    )
+    return {str(articulo.articulo_id): articulo async for articulo in articulos}
+
+
+async def acalculate_price(articulo, lista_precio, canal, cantidad):
+    """
+    Versión asíncrona de calculate_price. El artículo debe venir con su grupo
+    y línea cargados (select_related('grupo_id__linea')).
+    """
+    indice = await aobtener_indice(lista_precio)
+    if _cotizar_en_hilo():
+        return await sync_to_async(precio_linea)(indice, lista_precio, articulo, canal, cantidad)
+    return precio_linea(indice, lista_precio, articulo, canal, cantidad)
+
+
+async def acalculate_order_prices(lineas, lista_precio, canal):
+    """Versión asíncrona de calculate_order_prices"""
+    lineas = list(lineas)
+    indice = await aobtener_indice(lista_precio)
+    articulos = await acargar_articulos(linea['articulo_id'] for linea in lineas)
+
+    if _cotizar_en_hilo():
+        resultados = await sync_to_async(cotizar_lineas)(indice, lista_precio, lineas, articulos, canal)
+    else:
+        resultados = cotizar_lineas(indice, lista_precio, lineas, articulos, canal)
+    for resultado in resultados:
+        if "error" in resultado:
+            return {"lineas": resultados, "error": resultado["error"]}
+
+    return aplicar_reglas_pedido(resultados, indice, canal)
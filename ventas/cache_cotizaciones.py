@@ -0,0 +1,193 @@
+"""
+Cache de cotizaciones delante de calculate_price.
+
+La clave es (lista, artículo, canal, tramo de cantidad, fecha, generaciones).
+El tramo es el de la lista (IndiceReglas.tramo_lista), así todas las
+cantidades de un mismo tramo comparten entrada. Las generaciones son la del
+índice de reglas con que se cotizó y las de cotización de la lista y del
+artículo (core.generaciones), compartidas entre procesos: invalidar en
+cualquier worker sube la generación y las entradas anteriores dejan de
+encontrarse en todos, en los dos niveles. Como la clave se arma antes de
+calcular, un guardar que compite con una invalidación queda con la
+generación anterior y nunca se lee.
+
+- LRU en memoria del proceso, con desalojo preciso por lista y artículo
+  para liberar memoria en el proceso que invalida.
+- Opcional, un alias de django.core.cache compartido entre hilos o procesos,
+  con expiración a medianoche.
+
+Configuración en settings.COTIZACIONES_CACHE:
+    HABILITADO (bool), MAXIMO_ENTRADAS (int), ALIAS_COMPARTIDO (str | None)
+"""
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core import generaciones
+
+CONFIGURACION_POR_DEFECTO = {
+    'HABILITADO': True,
+    'MAXIMO_ENTRADAS': 10000,
+    'ALIAS_COMPARTIDO': None,
+}
+
+
+def _segundos_hasta_medianoche():
+    ahora = datetime.now()
+    medianoche = datetime.combine(ahora.date() + timedelta(days=1), time.min)
+    return max(int((medianoche - ahora).total_seconds()), 1)
+
+
+def _copiar(resultado):
+    copia = dict(resultado)
+    copia["reglas_aplicadas"] = list(resultado["reglas_aplicadas"])
+    return copia
+
+
+class CacheCotizaciones:
+
+    def __init__(self, maximo_entradas=10000, alias_compartido=None):
+        self.maximo_entradas = maximo_entradas
+        self.alias_compartido = alias_compartido
+        self._entradas = OrderedDict()
+        # lista_precio_id -> articulo_id -> claves, para el desalojo preciso
+        self._por_lista = {}
+        self._fecha = date.today()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.aciertos_compartidos = 0
+
+    @property
+    def compartido(self):
+        return caches[self.alias_compartido] if self.alias_compartido else None
+
+    @staticmethod
+    def clave(articulo_id, lista_precio_id, canal, tramo, fecha, generacion_indice=None):
+        lista_precio_id, articulo_id = str(lista_precio_id), str(articulo_id)
+        generacion = generaciones.actuales(f'cotizacion:{lista_precio_id}', f'cotizacion:{lista_precio_id}:{articulo_id}')
+        return (lista_precio_id, articulo_id, int(canal), tramo, fecha.isoformat(), *(generacion_indice or ()), *generacion)
+
+    @staticmethod
+    def _clave_compartida(clave):
+        return 'cotizacion:' + ':'.join(str(parte) for parte in clave)
+
+    def _rotar_fecha(self):
+        hoy = date.today()
+        if hoy != self._fecha:
+            self._entradas.clear()
+            self._por_lista.clear()
+            self._fecha = hoy
+
+    def obtener(self, clave):
+        with self._lock:
+            self._rotar_fecha()
+            resultado = self._entradas.get(clave)
+            if resultado is not None:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return _copiar(resultado)
+
+        if self.compartido is not None:
+            resultado = self.compartido.get(self._clave_compartida(clave))
+            if resultado is not None:
+                with self._lock:
+                    self.aciertos_compartidos += 1
+                self._guardar_local(clave, resultado)
+                return _copiar(resultado)
+
+        with self._lock:
+            self.fallos += 1
+        return None
+
+    def guardar(self, clave, resultado):
+        resultado = _copiar(resultado)
+        self._guardar_local(clave, resultado)
+        if self.compartido is not None:
+            self.compartido.set(self._clave_compartida(clave), resultado, timeout=_segundos_hasta_medianoche())
+
+    def _guardar_local(self, clave, resultado):
+        with self._lock:
+            self._entradas[clave] = resultado
+            self._entradas.move_to_end(clave)
+            self._por_lista.setdefault(clave[0], {}).setdefault(clave[1], set()).add(clave)
+
+            while len(self._entradas) > self.maximo_entradas:
+                antigua, _ = self._entradas.popitem(last=False)
+                self._quitar_de_indice(antigua)
+
+    def _quitar_de_indice(self, clave):
+        por_articulo = self._por_lista.get(clave[0], {})
+        claves = por_articulo.get(clave[1])
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del por_articulo[clave[1]]
+
+    def invalidar(self, lista_precio_id=None, articulo_ids=None):
+        """
+        Desaloja las cotizaciones de una lista (o de algunos de sus artículos)
+        en todos los procesos. Sin lista, desaloja todo el nivel local.
+        """
+        with self._lock:
+            if lista_precio_id is None:
+                self._entradas.clear()
+                self._por_lista.clear()
+                return
+
+            lista_precio_id = str(lista_precio_id)
+            por_articulo = self._por_lista.get(lista_precio_id, {})
+            articulos = list(por_articulo) if articulo_ids is None else [str(a) for a in articulo_ids]
+            for articulo_id in articulos:
+                for clave in por_articulo.pop(articulo_id, set()):
+                    self._entradas.pop(clave, None)
+
+        if articulo_ids is None:
+            generaciones.subir(f'cotizacion:{lista_precio_id}')
+        else:
+            generaciones.subir(*(f'cotizacion:{lista_precio_id}:{a}' for a in articulo_ids))
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.aciertos_compartidos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'maximo_entradas': self.maximo_entradas,
+                'aciertos': self.aciertos,
+                'aciertos_compartidos': self.aciertos_compartidos,
+                'fallos': self.fallos,
+                'tasa_aciertos': (self.aciertos + self.aciertos_compartidos) / consultas if consultas else 0.0,
+                'alias_compartido': self.alias_compartido,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obtener_cache():
+    """
+    Retorna la cache de cotizaciones del proceso, o None si está deshabilitada.
+    """
+    global _cache
+    configuracion = {**CONFIGURACION_POR_DEFECTO, **getattr(settings, 'COTIZACIONES_CACHE', {})}
+    if not configuracion['HABILITADO']:
+        return None
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = CacheCotizaciones(
+                    maximo_entradas=configuracion['MAXIMO_ENTRADAS'],
+                    alias_compartido=configuracion['ALIAS_COMPARTIDO'],
+                )
+    return _cache
+
+
+def invalidar_cotizaciones(lista_precio_id=None, articulo_ids=None):
+    cache = obtener_cache()
+    if cache is not None:
+        cache.invalidar(lista_precio_id, articulo_ids)
@@ -0,0 +1,74 @@
+"""
+Creación idempotente de órdenes con el encabezado Idempotency-Key.
+
+Un cliente que reintenta POST /api/ordenes/ con la misma clave recibe la
+misma respuesta que el primer intento (guardada con la clave, aunque la orden
+haya cambiado después), sin volver a calcular precios, leer la orden ni
+escribir nada. La clave se registra (ClaveIdempotencia) en la misma transacción que la
+orden y antes de calcularla: un reintento que llega mientras el primero está
+en curso espera en el índice único (usuario, clave) y, cuando el primero
+confirma, responde con su resultado; si el primero falla, el reintento crea
+la orden.
+
+Reutilizar la clave con otro contenido es un error del cliente (422). Las
+claves vencen a las IDEMPOTENCIA_HORAS y las vencidas se eliminan con
+purgar_vencidas (comando purgar_claves_idempotencia, para ejecutar
+periódicamente).
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from ventas.models import ClaveIdempotencia
+
+ENCABEZADO = 'Idempotency-Key'
+LARGO_MAXIMO = 100
+
+
+def _hash(datos):
+    """sha256 de la representación JSON canónica (claves ordenadas)"""
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest()
+
+
+def registrar_clave(usuario, clave, datos):
+    """
+    Registra la clave para la solicitud o recupera la del intento anterior.
+    Debe llamarse dentro de transaction.atomic(), antes de crear la orden.
+
+    Returns:
+        tuple: (ClaveIdempotencia, creada). Si no es nueva, la orden ya fue
+            creada con esa clave (o su contenido no coincide: ver coincide).
+    """
+    huella = _hash(datos)
+    vence = timezone.now() + timedelta(hours=getattr(settings, 'IDEMPOTENCIA_HORAS', 24))
+    registro, creada = ClaveIdempotencia.objects.get_or_create(
+        usuario=usuario, clave=clave, defaults={'huella': huella, 'vence': vence}
+    )
+    if not creada and registro.vence <= timezone.now():
+        # Vencida (todavía no purgada): se usa como una clave nueva
+        registro.huella, registro.vence = huella, vence
+        registro.orden_compra_cliente, registro.respuesta = None, None
+        registro.save()
+        creada = True
+    return registro, creada
+
+
+def coincide(registro, datos):
+    """Indica si la solicitud tiene el mismo contenido que la que registró la clave"""
+    return registro.huella == _hash(datos)
+
+
+def guardar_resultado(registro, orden, respuesta):
+    """Asocia a la clave la orden creada y el cuerpo de la respuesta enviada"""
+    registro.orden_compra_cliente = orden
+    registro.respuesta = respuesta
+    registro.save(update_fields=['orden_compra_cliente', 'respuesta'])
+
+
+def purgar_vencidas(ahora=None):
+    """Elimina las claves vencidas y retorna cuántas eran"""
+    return ClaveIdempotencia.objects.filter(vence__lte=ahora or timezone.now()).delete()[0]
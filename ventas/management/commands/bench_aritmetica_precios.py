@@ -0,0 +1,46 @@
+import json
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from ventas.aritmetica import aplicar_reglas_enteros
+from ventas.sintetico import casos_aritmetica
+from ventas.utils import aplicar_reglas_decimal
+
+
+class Command(BaseCommand):
+    help = 'Compara el tiempo de aplicar_reglas con Decimal y con enteros escalados (salida JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--casos', type=int, default=2000, help='Cantidad de casos sintéticos')
+        parser.add_argument('--reglas', type=int, default=4, help='Máximo de reglas por caso')
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument('--semilla', type=int, default=2024)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        casos = list(casos_aritmetica(rnd, options['casos'], options['reglas']))
+
+        def correr(kernel):
+            def lote():
+                for caso in casos:
+                    kernel(*caso)
+            return min(timeit.repeat(lote, number=1, repeat=options['repeticiones'])) / len(casos)
+
+        # Los resultados deben coincidir antes de comparar tiempos
+        diferencias = sum(
+            1 for caso in casos
+            if aplicar_reglas_decimal(*caso) != aplicar_reglas_enteros(*caso)
+        )
+        decimal_us = correr(aplicar_reglas_decimal) * 1e6
+        enteros_us = correr(aplicar_reglas_enteros) * 1e6
+
+        self.stdout.write(json.dumps({
+            'casos': len(casos),
+            'maximo_reglas': options['reglas'],
+            'diferencias': diferencias,
+            'decimal_us_por_caso': round(decimal_us, 3),
+            'enteros_us_por_caso': round(enteros_us, 3),
+            'aceleracion': round(decimal_us / enteros_us, 3) if enteros_us else None,
+        }, indent=2))
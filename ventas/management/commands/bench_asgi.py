@@ -0,0 +1,181 @@
+import asyncio
+import json
+import queue
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import Usuario
+from precios.models import ListaPrecio, PrecioArticulo
+from trading_system.choices import EstadoEntidades
+from ventas.cache_cotizaciones import invalidar_cotizaciones
+from ventas.management.commands.bench_pricing import _percentiles
+from ventas.sintetico import generar_catalogo
+
+ENDPOINTS = {
+    'calcular': ('calcular_precio_articulo', 'calcular_precio_articulo_async'),
+    'simular': ('orden-simular-pedido', 'simular_pedido_async'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga de las cotizaciones: throughput y latencia de la vista síncrona (WSGI, un hilo '
+        'por conexión concurrente) contra la asíncrona (ASGI, un solo event loop), en proceso y con JWT (salida JSON)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=list(ENDPOINTS), default='calcular')
+        parser.add_argument('--lista', dest='lista_precio_id', help='ID de la lista de precios a cotizar')
+        parser.add_argument('--usuario', help='Usuario con el que se autentican las solicitudes')
+        parser.add_argument('--generar', action='store_true',
+                            help='Crea (y deja guardado) un catálogo sintético con su lista y usuario')
+        parser.add_argument('--solicitudes', type=int, default=2000)
+        parser.add_argument('--concurrencia', type=int, default=50)
+        parser.add_argument('--lineas-pedido', type=int, default=10)
+        parser.add_argument('--semilla', type=int, default=2024)
+        parser.add_argument('--salida', help='Archivo donde guardar el JSON (por defecto stdout)')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+
+        if options['generar']:
+            # Las solicitudes usan sus propias conexiones: el catálogo debe quedar confirmado
+            catalogo = generar_catalogo(rnd)
+            lista = catalogo['listas'][0]
+            usuario = catalogo['usuario']
+            if options['endpoint'] == 'simular':
+                usuario.is_staff = True
+                usuario.save(update_fields=['is_staff'])
+        else:
+            if not options['lista_precio_id'] or not options['usuario']:
+                raise CommandError('Indica --lista y --usuario, o usa --generar')
+            lista = ListaPrecio.objects.filter(lista_precio_id=options['lista_precio_id']).first()
+            usuario = Usuario.objects.filter(username=options['usuario']).first()
+            if lista is None or usuario is None:
+                raise CommandError('Lista de precios o usuario no encontrados')
+
+        articulo_ids = [str(articulo_id) for articulo_id in PrecioArticulo.objects.filter(
+            lista_precio=lista, estado=EstadoEntidades.ACTIVO
+        ).values_list('articulo_id', flat=True)]
+        if not articulo_ids:
+            raise CommandError('La lista no tiene precios activos')
+
+        cuerpos = [self._cuerpo(rnd, options, lista, articulo_ids) for _ in range(options['solicitudes'])]
+        encabezados = {'Authorization': f'Bearer {AccessToken.for_user(usuario)}'}
+        url_wsgi, url_asgi = (reverse(nombre) for nombre in ENDPOINTS[options['endpoint']])
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            # Una solicitud previa por camino construye el índice de la lista
+            Client(headers=encabezados).post(url_wsgi, cuerpos[0], content_type='application/json')
+            # Cada camino arranca con la cache de cotizaciones vacía
+            invalidar_cotizaciones()
+            wsgi = self._wsgi(url_wsgi, cuerpos, encabezados, options['concurrencia'])
+            invalidar_cotizaciones()
+            asgi = asyncio.run(self._asgi(url_asgi, cuerpos, encabezados, options['concurrencia']))
+
+        resultado = {
+            'parametros': {
+                clave: options[clave] for clave in ('endpoint', 'solicitudes', 'concurrencia', 'lineas_pedido', 'semilla')
+            },
+            'lista_precio_id': str(lista.lista_precio_id),
+            'wsgi': wsgi,
+            'asgi': asgi,
+            'aceleracion': round(asgi['solicitudes_por_segundo'] / wsgi['solicitudes_por_segundo'], 2)
+            if wsgi['solicitudes_por_segundo'] else None,
+        }
+
+        salida = json.dumps(resultado, indent=2, default=str)
+        if options['salida']:
+            with open(options['salida'], 'w') as archivo:
+                archivo.write(salida)
+        else:
+            self.stdout.write(salida)
+
+    @staticmethod
+    def _cuerpo(rnd, options, lista, articulo_ids):
+        if options['endpoint'] == 'calcular':
+            return {
+                'articulo_id': rnd.choice(articulo_ids),
+                'lista_precio_id': str(lista.lista_precio_id),
+                'canal': lista.canal,
+                'cantidad': rnd.choice([1, 1, 2, 5, 10, 20, 50]),
+            }
+        return {
+            'lista_precio_id': str(lista.lista_precio_id),
+            'canal': lista.canal,
+            'detalles': [
+                {'articulo_id': articulo_id, 'cantidad': rnd.randint(1, 30)}
+                for articulo_id in rnd.sample(articulo_ids, min(options['lineas_pedido'], len(articulo_ids)))
+            ],
+        }
+
+    @staticmethod
+    def _resumen(muestras, errores, segundos):
+        return {
+            'segundos': round(segundos, 3),
+            'solicitudes_por_segundo': round(len(muestras) / segundos, 1) if segundos else None,
+            'errores': errores,
+            'latencia': _percentiles(muestras),
+        }
+
+    def _wsgi(self, url, cuerpos, encabezados, concurrencia):
+        pendientes = queue.Queue()
+        for cuerpo in cuerpos:
+            pendientes.put(cuerpo)
+        muestras = []
+        errores = []
+
+        def trabajador():
+            cliente = Client(headers=encabezados)
+            try:
+                while True:
+                    try:
+                        cuerpo = pendientes.get_nowait()
+                    except queue.Empty:
+                        return
+                    inicio = time.perf_counter_ns()
+                    respuesta = cliente.post(url, cuerpo, content_type='application/json')
+                    muestras.append(time.perf_counter_ns() - inicio)
+                    if respuesta.status_code != 200:
+                        errores.append(respuesta.status_code)
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=trabajador) for _ in range(concurrencia)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return self._resumen(muestras, len(errores), time.perf_counter() - inicio)
+
+    async def _asgi(self, url, cuerpos, encabezados, concurrencia):
+        # Los encabezados van por solicitud: AsyncClient(headers=...) los prefija dos veces con HTTP_
+        cliente = AsyncClient()
+        semaforo = asyncio.Semaphore(concurrencia)
+        muestras = []
+        errores = []
+
+        async def solicitar(cuerpo):
+            async with semaforo:
+                inicio = time.perf_counter_ns()
+                respuesta = await cliente.post(url, cuerpo, content_type='application/json', headers=encabezados)
+                muestras.append(time.perf_counter_ns() - inicio)
+                if respuesta.status_code != 200:
+                    errores.append(respuesta.status_code)
+
+        await solicitar(cuerpos[0])
+        muestras.clear()
+        errores.clear()
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(solicitar(cuerpo) for cuerpo in cuerpos))
+        return self._resumen(muestras, len(errores), time.perf_counter() - inicio)
@@ -0,0 +1,242 @@
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from precios.combos import evaluar_carrito, obtener_indice_combos
+from precios.indice import invalidar_indice, obtener_indice
+from precios.refresco import refrescar_precios_efectivos
+from productos.models import Articulo
+from trading_system.choices import CanalVenta, TipoRegla
+from ventas import vectorizado
+from ventas.cache_cotizaciones import invalidar_cotizaciones
+from ventas.serializers import OrdenWriteSerializer
+from ventas.sintetico import DENSIDAD_REGLAS, generar_catalogo
+from ventas.utils import calculate_order_prices, calculate_price
+
+
+def _percentiles(muestras_ns):
+    """Percentiles en microsegundos de una lista de tiempos en nanosegundos"""
+    if not muestras_ns:
+        return {}
+    ordenadas = sorted(muestras_ns)
+
+    def percentil(p):
+        return round(ordenadas[min(int(len(ordenadas) * p / 100), len(ordenadas) - 1)] / 1000, 2)
+
+    return {
+        'muestras': len(ordenadas),
+        'p50_us': percentil(50),
+        'p90_us': percentil(90),
+        'p99_us': percentil(99),
+        'max_us': round(ordenadas[-1] / 1000, 2),
+        'media_us': round(sum(ordenadas) / len(ordenadas) / 1000, 2),
+    }
+
+
+def _densidad(valor):
+    """Convierte 'GRUPO=20,ARTICULO=50' en {TipoRegla: cantidad} sobre la densidad por defecto"""
+    densidad = dict(DENSIDAD_REGLAS)
+    if not valor:
+        return densidad
+    for parte in valor.split(','):
+        nombre, _, cantidad = parte.partition('=')
+        try:
+            densidad[TipoRegla[nombre.strip().upper()]] = int(cantidad)
+        except (KeyError, ValueError):
+            raise CommandError(f'Densidad de reglas inválida: {parte}')
+    return densidad
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark del motor de precios sobre un catálogo sintético: latencia de cotización, '
+        'throughput de carritos, repricing de lista completa y creación de órdenes (salida JSON)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, default=5)
+        parser.add_argument('--grupos-por-linea', type=int, default=10)
+        parser.add_argument('--articulos-por-grupo', type=int, default=20)
+        parser.add_argument('--reglas', default='', help='Reglas por lista y tipo, ej: GRUPO=20,ARTICULO=50,MONTO_PEDIDO=2')
+        parser.add_argument('--combos', type=int, default=10, help='Combinaciones por lista')
+        parser.add_argument('--cotizaciones', type=int, default=2000, help='Cotizaciones individuales a medir')
+        parser.add_argument('--carritos', type=int, default=200)
+        parser.add_argument('--lineas-carrito', type=int, default=20)
+        parser.add_argument('--ordenes', type=int, default=20)
+        parser.add_argument('--semilla', type=int, default=2024)
+        parser.add_argument('--salida', help='Archivo donde guardar el JSON (por defecto stdout)')
+        parser.add_argument('--conservar', action='store_true', help='No deshacer el catálogo generado')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        resultado = {
+            'parametros': {
+                clave: options[clave] for clave in (
+                    'lineas', 'grupos_por_linea', 'articulos_por_grupo', 'reglas', 'combos',
+                    'cotizaciones', 'carritos', 'lineas_carrito', 'ordenes', 'semilla'
+                )
+            },
+            'configuracion': {
+                'precios_aritmetica': getattr(settings, 'PRECIOS_ARITMETICA', 'decimal'),
+                'cotizaciones_cache': getattr(settings, 'COTIZACIONES_CACHE', {}),
+                'numpy': vectorizado.np is not None,
+            },
+        }
+
+        with transaction.atomic():
+            inicio = time.perf_counter()
+            catalogo = generar_catalogo(
+                rnd,
+                lineas=options['lineas'],
+                grupos_por_linea=options['grupos_por_linea'],
+                articulos_por_grupo=options['articulos_por_grupo'],
+                densidad_reglas=_densidad(options['reglas']),
+                combos_por_lista=options['combos'],
+            )
+            lista = catalogo['listas'][0]
+            resultado['catalogo'] = {
+                'articulos': len(catalogo['articulos']),
+                'reglas_por_lista': {TipoRegla(tipo).name: cantidad for tipo, cantidad in _densidad(options['reglas']).items()},
+                'segundos_generacion': round(time.perf_counter() - inicio, 3),
+            }
+
+            articulos = list(Articulo.objects.select_related('grupo_id__linea').filter(
+                articulo_id__in=[articulo.articulo_id for articulo in catalogo['articulos']]
+            ))
+
+            resultado['cotizacion'] = self._cotizaciones(rnd, lista, articulos, options['cotizaciones'])
+            resultado['carritos'] = self._carritos(rnd, lista, articulos, options['carritos'], options['lineas_carrito'])
+            resultado['repricing'] = self._repricing(lista)
+            resultado['ordenes'] = self._ordenes(rnd, catalogo, articulos, options['ordenes'], options['lineas_carrito'])
+
+            if not options['conservar']:
+                transaction.set_rollback(True)
+
+        # Los índices del proceso quedarían apuntando a datos deshechos
+        invalidar_indice()
+        invalidar_cotizaciones()
+
+        salida = json.dumps(resultado, indent=2, default=str)
+        if options['salida']:
+            with open(options['salida'], 'w') as archivo:
+                archivo.write(salida)
+        else:
+            self.stdout.write(salida)
+
+    def _cotizaciones(self, rnd, lista, articulos, cantidad):
+        consultas = [
+            (rnd.choice(articulos), rnd.choice(CanalVenta.values), rnd.choice([1, 1, 2, 5, 10, 20, 50, 100]))
+            for _ in range(cantidad)
+        ]
+
+        invalidar_indice(lista.lista_precio_id)
+        inicio = time.perf_counter()
+        obtener_indice(lista)
+        indice_ms = (time.perf_counter() - inicio) * 1000
+
+        def medir():
+            muestras = []
+            for articulo, canal, unidades in consultas:
+                inicio = time.perf_counter_ns()
+                calculate_price(articulo, lista, canal, unidades)
+                muestras.append(time.perf_counter_ns() - inicio)
+            return _percentiles(muestras)
+
+        with override_settings(COTIZACIONES_CACHE={'HABILITADO': False}):
+            sin_cache = medir()
+        invalidar_cotizaciones(lista.lista_precio_id)
+        con_cache_fria = medir()
+        con_cache = medir()
+
+        return {
+            'construccion_indice_ms': round(indice_ms, 3),
+            'sin_cache': sin_cache,
+            'cache_fria': con_cache_fria,
+            'cache_caliente': con_cache,
+        }
+
+    def _carrito(self, rnd, articulos, lineas):
+        return [
+            {'articulo_id': articulo.articulo_id, 'cantidad': rnd.randint(1, 30)}
+            for articulo in rnd.sample(articulos, min(lineas, len(articulos)))
+        ]
+
+    def _carritos(self, rnd, lista, articulos, cantidad, lineas):
+        carritos = [self._carrito(rnd, articulos, lineas) for _ in range(cantidad)]
+        jerarquia = {
+            str(articulo.articulo_id): (articulo.grupo_id_id, articulo.grupo_id.linea_id) for articulo in articulos
+        }
+
+        muestras = []
+        inicio = time.perf_counter()
+        for carrito in carritos:
+            inicio_carrito = time.perf_counter_ns()
+            calculate_order_prices(carrito, lista, lista.canal)
+            muestras.append(time.perf_counter_ns() - inicio_carrito)
+        segundos = time.perf_counter() - inicio
+
+        indice_combos = obtener_indice_combos(lista)
+        inicio = time.perf_counter()
+        for carrito in carritos:
+            evaluar_carrito(indice_combos, [
+                (linea['articulo_id'], *jerarquia[str(linea['articulo_id'])], linea['cantidad']) for linea in carrito
+            ])
+        segundos_combos = time.perf_counter() - inicio
+
+        return {
+            'latencia_carrito': _percentiles(muestras),
+            'carritos_por_segundo': round(cantidad / segundos, 1) if segundos else None,
+            'lineas_por_segundo': round(cantidad * lineas / segundos, 1) if segundos else None,
+            'combos_carritos_por_segundo': round(cantidad / segundos_combos, 1) if segundos_combos else None,
+        }
+
+    def _repricing(self, lista):
+        resultado = {}
+
+        if vectorizado.np is not None:
+            inicio = time.perf_counter()
+            matriz = vectorizado.repreciar_lista(lista)
+            resultado['vectorizado'] = {
+                'segundos': round(time.perf_counter() - inicio, 3),
+                'celdas': int(matriz.precio_final.size),
+            }
+
+        inicio = time.perf_counter()
+        filas = refrescar_precios_efectivos(lista.lista_precio_id)
+        resultado['precios_efectivos'] = {
+            'segundos': round(time.perf_counter() - inicio, 3),
+            'filas': filas,
+        }
+        return resultado
+
+    def _ordenes(self, rnd, catalogo, articulos, cantidad, lineas):
+        lista = catalogo['listas'][0]
+        serializer = OrdenWriteSerializer()
+        muestras = []
+        consultas = []
+
+        for numero in range(cantidad):
+            datos = {
+                'cliente_id': catalogo['cliente'].cliente_id,
+                'vendedor_id': catalogo['usuario'].username,
+                'lista_precio_id': lista.lista_precio_id,
+                'empresa_id': catalogo['empresa'].empresa_id,
+                'sucursal_id': catalogo['sucursal'].sucursal_id,
+                'canal': lista.canal,
+                'detalles': self._carrito(rnd, articulos, lineas),
+            }
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter_ns()
+                serializer.create(datos)
+                muestras.append(time.perf_counter_ns() - inicio)
+            consultas.append(len(capturadas))
+
+        return {
+            'latencia_creacion': _percentiles(muestras),
+            'consultas_por_orden': max(consultas) if consultas else 0,
+        }
@@ -0,0 +1,153 @@
+import json
+import queue
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from productos.fraccionado import fraccionar_stock
+from productos.models import Articulo
+from trading_system.choices import EstadoOrden
+from ventas.management.commands.bench_pricing import _percentiles
+from ventas.models import OrdenCompraCliente
+from ventas.serializers import OrdenWriteSerializer
+from ventas.sintetico import generar_catalogo
+from ventas.views import OrdenViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de concurrencia de confirmar_orden sobre artículos calientes: confirmaciones por '
+        'segundo con el stock en la fila del artículo contra el stock fraccionado en slots (salida JSON)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ordenes', type=int, default=300, help='Órdenes a confirmar por modo')
+        parser.add_argument('--hilos', type=int, default=16, help='Confirmaciones concurrentes')
+        parser.add_argument('--calientes', type=int, default=2, help='Artículos presentes en todas las órdenes')
+        parser.add_argument('--slots', type=int, default=16)
+        parser.add_argument('--latencia-ms', type=float, default=1.0,
+                            help='Latencia simulada de ida y vuelta a la base de datos, por consulta')
+        parser.add_argument('--semilla', type=int, default=2024)
+        parser.add_argument('--salida', help='Archivo donde guardar el JSON (por defecto stdout)')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['semilla'])
+        # Las confirmaciones usan sus propias conexiones: los datos deben quedar confirmados
+        catalogo = generar_catalogo(rnd, lineas=1, grupos_por_linea=2, articulos_por_grupo=10,
+                                    densidad_reglas={}, combos_por_lista=0, prefijo='SK')
+        usuario = catalogo['usuario']
+        usuario.is_staff = True
+        usuario.save(update_fields=['is_staff'])
+
+        articulos = [articulo.articulo_id for articulo in catalogo['articulos']]
+        calientes = articulos[:options['calientes']]
+        frios = articulos[options['calientes']:]
+        Articulo.objects.filter(articulo_id__in=articulos).update(stock=options['ordenes'] * 10)
+
+        resultado = {
+            'parametros': {
+                clave: options[clave] for clave in ('ordenes', 'hilos', 'calientes', 'slots', 'latencia_ms', 'semilla')
+            },
+        }
+        for modo, slots in (('fila', 0), ('slots', options['slots'])):
+            for articulo_id in calientes:
+                fraccionar_stock(articulo_id, slots)
+            ordenes = self._ordenes(rnd, catalogo, calientes, frios, options['ordenes'])
+            inicial = self._stock(calientes)
+            resultado[modo] = self._confirmar(usuario, ordenes, options['hilos'], options['latencia_ms'] / 1000)
+            resultado[modo]['stock_consistente'] = (
+                inicial - self._stock(calientes) == resultado[modo]['confirmadas'] * len(calientes)
+            )
+            for articulo_id in calientes:
+                fraccionar_stock(articulo_id, 0)
+
+        resultado['aceleracion'] = round(
+            resultado['slots']['confirmaciones_por_segundo'] / resultado['fila']['confirmaciones_por_segundo'], 2
+        ) if resultado['fila']['confirmaciones_por_segundo'] else None
+
+        salida = json.dumps(resultado, indent=2, default=str)
+        if options['salida']:
+            with open(options['salida'], 'w') as archivo:
+                archivo.write(salida)
+        else:
+            self.stdout.write(salida)
+
+    @staticmethod
+    def _stock(articulo_ids):
+        return sum(articulo.stock_disponible for articulo in Articulo.objects.con_stock().filter(articulo_id__in=articulo_ids))
+
+    @staticmethod
+    def _ordenes(rnd, catalogo, calientes, frios, cantidad):
+        lista = catalogo['listas'][0]
+        serializer = OrdenWriteSerializer()
+        ordenes = []
+        with transaction.atomic():
+            for _ in range(cantidad):
+                detalles = [{'articulo_id': articulo_id, 'cantidad': 1} for articulo_id in calientes]
+                detalles += [{'articulo_id': articulo_id, 'cantidad': rnd.randint(1, 3)}
+                             for articulo_id in rnd.sample(frios, min(2, len(frios)))]
+                ordenes.append(serializer.create({
+                    'cliente_id': catalogo['cliente'].cliente_id,
+                    'vendedor_id': catalogo['usuario'].username,
+                    'lista_precio_id': lista.lista_precio_id,
+                    'empresa_id': catalogo['empresa'].empresa_id,
+                    'sucursal_id': catalogo['sucursal'].sucursal_id,
+                    'canal': lista.canal,
+                    'detalles': detalles,
+                }).pk)
+        return ordenes
+
+    @staticmethod
+    def _confirmar(usuario, ordenes, hilos, latencia):
+        vista = OrdenViewSet.as_view({'post': 'confirmar_orden'})
+        fabrica = APIRequestFactory()
+        pendientes = queue.Queue()
+        for orden_id in ordenes:
+            pendientes.put(orden_id)
+        muestras = []
+        estados = []
+
+        def retardo(execute, sql, params, many, context):
+            # Con la base de datos en la misma máquina el tiempo que se retienen los
+            # bloqueos es casi solo CPU; la latencia de red es la que los hace costosos
+            time.sleep(latencia)
+            return execute(sql, params, many, context)
+
+        def trabajador():
+            try:
+                with connection.execute_wrapper(retardo):
+                    while True:
+                        try:
+                            orden_id = pendientes.get_nowait()
+                        except queue.Empty:
+                            return
+                        request = fabrica.post(f'/api/ordenes/{orden_id}/confirmar/')
+                        force_authenticate(request, user=usuario)
+                        inicio = time.perf_counter_ns()
+                        respuesta = vista(request, pk=orden_id)
+                        muestras.append(time.perf_counter_ns() - inicio)
+                        estados.append(respuesta.status_code)
+            finally:
+                connections.close_all()
+
+        trabajadores = [threading.Thread(target=trabajador) for _ in range(hilos)]
+        inicio = time.perf_counter()
+        for hilo in trabajadores:
+            hilo.start()
+        for hilo in trabajadores:
+            hilo.join()
+        segundos = time.perf_counter() - inicio
+
+        confirmadas = estados.count(200)
+        return {
+            'segundos': round(segundos, 3),
+            'confirmadas': confirmadas,
+            'errores': len(estados) - confirmadas,
+            'confirmaciones_por_segundo': round(confirmadas / segundos, 1) if segundos else None,
+            'latencia': _percentiles(muestras),
+            'procesando': OrdenCompraCliente.objects.filter(pk__in=ordenes, estado=EstadoOrden.PROCESANDO).count(),
+        }
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ventas.idempotencia import purgar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Elimina las claves de idempotencia vencidas de la creación de órdenes (ejecutar periódicamente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float,
+                            help='Segundos entre pasadas; sin este parámetro hace una sola pasada')
+
+    def handle(self, *args, **options):
+        while True:
+            self.stdout.write(f'{purgar_vencidas()} claves de idempotencia vencidas eliminadas')
+            if not options['intervalo']:
+                return
+            time.sleep(options['intervalo'])
@@ -1,10 +1,19 @@
-from django.db import models
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce
 
 from trading_system.choices import *
+from ventas.numeracion import siguiente_numero
+
+CAMPOS_TOTALES = ['subtotal', 'descuento_total', 'total']
 
 
 class OrdenCompraCliente(models.Model):
     orden_compra_cliente_id = models.UUIDField(primary_key=True)
+    # Se asigna al guardar una orden nueva (ver ventas.numeracion)
     numero_orden = models.BigIntegerField(unique=True, null=False, auto_created=True)
     fecha_orden = models.DateField(auto_now_add=True, null=False)
     empresa = models.ForeignKey('core.Empresa', on_delete=models.RESTRICT, null=False, related_name='ordenes_compra_cliente_empresa')
@@ -18,14 +27,54 @@ class OrdenCompraCliente(models.Model):
     total = models.DecimalField(max_digits=10, decimal_places=2, null=False, default=0)
     estado = models.IntegerField(choices=EstadoOrden, default=EstadoOrden.PENDIENTE, null=False)
 
+    def asignar_totales(self, detalles):
+        """
+        Calcula los totales a partir de las líneas en memoria, sin consultar ni guardar.
+        El subtotal es el precio de los items sin los descuentos de las reglas.
+        """
+        self.subtotal = sum((d.cantidad * d.precio_base for d in detalles), Decimal('0.00'))
+        self.descuento_total = sum((d.descuento for d in detalles), Decimal('0.00'))
+        self.total = sum((d.cantidad * d.precio_unitario for d in detalles), Decimal('0.00'))
+
+    def recalcular_totales(self):
+        """Recalcula los totales desde las líneas guardadas (una consulta) y los guarda"""
+        totales = self.detalles_orden_compra_cliente.aggregate(
+            subtotal=Coalesce(Sum(F('cantidad') * F('precio_base')), 0, output_field=DecimalField()),
+            descuento_total=Coalesce(Sum('descuento'), 0, output_field=DecimalField()),
+            total=Coalesce(Sum(F('cantidad') * F('precio_unitario')), 0, output_field=DecimalField()),
+        )
+        for campo in CAMPOS_TOTALES:
+            setattr(self, campo, totales[campo])
+        self.save(update_fields=CAMPOS_TOTALES)
+
+    def save(self, *args, **kwargs):
+        if self.numero_orden is None:
+            self.numero_orden = siguiente_numero(kwargs.get('using') or router.db_for_write(type(self), instance=self))
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Orden {self.numero_orden} - Cliente: {self.cliente.nombre_completo}"
 
     class Meta:
         db_table = 'ordenes_compra_cliente'
         ordering = ['-fecha_orden']
+        indexes = [
+            # Orden de la paginación por keyset (OrdenViewSet.ordering_keyset)
+            models.Index(fields=['-fecha_orden', '-orden_compra_cliente_id'], name='orden_fecha_keyset_idx'),
+        ]
 
 class DetalleOrdenCompraCliente(models.Model):
+    """
+    Línea de una orden. Contrato de los totales de la orden:
+
+    - save() y delete() de una línea recalculan los totales de su orden desde
+      la base de datos (una consulta y un UPDATE), salvo con actualizar_orden=False.
+    - bulk_create, bulk_update y los delete() de QuerySet no tocan la orden: quien
+      los usa asigna los totales una sola vez (OrdenCompraCliente.asignar_totales
+      con las líneas en memoria, o recalcular_totales) y guarda la orden.
+    - total_item se calcula en save(); en las escrituras masivas lo asigna quien
+      arma la línea con calcular_total_item().
+    """
     detalle_orden_compra_cliente_id = models.UUIDField(primary_key=True)
     orden_compra_cliente = models.ForeignKey(OrdenCompraCliente, on_delete=models.RESTRICT, null=False, related_name='detalles_orden_compra_cliente')
     articulo = models.ForeignKey('productos.Articulo', on_delete=models.RESTRICT, null=False)
@@ -37,20 +86,74 @@ class DetalleOrdenCompraCliente(models.Model):
     vendido_bajo_costo = models.BooleanField(default=False)
     total_item = models.DecimalField(max_digits=10, decimal_places=2, null=False)
 
-    def save(self, *args, **kwargs):
-        # Calcular el total del item
+    def calcular_total_item(self):
         self.total_item = (self.cantidad * self.precio_unitario) - self.descuento
+
+    def save(self, *args, actualizar_orden=True, **kwargs):
+        self.calcular_total_item()
         super().save(*args, **kwargs)
 
-        # Actualizar el total de la orden
-        self.orden_compra_cliente.subtotal += self.cantidad * self.precio_unitario
-        self.orden_compra_cliente.descuento_total += self.descuento
-        self.orden_compra_cliente.total = self.orden_compra_cliente.subtotal - self.orden_compra_cliente.descuento_total
-        self.orden_compra_cliente.save()
+        # Recalcular (no acumular) los totales: volver a guardar una línea no los duplica
+        if actualizar_orden:
+            self.orden_compra_cliente.recalcular_totales()
+
+    def delete(self, *args, actualizar_orden=True, **kwargs):
+        resultado = super().delete(*args, **kwargs)
+        if actualizar_orden:
+            self.orden_compra_cliente.recalcular_totales()
+        return resultado
 
     def __str__(self):
         return f"{self.cantidad} x {self.articulo.descripcion}"
 
     class Meta:
         db_table = "detalles_ordenes_compra_cliente"
-        ordering = ['-detalle_orden_compra_cliente_id']
\ No newline at end of file
+        ordering = ['-detalle_orden_compra_cliente_id']
+
+
+class RetencionStock(models.Model):
+    """Stock retenido por una orden PENDIENTE hasta que vence (ver ventas.retenciones)"""
+    retencion_stock_id = models.BigAutoField(primary_key=True)
+    orden_compra_cliente = models.ForeignKey(OrdenCompraCliente, on_delete=models.CASCADE, null=False,
+                                             related_name='retenciones_stock')
+    articulo = models.ForeignKey('productos.Articulo', on_delete=models.CASCADE, null=False,
+                                 related_name='retenciones_stock')
+    sucursal = models.ForeignKey('core.Sucursal', on_delete=models.RESTRICT, null=False)
+    cantidad = models.PositiveIntegerField(null=False)
+    vence = models.DateTimeField(null=False)
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.articulo_id} hasta {self.vence}"
+
+    class Meta:
+        db_table = "retenciones_stock"
+        unique_together = ('orden_compra_cliente', 'articulo')
+        indexes = [
+            # Suma de las retenciones vigentes de un artículo solo desde el índice
+            models.Index(fields=['articulo', 'vence'], include=['sucursal', 'cantidad'],
+                         name='retencion_art_vence_idx'),
+            models.Index(fields=['vence'], name='retencion_vence_idx'),
+        ]
+
+
+class ClaveIdempotencia(models.Model):
+    """Resultado de un POST /api/ordenes/ con Idempotency-Key, hasta que vence (ver ventas.idempotencia)"""
+    clave_idempotencia_id = models.BigAutoField(primary_key=True)
+    usuario = models.ForeignKey('accounts.Usuario', on_delete=models.CASCADE, null=False)
+    clave = models.CharField(max_length=100, null=False)
+    # sha256 del contenido de la solicitud
+    huella = models.CharField(max_length=64, null=False)
+    # Cuerpo de la respuesta enviada, que se repite tal cual en los reintentos
+    respuesta = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    orden_compra_cliente = models.ForeignKey(OrdenCompraCliente, on_delete=models.CASCADE, null=True, blank=True)
+    vence = models.DateTimeField(null=False)
+
+    def __str__(self):
+        return f"{self.usuario_id}: {self.clave}"
+
+    class Meta:
+        db_table = "claves_idempotencia"
+        unique_together = ('usuario', 'clave')
+        indexes = [
+            models.Index(fields=['vence'], name='idempotencia_vence_idx'),
+        ]
@@ -0,0 +1,78 @@
+"""
+Numeración de las órdenes (OrdenCompraCliente.numero_orden).
+
+Los números salen de una secuencia de Postgres. nextval no participa de la
+transacción que lo llama: dos órdenes creadas a la vez nunca se esperan ni
+obtienen el mismo número, y no hace falta bloquear la tabla ni reintentar
+ante violaciones de unicidad. El costo es que los números de las órdenes
+revertidas quedan sin usar (puede haber saltos).
+
+Cada proceso pide los números de a bloques (NUMERACION_ORDENES_BLOQUE) en una
+sola consulta y los entrega desde memoria, así que la numeración es única pero
+no estrictamente creciente entre procesos.
+
+La secuencia no es un modelo: crear_secuencia la crea (o la adelanta hasta el
+mayor número existente) después de cada migrate, con la señal post_migrate.
+"""
+import os
+import threading
+from collections import deque
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+SECUENCIA = 'ordenes_compra_cliente_numero_seq'
+
+
+def crear_secuencia(using='default', **kwargs):
+    """Crea la secuencia si no existe y la adelanta hasta el mayor numero_orden guardado"""
+    connection = connections[using]
+    tabla = apps.get_model('ventas', 'OrdenCompraCliente')._meta.db_table
+    if tabla not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SECUENCIA}')
+        # Fija el próximo número (is_called = false): el mayor entre el siguiente al
+        # último guardado y el que la secuencia iba a entregar. Una secuencia recién
+        # creada entrega 1 (last_value 1 sin usar) y una tabla vacía no la adelanta
+        cursor.execute(
+            f'SELECT setval(%s, GREATEST((SELECT COALESCE(MAX(numero_orden), 0) + 1 FROM {connection.ops.quote_name(tabla)}), '
+            f'(SELECT last_value + is_called::int FROM {SECUENCIA})), false)',
+            [SECUENCIA]
+        )
+
+
+class Numerador:
+    """Entrega números de la secuencia pidiéndolos de a bloques; seguro entre hilos"""
+
+    def __init__(self, bloque=None):
+        self.bloque = bloque
+        self._lock = threading.Lock()
+        self._pendientes = {}
+        self._pid = os.getpid()
+
+    def _pedir_bloque(self, using):
+        bloque = self.bloque or getattr(settings, 'NUMERACION_ORDENES_BLOQUE', 20)
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [SECUENCIA, bloque])
+            return deque(numero for numero, in cursor.fetchall())
+
+    def siguiente(self, using='default'):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Un proceso hijo (fork) no puede usar los números que heredó del padre
+                self._pendientes = {}
+                self._pid = os.getpid()
+            pendientes = self._pendientes.get(using)
+            if not pendientes:
+                pendientes = self._pendientes[using] = self._pedir_bloque(using)
+            return pendientes.popleft()
+
+
+_numerador = Numerador()
+
+
+def siguiente_numero(using='default'):
+    """Próximo numero_orden para una orden nueva"""
+    return _numerador.siguiente(using)
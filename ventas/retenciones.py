@@ -0,0 +1,95 @@
+"""
+Retenciones blandas de stock de las órdenes PENDIENTE.
+
+Al crear o actualizar una orden se retienen las cantidades de sus líneas hasta
+que vence el plazo (RETENCION_STOCK_MINUTOS, se renueva con cada
+actualización). Las retenciones no descuentan stock ni impiden confirmar otras
+órdenes: restan del disponible para prometer (disponibles), de modo que el
+vendedor sabe antes de confirmar si el stock alcanza. Se eliminan al confirmar
+o anular la orden, y las vencidas con purgar_vencidas (comando
+purgar_retenciones, para ejecutar periódicamente).
+
+La suma de las retenciones vigentes se resuelve desde el índice
+(articulo, vence) que incluye sucursal y cantidad.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from ventas.models import RetencionStock
+from ventas.stock import cantidades_por_articulo, libro_activo, stock_actual
+
+
+def _vencimiento():
+    """Fecha y hora en que vencen las retenciones creadas ahora"""
+    return timezone.now() + timedelta(minutes=getattr(settings, 'RETENCION_STOCK_MINUTOS', 60))
+
+
+def retener(orden, detalles=None):
+    """
+    Reemplaza las retenciones de la orden por las cantidades de sus líneas,
+    con un nuevo vencimiento. Sin detalles, lee las líneas guardadas.
+    """
+    if detalles is None:
+        cantidades = cantidades_por_articulo(orden)
+    else:
+        cantidades = defaultdict(int)
+        for detalle in detalles:
+            cantidades[str(detalle.articulo_id)] += detalle.cantidad
+
+    vence = _vencimiento()
+    RetencionStock.objects.filter(orden_compra_cliente=orden).delete()
+    return RetencionStock.objects.bulk_create([
+        RetencionStock(orden_compra_cliente=orden, articulo_id=articulo_id, sucursal_id=orden.sucursal_id,
+                       cantidad=cantidad, vence=vence)
+        for articulo_id, cantidad in sorted(cantidades.items())
+        if cantidad > 0
+    ])
+
+
+def liberar_retenciones(orden):
+    """Elimina las retenciones de la orden (al confirmarla o anularla)"""
+    return RetencionStock.objects.filter(orden_compra_cliente=orden).delete()[0]
+
+
+def purgar_vencidas(ahora=None):
+    """Elimina las retenciones vencidas y retorna cuántas eran"""
+    return RetencionStock.objects.filter(vence__lte=ahora or timezone.now()).delete()[0]
+
+
+def retenido(articulo_ids, sucursal_id=None):
+    """Cantidad retenida vigente de cada artículo, en una consulta: articulo_id (str) -> cantidad"""
+    retenciones = RetencionStock.objects.filter(articulo_id__in=list(articulo_ids), vence__gt=timezone.now())
+    if sucursal_id is not None:
+        retenciones = retenciones.filter(sucursal_id=sucursal_id)
+    return {
+        str(articulo_id): cantidad
+        for articulo_id, cantidad in retenciones.values_list('articulo_id').annotate(
+            cantidad=Sum('cantidad')
+        ).order_by()
+    }
+
+
+def disponibles(articulo_ids, sucursal_id=None):
+    """
+    Disponible para prometer de cada artículo: su stock menos las retenciones
+    vigentes. Con el libro de stock se calcula en la sucursal (requerida); sin
+    él, el stock es del artículo y se restan las retenciones de todas las sucursales.
+
+    Returns:
+        dict: articulo_id (str) -> {'stock', 'retenido', 'disponible'}.
+            Los artículos inexistentes no aparecen.
+    """
+    stock = stock_actual(articulo_ids, sucursal_id)
+    retenidas = retenido(stock, sucursal_id if libro_activo() else None) if stock else {}
+    return {
+        articulo_id: {
+            'stock': cantidad,
+            'retenido': retenidas.get(articulo_id, 0),
+            'disponible': cantidad - retenidas.get(articulo_id, 0),
+        }
+        for articulo_id, cantidad in stock.items()
+    }
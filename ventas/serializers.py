@@ -1,7 +1,7 @@
+import uuid
+
 from rest_framework import serializers
 from django.db import transaction
-from django.db.models import Sum, F, DecimalField
-from django.db.models.functions import Coalesce
 
 from ventas.models import OrdenCompraCliente, DetalleOrdenCompraCliente
 from productos.models import Articulo
@@ -10,7 +10,8 @@ from precios.models import ListaPrecio
 from accounts.models import Usuario
 from core.models import Empresa, Sucursal
 from trading_system.choices import EstadoOrden, CanalVenta
-from .utils import calculate_price
+from .retenciones import retener
+from .utils import calculate_order_prices
 
 
 class ArticuloSerializer(serializers.ModelSerializer):
@@ -40,13 +41,13 @@ class ListaPrecioSerializer(serializers.ModelSerializer):
 class EmpresaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Empresa
-        fields = ['empresa_id', 'nombre']
+        fields = ['empresa_id', 'razon_social']
 
 
 class SucursalSerializer(serializers.ModelSerializer):
     class Meta:
         model = Sucursal
-        fields = ['sucursal_id', 'nombre']
+        fields = ['sucursal_id', 'nombre_sucursal']
 
 
 class OrdenDetalleReadSerializer(serializers.ModelSerializer):
@@ -93,8 +94,8 @@ class OrdenWriteSerializer(serializers.ModelSerializer):
     cliente_id = serializers.UUIDField(write_only=True)
     vendedor_id = serializers.CharField(max_length=25, write_only=True)
     lista_precio_id = serializers.UUIDField(write_only=True)
-    empresa_id = serializers.UUIDField(write_only=True)
-    sucursal_id = serializers.UUIDField(write_only=True)
+    empresa_id = serializers.IntegerField(write_only=True)
+    sucursal_id = serializers.IntegerField(write_only=True)
     canal = serializers.ChoiceField(choices=CanalVenta.choices, write_only=True)
 
     class Meta:
@@ -108,23 +109,30 @@ class OrdenWriteSerializer(serializers.ModelSerializer):
             'descuento_total', 'total', 'estado'
         ]
 
-    def _recalculate_and_save_totals(self, orden):
-        # Usamos F() para referenciar campos del modelo en la agregación
-        aggregates = orden.detalles_orden_compra_cliente.aggregate(
-            total_general=Coalesce(Sum(F('cantidad') * F('precio_unitario')), 0, output_field=DecimalField()),
-            total_descuento_items=Coalesce(Sum('descuento'), 0, output_field=DecimalField())
-        )
-
-        # El subtotal es el precio de los items sin descuentos de reglas
-        subtotal_calculado = orden.detalles_orden_compra_cliente.aggregate(
-            total=Coalesce(Sum(F('cantidad') * F('precio_base')), 0, output_field=DecimalField())
-        )['total']
-
-        orden.subtotal = subtotal_calculado
-        orden.descuento_total = aggregates['total_descuento_items']
-        orden.total = aggregates['total_general']
-
-        orden.save(update_fields=['subtotal', 'descuento_total', 'total'])
+    def _precios_pedido(self, detalles_data, lista_precio, canal):
+        pedido = calculate_order_prices(detalles_data, lista_precio, canal)
+        if "error" in pedido:
+            raise serializers.ValidationError(pedido["error"])
+        return pedido["lineas"]
+
+    @staticmethod
+    def _asignar_precio(detalle, price_data):
+        detalle.cantidad = price_data["cantidad"]
+        detalle.precio_base = price_data["precio_base"]
+        detalle.precio_unitario = price_data["precio_final"]
+        detalle.descuento = price_data["descuento_total"]
+        detalle.reglas_aplicadas = price_data["reglas_aplicadas"]
+        detalle.vendido_bajo_costo = price_data["vendido_bajo_costo"]
+        # bulk_create/bulk_update no invocan DetalleOrdenCompraCliente.save
+        detalle.calcular_total_item()
+        return detalle
+
+    def _nuevo_detalle(self, orden, price_data):
+        return self._asignar_precio(DetalleOrdenCompraCliente(
+            detalle_orden_compra_cliente_id=uuid.uuid4(),
+            orden_compra_cliente=orden,
+            articulo=price_data["articulo"],
+        ), price_data)
 
     @transaction.atomic
     def create(self, validated_data):
@@ -141,7 +149,8 @@ class OrdenWriteSerializer(serializers.ModelSerializer):
                 Sucursal.DoesNotExist) as e:
             raise serializers.ValidationError(f"Error al encontrar una entidad relacionada: {e}")
 
-        orden = OrdenCompraCliente.objects.create(
+        orden = OrdenCompraCliente(
+            orden_compra_cliente_id=uuid.uuid4(),
             cliente=cliente,
             vendedor=vendedor,
             lista_precio=lista_precio,
@@ -151,36 +160,16 @@ class OrdenWriteSerializer(serializers.ModelSerializer):
             **validated_data
         )
 
-        for detalle_data in detalles_data:
-            articulo_id = detalle_data['articulo_id']
-            cantidad = detalle_data['cantidad']
-            try:
-                articulo = Articulo.objects.get(articulo_id=articulo_id)
-            except Articulo.DoesNotExist:
-                raise serializers.ValidationError(f"Artículo con ID {articulo_id} no encontrado.")
-
-            price_data = calculate_price(
-                articulo=articulo,
-                lista_precio=lista_precio,
-                canal=canal,
-                cantidad=cantidad
-            )
-
-            if "error" in price_data:
-                raise serializers.ValidationError(price_data["error"])
-
-            DetalleOrdenCompraCliente.objects.create(
-                orden_compra_cliente=orden,
-                articulo=articulo,
-                cantidad=cantidad,
-                precio_base=price_data["precio_base"],
-                precio_unitario=price_data["precio_final"],
-                descuento=price_data["descuento_total"],
-                reglas_aplicadas=price_data["reglas_aplicadas"],
-                vendido_bajo_costo=price_data["vendido_bajo_costo"],
-            )
-
-        self._recalculate_and_save_totals(orden)
+        # Las líneas y los totales se calculan en memoria: la orden se inserta ya
+        # con sus totales y las líneas van en un solo bulk_create
+        detalles = [
+            self._nuevo_detalle(orden, price_data)
+            for price_data in self._precios_pedido(detalles_data, lista_precio, canal)
+        ]
+        orden.asignar_totales(detalles)
+        orden.save(force_insert=True)
+        DetalleOrdenCompraCliente.objects.bulk_create(detalles)
+        retener(orden, detalles)
         return orden
 
     @transaction.atomic
@@ -204,7 +193,6 @@ class OrdenWriteSerializer(serializers.ModelSerializer):
         instance.empresa_id = validated_data.get('empresa_id', instance.empresa_id)
         instance.sucursal_id = validated_data.get('sucursal_id', instance.sucursal_id)
         instance.canal = canal
-        instance.save()
 
         if detalles_data is not None:
             existing_details = {str(d.detalle_orden_compra_cliente_id): d for d in
@@ -215,49 +203,29 @@ class OrdenWriteSerializer(serializers.ModelSerializer):
             if ids_to_delete:
                 DetalleOrdenCompraCliente.objects.filter(detalle_orden_compra_cliente_id__in=ids_to_delete).delete()
 
-            for item_data in detalles_data:
+            nuevos = []
+            actualizados = []
+            precios = self._precios_pedido(detalles_data, lista_precio, canal)
+            for item_data, price_data in zip(detalles_data, precios):
                 item_id = item_data.get('id')
-                articulo_id = item_data['articulo_id']
-                cantidad = item_data['cantidad']
-
-                try:
-                    articulo = Articulo.objects.get(articulo_id=articulo_id)
-                except Articulo.DoesNotExist:
-                    raise serializers.ValidationError(f"Artículo con ID {articulo_id} no encontrado.")
-
-                price_data = calculate_price(
-                    articulo=articulo,
-                    lista_precio=lista_precio,
-                    canal=canal,
-                    cantidad=cantidad
-                )
-
-                if "error" in price_data:
-                    raise serializers.ValidationError(price_data["error"])
-
                 if item_id:
                     detail = existing_details.get(str(item_id))
                     if detail:
-                        detail.cantidad = cantidad
-                        detail.precio_base = price_data["precio_base"]
-                        detail.precio_unitario = price_data["precio_final"]
-                        detail.descuento = price_data["descuento_total"]
-                        detail.reglas_aplicadas = price_data["reglas_aplicadas"]
-                        detail.vendido_bajo_costo = price_data["vendido_bajo_costo"]
-                        detail.save()
+                        actualizados.append(self._asignar_precio(detail, price_data))
                 else:
-                    DetalleOrdenCompraCliente.objects.create(
-                        orden_compra_cliente=instance,
-                        articulo=articulo,
-                        cantidad=cantidad,
-                        precio_base=price_data["precio_base"],
-                        precio_unitario=price_data["precio_final"],
-                        descuento=price_data["descuento_total"],
-                        reglas_aplicadas=price_data["reglas_aplicadas"],
-                        vendido_bajo_costo=price_data["vendido_bajo_costo"],
-                    )
-
-        self._recalculate_and_save_totals(instance)
+                    nuevos.append(self._nuevo_detalle(instance, price_data))
+
+            DetalleOrdenCompraCliente.objects.bulk_update(actualizados, [
+                'cantidad', 'precio_base', 'precio_unitario', 'descuento',
+                'reglas_aplicadas', 'vendido_bajo_costo', 'total_item'
+            ])
+            DetalleOrdenCompraCliente.objects.bulk_create(nuevos)
+            # Las líneas de la orden son exactamente las actualizadas más las nuevas
+            instance.asignar_totales(actualizados + nuevos)
+
+        instance.save()
+        # Cada actualización renueva el vencimiento (y la sucursal) de las retenciones
+        retener(instance, actualizados + nuevos if detalles_data is not None else None)
         return instance
 
 
@@ -0,0 +1,225 @@
+"""
+Datos sintéticos para pruebas de paridad y benchmarks del cálculo de precios:
+casos para aplicar_reglas y un catálogo completo en la base de datos.
+"""
+import uuid
+from datetime import date
+from decimal import Decimal
+
+from accounts.models import Usuario
+from clientes.models import Cliente
+from core.intervalos import invalidar_vigencias
+from core.models import Empresa, Sucursal
+from precios.combos import invalidar_indice_combos
+from precios.indice import ReglaCompilada, invalidar_indice
+from precios.models import (
+    CombinacionProducto, DetalleCombinacionProducto, ListaPrecio, PrecioArticulo, ReglaPrecio
+)
+from productos.models import Articulo, GrupoArticulo, LineaArticulo
+from trading_system.choices import (
+    AccesoSistema, CanalVenta, EstadoEntidades, Moneda, Tipo, TipoBeneficio, TipoDescuento, TipoItem, TipoRegla
+)
+from ventas.cache_cotizaciones import invalidar_cotizaciones
+
+
+def _monto(rnd, maximo_centavos):
+    return Decimal(rnd.randint(0, maximo_centavos)).scaleb(-2)
+
+
+def regla_aleatoria(rnd, prioridad):
+    """ReglaCompilada con un descuento al azar (incluye tipos que no descuentan)"""
+    tipo_descuento = rnd.choice([TipoDescuento.PORCENTAJE, TipoDescuento.PORCENTAJE, TipoDescuento.MONTO_FIJO, 0])
+    if tipo_descuento == TipoDescuento.PORCENTAJE:
+        valor = _monto(rnd, rnd.choice([100, 10000, 99999]))
+    else:
+        valor = _monto(rnd, rnd.choice([100, 100000, 99999999]))
+    hoy = date.today()
+    return ReglaCompilada(
+        prioridad=prioridad,
+        codigo=f'S{prioridad:04d}',
+        regla_precio_id=str(prioridad),
+        tipo_regla=TipoRegla.ARTICULO,
+        tipo_descuento=tipo_descuento,
+        valor_descuento=valor,
+        aplica_canal=None,
+        cantidad_minima=None,
+        monto_minimo=None,
+        articulo_id=None,
+        grupo_id=None,
+        linea_id=None,
+        fecha_inicio=hoy,
+        fecha_fin=hoy,
+        descripcion=f'Regla sintética {prioridad}',
+    )
+
+
+def casos_aritmetica(rnd, cantidad, maximo_reglas=12):
+    """
+    Genera argumentos (precio_base, precio_minimo, costo_actual, reglas) para
+    aplicar_reglas. Mezcla precios chicos y grandes, mínimos por encima del
+    base y costos float, y suficientes reglas para forzar el redondeo a la
+    precisión de Decimal.
+    """
+    for _ in range(cantidad):
+        precio_base = _monto(rnd, rnd.choice([100, 100000, 9999999999]))
+        if rnd.random() < 0.8:
+            precio_minimo = _monto(rnd, int(precio_base * 100))
+        else:
+            precio_minimo = _monto(rnd, 10 ** 12)
+        costo_actual = _monto(rnd, 10 ** 10) if rnd.random() < 0.9 else rnd.random() * 1000
+        reglas = [regla_aleatoria(rnd, i) for i in range(rnd.randint(0, maximo_reglas))]
+        yield precio_base, precio_minimo, costo_actual, reglas
+
+
+# Reglas por lista y por tipo que genera generar_catalogo por defecto
+DENSIDAD_REGLAS = {
+    TipoRegla.CANAL: 5,
+    TipoRegla.ESCALA_CANTIDAD: 20,
+    TipoRegla.ESCALA_MONTO: 3,
+    TipoRegla.LINEA: 5,
+    TipoRegla.GRUPO: 20,
+    TipoRegla.ARTICULO: 50,
+    TipoRegla.MONTO_PEDIDO: 2,
+}
+
+
+def generar_catalogo(rnd, lineas=5, grupos_por_linea=10, articulos_por_grupo=20, listas=1,
+                     densidad_reglas=None, combos_por_lista=10, prefijo='SB'):
+    """
+    Crea un catálogo sintético con bulk_create: empresa, sucursal, usuario,
+    cliente, líneas, grupos, artículos, listas de precios con precio para todos
+    los artículos, reglas por TipoRegla según densidad_reglas (cantidad por
+    lista) y combinaciones de dos o tres detalles.
+
+    Como bulk_create no dispara signals, invalida los índices y la cache de
+    cotizaciones al terminar. Los códigos llevan el prefijo para no chocar con
+    datos existentes.
+
+    Returns:
+        dict: Con las claves empresa, sucursal, usuario, cliente, articulos y listas.
+    """
+    densidad_reglas = DENSIDAD_REGLAS if densidad_reglas is None else densidad_reglas
+    hoy = date.today()
+    sufijo = f'{rnd.randrange(10 ** 6):06d}'
+
+    empresa = Empresa.objects.create(ruc=f'20{sufijo}{rnd.randrange(1000):03d}', razon_social=f'Empresa {prefijo}{sufijo}')
+    sucursal = Sucursal.objects.create(codigo_sucursal=f'{prefijo}{sufijo}', nombre_sucursal='Sucursal sintética', empresa=empresa)
+    usuario = Usuario.objects.create_user(
+        username=f'{prefijo.lower()}{sufijo}', password=uuid.uuid4().hex, first_name='Bench', last_name='Sintetico',
+        email=f'{prefijo.lower()}{sufijo}@example.com', celular=sufijo, sucursal=sucursal, perfil=AccesoSistema.VENDEDOR
+    )
+    cliente = Cliente.objects.create(
+        nro_documento=f'{prefijo}{sufijo}', nombre_comercial='Cliente sintético',
+        razon_social='Cliente sintético', canal=CanalVenta.B2B
+    )
+
+    lineas_obj = [
+        LineaArticulo(linea_id=uuid.uuid4(), codigo_linea=f'{prefijo}L{i:03d}', nombre_linea=f'Línea {i}')
+        for i in range(lineas)
+    ]
+    LineaArticulo.objects.bulk_create(lineas_obj)
+
+    grupos = [
+        GrupoArticulo(grupo_id=uuid.uuid4(), codigo_grupo=f'G{i:04d}'[:5], nombre_grupo=f'Grupo {i}', linea=linea)
+        for i, linea in enumerate(linea for linea in lineas_obj for _ in range(grupos_por_linea))
+    ]
+    GrupoArticulo.objects.bulk_create(grupos)
+
+    articulos = []
+    for grupo in grupos:
+        for _ in range(articulos_por_grupo):
+            costo = _monto(rnd, 50000)
+            articulos.append(Articulo(
+                articulo_id=uuid.uuid4(), codigo_articulo=f'A{len(articulos):07d}', descripcion=f'Artículo {len(articulos)}',
+                stock=rnd.randint(0, 1000), unidad_medida='UND', costo_actual=costo,
+                precio_sugerido=costo * 2, grupo_id=grupo
+            ))
+    Articulo.objects.bulk_create(articulos, batch_size=1000)
+
+    listas_obj = []
+    for numero in range(listas):
+        lista = ListaPrecio.objects.create(
+            lista_precio_id=uuid.uuid4(), empresa=empresa, sucursal=sucursal, codigo=f'{prefijo[:2]}{sufijo}{numero:02d}',
+            nombre=f'Lista sintética {numero}', tipo=Tipo.MAYORISTA, canal=CanalVenta.B2B, tipo_moneda=Moneda.SOL,
+            modificado_por=usuario, fecha_vigencia_inicio=hoy, fecha_vigencia_fin=hoy
+        )
+        listas_obj.append(lista)
+
+        precios = []
+        for articulo in articulos:
+            precio_base = (articulo.costo_actual * Decimal(rnd.uniform(1.1, 2.5))).quantize(Decimal('0.01'))
+            precios.append(PrecioArticulo(
+                precio_articulo_id=uuid.uuid4(), lista_precio=lista, articulo=articulo, precio_base=precio_base,
+                precio_minimo=(precio_base * Decimal('0.7')).quantize(Decimal('0.01')), estado=EstadoEntidades.ACTIVO
+            ))
+        PrecioArticulo.objects.bulk_create(precios, batch_size=1000)
+
+        reglas = []
+        for tipo_regla, cantidad in densidad_reglas.items():
+            for _ in range(cantidad):
+                regla = ReglaPrecio(
+                    regla_precio_id=uuid.uuid4(), codigo=f'{sufijo[-3:]}{numero:01d}{len(reglas):05d}'[-10:], lista_precio=lista,
+                    tipo_regla=tipo_regla, prioridad=rnd.randint(1, 10),
+                    tipo_descuento=rnd.choice([TipoDescuento.PORCENTAJE, TipoDescuento.PORCENTAJE, TipoDescuento.MONTO_FIJO]),
+                    valor_descuento=_monto(rnd, 1500), fecha_inicio=hoy, fecha_fin=hoy,
+                    descripcion=f'Regla sintética {TipoRegla(tipo_regla).label} {len(reglas)}', estado=EstadoEntidades.ACTIVO
+                )
+                if tipo_regla == TipoRegla.CANAL:
+                    regla.aplica_canal = str(rnd.choice(CanalVenta.values))
+                    regla.aplica_linea = rnd.choice(lineas_obj)
+                elif tipo_regla == TipoRegla.ESCALA_CANTIDAD:
+                    regla.cantidad_minima = rnd.choice([5, 10, 20, 50, 100])
+                    regla.aplica_grupo = rnd.choice(grupos)
+                elif tipo_regla == TipoRegla.ESCALA_MONTO:
+                    regla.monto_minimo = _monto(rnd, 500000)
+                    regla.aplica_grupo = rnd.choice(grupos)
+                elif tipo_regla == TipoRegla.MONTO_PEDIDO:
+                    regla.monto_minimo = _monto(rnd, 1000000)
+                elif tipo_regla == TipoRegla.LINEA:
+                    regla.aplica_linea = rnd.choice(lineas_obj)
+                elif tipo_regla == TipoRegla.GRUPO:
+                    regla.aplica_grupo = rnd.choice(grupos)
+                else:
+                    regla.aplica_articulo = rnd.choice(articulos)
+                reglas.append(regla)
+        ReglaPrecio.objects.bulk_create(reglas, batch_size=1000)
+
+        combos = []
+        detalles = []
+        for i in range(combos_por_lista):
+            combo = CombinacionProducto(
+                combinacion_id=uuid.uuid4(), lista_precio=lista, nombre=f'Combo sintético {i}',
+                tipo_beneficio=rnd.choice(TipoBeneficio.values), valor_beneficio=_monto(rnd, 2000),
+                fecha_inicio=hoy, fecha_fin=hoy, estado=EstadoEntidades.ACTIVO
+            )
+            combos.append(combo)
+            for tipo_item in rnd.sample(TipoItem.values, rnd.randint(2, 3)):
+                detalle = DetalleCombinacionProducto(
+                    detalle_combinacion_id=uuid.uuid4(), combinacion_producto=combo, tipo_item=tipo_item,
+                    cantidad_requerida=rnd.randint(1, 3)
+                )
+                if tipo_item == TipoItem.ARTICULO:
+                    detalle.articulo = rnd.choice(articulos)
+                elif tipo_item == TipoItem.GRUPO:
+                    detalle.grupo = rnd.choice(grupos)
+                else:
+                    detalle.linea = rnd.choice(lineas_obj)
+                detalles.append(detalle)
+        CombinacionProducto.objects.bulk_create(combos)
+        DetalleCombinacionProducto.objects.bulk_create(detalles)
+
+        invalidar_indice(lista.lista_precio_id)
+        invalidar_indice_combos(lista.lista_precio_id)
+        invalidar_cotizaciones(lista.lista_precio_id)
+
+    # bulk_create no dispara los signals
+    invalidar_vigencias()
+
+    return {
+        'empresa': empresa,
+        'sucursal': sucursal,
+        'usuario': usuario,
+        'cliente': cliente,
+        'articulos': articulos,
+        'listas': listas_obj,
+    }
@@ -0,0 +1,265 @@
+"""
+Reserva y liberación del stock de los artículos de una orden.
+
+Las cantidades se agrupan por artículo y se aplican con una sola sentencia
+UPDATE por operación. Antes de modificar el stock se bloquean las filas de
+los artículos (SELECT ... FOR UPDATE) ordenadas por articulo_id: dos órdenes
+que comparten artículos los bloquean en el mismo orden, de modo que una
+espera a la otra en lugar de formar un deadlock, y ninguna puede vender el
+mismo stock dos veces.
+
+Los artículos con stock fraccionado (productos.fraccionado) no bloquean su
+fila: descuentan de uno de sus slots, después de los artículos normales y
+también en orden de articulo_id.
+
+Con STOCK_REGISTRO = 'libro' el stock es el del libro de la sucursal de la
+orden (productos.libro_stock): reservar y liberar insertan movimientos y no
+modifican Articulo.stock ni los slots.
+
+Todas las funciones deben llamarse dentro de transaction.atomic().
+"""
+from django.conf import settings
+from django.db.models import Case, F, Q, Sum, Value, When
+
+from productos import libro_stock
+from productos.models import Articulo, SlotStock
+from trading_system.choices import TipoMovimientoStock
+
+
+class StockInsuficiente(Exception):
+    """Uno o más artículos no tienen stock para la cantidad solicitada"""
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        super().__init__(f"Stock insuficiente para {len(faltantes)} artículo(s).")
+
+
+def cantidades_por_articulo(orden):
+    """Cantidad total de cada artículo en las líneas de la orden (una consulta)"""
+    return {
+        str(articulo_id): cantidad
+        for articulo_id, cantidad in orden.detalles_orden_compra_cliente.values_list(
+            'articulo_id'
+        ).annotate(cantidad=Sum('cantidad')).order_by()
+    }
+
+
+def libro_activo():
+    """Indica si el stock se lleva en el libro de movimientos por sucursal"""
+    return getattr(settings, 'STOCK_REGISTRO', 'articulo') == 'libro'
+
+
+def _descripciones(articulo_ids):
+    """Descripción de cada artículo, para informar los faltantes (una consulta)"""
+    return {
+        str(articulo_id): descripcion
+        for articulo_id, descripcion in Articulo.objects.filter(
+            articulo_id__in=list(articulo_ids)
+        ).values_list('articulo_id', 'descripcion')
+    }
+
+
+def stock_actual(articulo_ids, sucursal_id=None):
+    """
+    Stock de cada artículo existente: su saldo en el libro de la sucursal con
+    STOCK_REGISTRO = 'libro' (requiere sucursal_id), o su stock total (fila
+    más slots) en caso contrario.
+
+    Returns:
+        dict: articulo_id (str) -> stock. Los artículos inexistentes no aparecen.
+    """
+    articulos = Articulo.objects.filter(articulo_id__in=list(articulo_ids))
+    if libro_activo():
+        if sucursal_id is None:
+            raise ValueError("Con el libro de stock se requiere la sucursal.")
+        return libro_stock.saldos(articulos.values_list('articulo_id', flat=True), sucursal_id)
+    return {
+        str(articulo.articulo_id): articulo.stock_disponible
+        for articulo in articulos.con_stock().only('articulo_id', 'stock', 'stock_slots')
+    }
+
+
+def _bloquear(articulo_ids):
+    """
+    Bloquea las filas de los artículos no fraccionados en orden de articulo_id
+    y retorna su stock y descripción. Los fraccionados (y los inexistentes) no
+    aparecen en el resultado: su stock está en los slots.
+    """
+    return {
+        str(articulo_id): (stock, descripcion)
+        for articulo_id, stock, descripcion in Articulo.objects.select_for_update().filter(
+            articulo_id__in=articulo_ids, stock_slots=0
+        ).order_by('articulo_id').values_list('articulo_id', 'stock', 'descripcion')
+    }
+
+
+def _ajustar(cantidades, signo, condicion=None):
+    """Suma signo * cantidad al stock de cada artículo en una sola sentencia UPDATE"""
+    if not cantidades:
+        return 0
+    delta = Case(
+        *(When(articulo_id=articulo_id, then=Value(signo * cantidad)) for articulo_id, cantidad in cantidades.items()),
+        default=Value(0),
+    )
+    return Articulo.objects.filter(condicion or Q(articulo_id__in=list(cantidades))).update(stock=F('stock') + delta)
+
+
+def _slot_libre(articulo_id, minimo=None):
+    """Un slot al azar del artículo, no bloqueado por otra transacción y con al menos `minimo` unidades"""
+    slots = SlotStock.objects.select_for_update(skip_locked=True).filter(articulo_id=articulo_id)
+    if minimo is not None:
+        slots = slots.filter(cantidad__gte=minimo)
+    return slots.order_by('?').values_list('slot_stock_id', flat=True).first()
+
+
+def _reservar_fraccionado(articulo_id, cantidad):
+    """
+    Descuenta la cantidad de un slot libre con unidades suficientes. Si ninguno
+    alcanza, bloquea la fila del artículo y todos sus slots (el orden de
+    productos.fraccionado) y la reparte entre el stock que hubiera quedado en
+    Articulo.stock y los slots, de modo que se puede reservar todo lo que
+    informa stock_disponible.
+
+    Returns:
+        int: None si se descontó, o el stock disponible si no alcanza.
+    """
+    slot_id = _slot_libre(articulo_id, minimo=cantidad)
+    if slot_id is not None:
+        SlotStock.objects.filter(slot_stock_id=slot_id).update(cantidad=F('cantidad') - cantidad)
+        return None
+
+    # Un artículo inexistente no tiene fila ni slots: disponible 0
+    en_fila = Articulo.objects.select_for_update().filter(pk=articulo_id).values_list('stock', flat=True).first() or 0
+    slots = list(SlotStock.objects.select_for_update().filter(articulo_id=articulo_id).order_by('slot'))
+    disponible = en_fila + sum(slot.cantidad for slot in slots)
+    if disponible < cantidad:
+        return disponible
+
+    pendiente = cantidad
+    tomado = min(max(en_fila, 0), pendiente)
+    if tomado:
+        Articulo.objects.filter(pk=articulo_id).update(stock=F('stock') - tomado)
+        pendiente -= tomado
+    for slot in sorted(slots, key=lambda slot: -slot.cantidad):
+        if not pendiente:
+            break
+        tomado = min(max(slot.cantidad, 0), pendiente)
+        slot.cantidad -= tomado
+        pendiente -= tomado
+    SlotStock.objects.bulk_update(slots, ['cantidad'])
+    return None
+
+
+def _reservar_libro(cantidades, orden):
+    """Inserta las salidas en el libro de la sucursal de la orden si todos los saldos alcanzan"""
+    libro_stock.bloquear(cantidades, orden.sucursal_id)
+    disponibles = libro_stock.saldos(cantidades, orden.sucursal_id)
+    faltantes = {
+        articulo_id: (disponibles[articulo_id], cantidad)
+        for articulo_id, cantidad in cantidades.items()
+        if cantidad > disponibles[articulo_id]
+    }
+    if faltantes:
+        descripciones = _descripciones(faltantes)
+        raise StockInsuficiente([
+            {
+                "articulo_id": articulo_id,
+                "descripcion": descripciones.get(articulo_id),
+                "disponible": disponible,
+                "solicitado": cantidad,
+            }
+            for articulo_id, (disponible, cantidad) in sorted(faltantes.items())
+        ])
+    libro_stock.registrar(
+        {articulo_id: -cantidad for articulo_id, cantidad in cantidades.items()},
+        orden.sucursal_id, TipoMovimientoStock.RESERVA, orden
+    )
+
+
+def reservar_stock(cantidades, orden=None):
+    """
+    Descuenta del stock las cantidades por artículo. Los artículos fraccionados
+    (productos.fraccionado) descuentan de sus slots, después de los demás.
+
+    Args:
+        cantidades (dict): articulo_id -> cantidad.
+        orden (OrdenCompraCliente): Orden que reserva; requerida con el libro
+            de stock, que descuenta en su sucursal.
+
+    Raises:
+        StockInsuficiente: Con todos los faltantes. La transacción que llama
+            debe revertirse (lo hace transaction.atomic al propagarse).
+    """
+    if not cantidades:
+        return
+    if libro_activo():
+        return _reservar_libro(cantidades, orden)
+    articulos = _bloquear(cantidades)
+    filas = {articulo_id: cantidad for articulo_id, cantidad in cantidades.items() if articulo_id in articulos}
+
+    faltantes = []
+    for articulo_id, cantidad in sorted(filas.items()):
+        stock, descripcion = articulos[articulo_id]
+        if cantidad > stock:
+            faltantes.append({
+                "articulo_id": articulo_id,
+                "descripcion": descripcion,
+                "disponible": stock,
+                "solicitado": cantidad,
+            })
+
+    if not faltantes:
+        # Cada fila solo se actualiza si todavía alcanza (stock >= cantidad)
+        condicion = Q()
+        for articulo_id, cantidad in filas.items():
+            condicion |= Q(articulo_id=articulo_id, stock__gte=cantidad)
+        if filas and _ajustar(filas, -1, condicion) != len(filas):
+            # No ocurre con las filas bloqueadas; se verifica por si el stock se modificó sin bloqueo
+            raise StockInsuficiente([
+                {"articulo_id": articulo_id, "descripcion": None, "disponible": None, "solicitado": cantidad}
+                for articulo_id, cantidad in sorted(filas.items())
+            ])
+
+    fraccionados = {}
+    for articulo_id, cantidad in sorted(cantidades.items()):
+        if articulo_id not in articulos:
+            disponible = _reservar_fraccionado(articulo_id, cantidad)
+            if disponible is not None:
+                fraccionados[articulo_id] = (disponible, cantidad)
+    if fraccionados:
+        descripciones = _descripciones(fraccionados)
+        faltantes.extend(
+            {
+                "articulo_id": articulo_id,
+                "descripcion": descripciones.get(articulo_id),
+                "disponible": disponible,
+                "solicitado": cantidad,
+            }
+            for articulo_id, (disponible, cantidad) in fraccionados.items()
+        )
+
+    if faltantes:
+        raise StockInsuficiente(sorted(faltantes, key=lambda faltante: faltante["articulo_id"]))
+
+
+def liberar_stock(cantidades, orden=None):
+    """Devuelve al stock las cantidades por artículo (anulaciones)"""
+    if not cantidades:
+        return
+    if libro_activo():
+        libro_stock.bloquear(cantidades, orden.sucursal_id, compartido=True)
+        libro_stock.registrar(cantidades, orden.sucursal_id, TipoMovimientoStock.LIBERACION, orden)
+        return
+    articulos = _bloquear(cantidades)
+    _ajustar({articulo_id: cantidad for articulo_id, cantidad in cantidades.items() if articulo_id in articulos}, 1)
+
+    for articulo_id, cantidad in sorted(cantidades.items()):
+        if articulo_id in articulos:
+            continue
+        slot_id = _slot_libre(articulo_id)
+        if slot_id is None:
+            # Todos los slots están tomados: se espera por uno cualquiera
+            slot_id = SlotStock.objects.filter(articulo_id=articulo_id).order_by('?').values_list(
+                'slot_stock_id', flat=True
+            ).first()
+        SlotStock.objects.filter(slot_stock_id=slot_id).update(cantidad=F('cantidad') + cantidad)
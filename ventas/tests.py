@@ -1,30 +1,70 @@
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
+from django.test import SimpleTestCase, override_settings
 from rest_framework import status
-from django.urls import reverse
+from django.urls import NoReverseMatch, reverse
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.db.transaction import TransactionManagementError
+from django.utils import timezone
+from django.core.management import call_command
+from asgiref.sync import async_to_sync
+from rest_framework_simplejwt.tokens import AccessToken
 
+import io
+import json
+import pickle
+import random
+import threading
+import unittest
+import unittest.mock
 import uuid
-from datetime import date
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
 
 from accounts.models import Usuario
 from clientes.models import Cliente
-from productos.models import Articulo, LineaArticulo, GrupoArticulo
-from precios.models import ListaPrecio, PrecioArticulo
+from productos.models import Articulo, LineaArticulo, GrupoArticulo, SlotStock, MovimientoStock
+from productos.fraccionado import fraccionar_stock, fijar_stock, compactar_stock, desequilibrio
+from productos.libro_stock import abrir_libro, cortar_stock, pendientes_de_corte, saldos
+from precios.models import ListaPrecio, PrecioArticulo, ReglaPrecio, PrecioEfectivo, CombinacionProducto, DetalleCombinacionProducto
+from precios.refresco import refrescar_precios_efectivos, articulos_de_lista, calcular_valores
+from precios import paralelo
+from precios.paralelo import recalcular_lista
 from core.models import Empresa, Sucursal
-from ventas.models import OrdenCompraCliente, DetalleOrdenCompraCliente
-from trading_system.choices import EstadoOrden, CanalVenta, Tipo, Moneda, EstadoEntidades
+from ventas.models import OrdenCompraCliente, DetalleOrdenCompraCliente, RetencionStock, ClaveIdempotencia
+from ventas.retenciones import disponibles, purgar_vencidas, retener
+from ventas.numeracion import SECUENCIA, Numerador, crear_secuencia, siguiente_numero
+from ventas import idempotencia
+from ventas.serializers import OrdenReadSerializer, OrdenWriteSerializer
+from core import generaciones
+from core.plan_carga import plan_de_carga
+from trading_system.choices import EstadoOrden, CanalVenta, Tipo, Moneda, EstadoEntidades, TipoRegla, TipoDescuento, TipoBeneficio, TipoItem
+from ventas.utils import calculate_price, calculate_prices, calculate_order_prices, aplicar_reglas, aplicar_reglas_decimal
+from ventas.aritmetica import aplicar_reglas_enteros
+from ventas.sintetico import casos_aritmetica, regla_aleatoria
+from precios.combos import obtener_indice_combos
+from precios.indice import indice_cargado, invalidar_indice, obtener_indice
+from ventas import vectorizado
+from ventas.cache_cotizaciones import obtener_cache
+from core.intervalos import ArbolIntervalos, obtener_indice_vigencias
+from ventas.traza import explicar_pedido
 
 User = get_user_model()
 
 class OrdenAPITestCase(APITestCase):
     def setUp(self):
+        self.empresa = Empresa.objects.create(ruc='20123456789', razon_social='Empresa Test')
+        self.sucursal = Sucursal.objects.create(codigo_sucursal='SUC01', nombre_sucursal='Sucursal Test',
+                                                empresa=self.empresa)
         self.admin_user = Usuario.objects.create_user(
             username='admin',
             password='password123',
             first_name='Admin',
             last_name='User',
             email='admin@example.com',
+            celular='999999999',
+            sucursal=self.sucursal,
             perfil=1,  # ADMINISTRADOR
             puede_aprobar_bajo_costo=True
         )
@@ -34,13 +74,13 @@ class OrdenAPITestCase(APITestCase):
             first_name='Vendedor',
             last_name='User',
             email='vendedor@example.com',
+            celular='988888888',
+            sucursal=self.sucursal,
             perfil=2,  # VENDEDOR
             puede_aprobar_bajo_costo=False
         )
         self.client.force_authenticate(user=self.vendedor_user)
 
-        self.empresa = Empresa.objects.create(empresa_id=uuid.uuid4(), nombre='Empresa Test')
-        self.sucursal = Sucursal.objects.create(sucursal_id=uuid.uuid4(), nombre='Sucursal Test', empresa=self.empresa)
         self.cliente = Cliente.objects.create(
             cliente_id=uuid.uuid4(),
             nro_documento='123456789',
@@ -115,6 +155,39 @@ class OrdenAPITestCase(APITestCase):
             ]
         }
 
+    def _datos_orden(self, *lineas, **cambios):
+        """
+        Datos para OrdenWriteSerializer().create con las líneas (articulo, cantidad)
+        indicadas, por defecto una unidad del artículo 1, y los campos que cambian.
+        """
+        datos = {
+            'cliente_id': self.cliente.cliente_id,
+            'vendedor_id': self.vendedor_user.username,
+            'lista_precio_id': self.lista_precio.lista_precio_id,
+            'empresa_id': self.empresa.empresa_id,
+            'sucursal_id': self.sucursal.sucursal_id,
+            'canal': CanalVenta.B2C,
+            'detalles': [
+                {'articulo_id': articulo.articulo_id, 'cantidad': cantidad}
+                for articulo, cantidad in lineas or [(self.articulo1, 1)]
+            ],
+        }
+        datos.update(cambios)
+        return datos
+
+    def _crear_orden(self, *lineas, **cambios):
+        return OrdenWriteSerializer().create(self._datos_orden(*lineas, **cambios))
+
+    def _como_staff(self):
+        """
+        Autentica al administrador como staff (las acciones de órdenes lo
+        requieren). Retorna el encabezado con su token para async_client.
+        """
+        self.admin_user.is_staff = True
+        self.admin_user.save(update_fields=['is_staff'])
+        self.client.force_authenticate(user=self.admin_user)
+        return {'Authorization': f'Bearer {AccessToken.for_user(self.admin_user)}'}
+
     def test_create_orden(self):
         url = reverse('orden-list')
         response = self.client.post(url, self.orden_data, format='json')
@@ -126,6 +199,390 @@ class OrdenAPITestCase(APITestCase):
         self.assertAlmostEqual(float(orden.subtotal), 240.00)  # 2*100 + 1*40
         self.assertAlmostEqual(float(orden.total), 240.00)
 
+    def test_orden_escritura_masiva_y_contrato_de_totales(self):
+        serializer = OrdenWriteSerializer()
+
+        def crear(lineas):
+            datos = self._datos_orden(*[(self.articulo1, 2), (self.articulo2, 1)] * (lineas // 2))
+            with CaptureQueriesContext(connection) as capturadas:
+                orden = serializer.create(datos)
+            escrituras = [q['sql'] for q in capturadas
+                          if q['sql'].startswith(('INSERT INTO "ordenes_compra_cliente"', 'UPDATE "ordenes_compra_cliente"'))]
+            return orden, len(capturadas), escrituras
+
+        orden, _, escrituras = crear(2)
+        self.assertEqual(len(escrituras), 1)
+        self.assertEqual((orden.subtotal, orden.total), (Decimal('240.00'), Decimal('240.00')))
+        # Con el índice ya construido, las consultas no dependen de la cantidad de líneas
+        _, consultas, _ = crear(2)
+        orden_grande, consultas_grande, escrituras = crear(300)
+        self.assertEqual((consultas_grande, len(escrituras)), (consultas, 1))
+        orden_grande.refresh_from_db()
+        self.assertEqual(orden_grande.subtotal, Decimal('36000.00'))
+        self.assertEqual(orden_grande.detalles_orden_compra_cliente.count(), 300)
+
+        # save() de una línea recalcula los totales (no acumula al volver a guardar)
+        detalle = orden.detalles_orden_compra_cliente.get(articulo=self.articulo1)
+        detalle.cantidad = 3
+        detalle.save()
+        detalle.save()
+        orden.refresh_from_db()
+        self.assertEqual((orden.subtotal, orden.total), (Decimal('340.00'), Decimal('340.00')))
+
+        detalle.cantidad = 4
+        detalle.save(actualizar_orden=False)
+        orden.refresh_from_db()
+        self.assertEqual(orden.subtotal, Decimal('340.00'))
+        orden.recalcular_totales()
+        self.assertEqual(orden.subtotal, Decimal('440.00'))
+
+        detalle.delete()
+        orden.refresh_from_db()
+        self.assertEqual((orden.subtotal, orden.total), (Decimal('40.00'), Decimal('40.00')))
+
+        # update con detalles: una sola escritura de la orden
+        with CaptureQueriesContext(connection) as capturadas:
+            serializer.update(orden, {'detalles': [{'articulo_id': self.articulo2.articulo_id, 'cantidad': 5}]})
+        self.assertEqual(len([q for q in capturadas if q['sql'].startswith('UPDATE "ordenes_compra_cliente"')]), 1)
+        orden.refresh_from_db()
+        self.assertEqual(orden.total, Decimal('200.00'))
+
+    def test_confirmar_y_anular_reservan_stock_por_lotes(self):
+        self._como_staff()
+        orden = self._crear_orden(
+            (self.articulo1, 60), (self.articulo2, 30), (self.articulo1, 50), (self.articulo2, 30)
+        )
+        url = reverse('orden-confirmar-orden', kwargs={'pk': orden.pk})
+
+        # Los dos faltantes (sumando las líneas de cada artículo) se informan juntos y no se descuenta nada
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            sorted((f['descripcion'], f['disponible'], f['solicitado']) for f in response.data['faltantes']),
+            sorted([(self.articulo1.descripcion, 100, 110), (self.articulo2.descripcion, 50, 60)])
+        )
+        self.articulo1.refresh_from_db()
+        self.assertEqual(self.articulo1.stock, 100)
+
+        Articulo.objects.filter(pk__in=[self.articulo1.pk, self.articulo2.pk]).update(stock=200)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stocks = dict(Articulo.objects.filter(pk__in=[self.articulo1.pk, self.articulo2.pk]).values_list('pk', 'stock'))
+        self.assertEqual((stocks[self.articulo1.pk], stocks[self.articulo2.pk]), (90, 140))
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('orden-anular-orden', kwargs={'pk': orden.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stocks = dict(Articulo.objects.filter(pk__in=[self.articulo1.pk, self.articulo2.pk]).values_list('pk', 'stock'))
+        self.assertEqual((stocks[self.articulo1.pk], stocks[self.articulo2.pk]), (200, 200))
+
+    def test_stock_fraccionado_en_slots(self):
+        self._como_staff()
+        self.assertEqual(fraccionar_stock(self.articulo1.pk, 4), 100)
+        self.assertEqual(
+            sorted(SlotStock.objects.filter(articulo=self.articulo1).values_list('cantidad', flat=True)), [25, 25, 25, 25]
+        )
+        orden = self._crear_orden((self.articulo1, 20), (self.articulo2, 5))
+        response = self.client.post(reverse('orden-confirmar-orden', kwargs={'pk': orden.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        articulo = Articulo.objects.con_stock().get(pk=self.articulo1.pk)
+        self.assertEqual((articulo.stock, articulo.stock_disponible), (0, 80))
+        self.assertEqual(desequilibrio(self.articulo1.pk), 20)
+
+        # Ningún slot alcanza para 30 pero el total sí: se reparte entre varios slots
+        orden = self._crear_orden((self.articulo1, 30))
+        response = self.client.post(reverse('orden-confirmar-orden', kwargs={'pk': orden.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Articulo.objects.con_stock().get(pk=self.articulo1.pk).stock_disponible, 50)
+
+        orden = self._crear_orden((self.articulo1, 51))
+        response = self.client.post(reverse('orden-confirmar-orden', kwargs={'pk': orden.pk}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [(f['descripcion'], f['disponible'], f['solicitado']) for f in response.data['faltantes']],
+            [(self.articulo1.descripcion, 50, 51)]
+        )
+
+        # Unidades que quedaron en la fila de un artículo fraccionado también se pueden reservar
+        Articulo.objects.filter(pk=self.articulo1.pk).update(stock=10)
+        orden = self._crear_orden((self.articulo1, 60))
+        response = self.client.post(reverse('orden-confirmar-orden', kwargs={'pk': orden.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        articulo = Articulo.objects.con_stock().get(pk=self.articulo1.pk)
+        self.assertEqual((articulo.stock, articulo.stock_disponible), (0, 0))
+        fijar_stock(self.articulo1.pk, 50)
+
+        compactar_stock(self.articulo1.pk)
+        self.assertLessEqual(desequilibrio(self.articulo1.pk), 1)
+        response = self.client.get(reverse('articulo-detail', kwargs={'articulo_id': self.articulo1.pk}))
+        self.assertEqual(response.data['data']['stock'], 50)
+
+        # Asignar el stock de un artículo fraccionado lo reparte en sus slots
+        articulo = Articulo.objects.get(pk=self.articulo1.pk)
+        articulo.stock_disponible = 40
+        articulo.save()
+        self.assertEqual(
+            sorted(SlotStock.objects.filter(articulo=self.articulo1).values_list('cantidad', flat=True)), [10, 10, 10, 10]
+        )
+
+        self.assertEqual(fraccionar_stock(self.articulo1.pk, 0), 40)
+        self.assertFalse(SlotStock.objects.filter(articulo=self.articulo1).exists())
+        self.articulo1.refresh_from_db()
+        self.assertEqual((self.articulo1.stock, self.articulo1.stock_slots), (40, 0))
+
+    @override_settings(STOCK_REGISTRO='libro')
+    def test_libro_de_stock_por_sucursal(self):
+        self._como_staff()
+        otra_sucursal = Sucursal.objects.create(codigo_sucursal='SUC02', nombre_sucursal='Sucursal Norte',
+                                                empresa=self.empresa)
+        self.assertEqual(abrir_libro(self.sucursal.sucursal_id), 2)
+        self.assertEqual(abrir_libro(self.sucursal.sucursal_id), 0)
+        clave = str(self.articulo1.articulo_id)
+
+        orden = self._crear_orden((self.articulo1, 60))
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post(reverse('orden-confirmar-orden', kwargs={'pk': orden.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # La confirmación inserta en el libro y no actualiza el artículo
+        self.assertFalse([q for q in consultas.captured_queries if q['sql'].startswith('UPDATE "articulos"')])
+        self.assertEqual(MovimientoStock.objects.filter(orden=orden).get().cantidad, -60)
+        self.articulo1.refresh_from_db()
+        self.assertEqual(self.articulo1.stock, 100)
+        self.assertEqual(saldos([clave], self.sucursal.sucursal_id), {clave: 40})
+
+        # El stock de una sucursal no se puede vender en otra
+        orden_norte = self._crear_orden((self.articulo1, 60), sucursal_id=otra_sucursal.sucursal_id)
+        response = self.client.post(reverse('orden-confirmar-orden', kwargs={'pk': orden_norte.pk}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['faltantes'][0]['disponible'], 0)
+
+        corte = cortar_stock(clave, self.sucursal.sucursal_id)
+        self.assertEqual(corte.saldo, 40)
+        self.assertIsNone(cortar_stock(clave, self.sucursal.sucursal_id))
+        self.assertEqual(pendientes_de_corte(), [(self.articulo2.articulo_id, self.sucursal.sucursal_id)])
+        # Una consulta por sucursal que parte de los artículos, no del libro
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(pendientes_de_corte(minimo=2), [])
+        self.assertEqual(len(consultas.captured_queries), 1 + Sucursal.objects.count())
+        self.assertNotIn('GROUP BY', consultas.captured_queries[-1]['sql'])
+
+        response = self.client.post(reverse('orden-anular-orden', kwargs={'pk': orden.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(saldos([clave], self.sucursal.sucursal_id), {clave: 100})
+        self.assertIn((self.articulo1.articulo_id, self.sucursal.sucursal_id), pendientes_de_corte())
+        # Saldo histórico: al momento del corte todavía no se había anulado la orden
+        self.assertEqual(saldos([clave], self.sucursal.sucursal_id, corte.fecha), {clave: 40})
+
+        url = reverse('articulo-existencias', kwargs={'articulo_id': self.articulo1.articulo_id})
+        response = self.client.get(url)
+        self.assertEqual(response.data['data'], [{'sucursal_id': self.sucursal.sucursal_id, 'saldo': 100}])
+        ayer = (timezone.localdate() - timedelta(days=1)).isoformat()
+        response = self.client.get(url, {'sucursal': self.sucursal.sucursal_id, 'fecha': ayer})
+        self.assertEqual(response.data['data'], [{'sucursal_id': self.sucursal.sucursal_id, 'saldo': 0}])
+        response = self.client.get(url, {'fecha': 'ayer'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retenciones_de_stock_y_disponible(self):
+        self._como_staff()
+        orden = self._crear_orden((self.articulo1, 30), (self.articulo1, 10))
+        otra = self._crear_orden((self.articulo1, 25))
+        self.assertEqual(RetencionStock.objects.get(orden_compra_cliente=orden).cantidad, 40)
+
+        url = reverse('articulo-disponible', kwargs={'articulo_id': self.articulo1.articulo_id})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.data['data'], {'stock': 100, 'retenido': 65, 'disponible': 35})
+        # Solo los artículos tienen disponible, no los grupos
+        with self.assertRaises(NoReverseMatch):
+            reverse('grupo-articulo-disponible', kwargs={'grupo_id': self.grupo.grupo_id})
+
+        # Actualizar la orden reemplaza sus retenciones
+        detalle = orden.detalles_orden_compra_cliente.order_by('cantidad').first()
+        OrdenWriteSerializer().update(orden, {'detalles': [{'id': detalle.pk, 'articulo_id': self.articulo1.articulo_id,
+                                                            'cantidad': 5}]})
+        self.assertEqual(disponibles([self.articulo1.pk])[str(self.articulo1.pk)]['retenido'], 30)
+
+        # Al confirmar, la retención pasa a ser stock descontado
+        response = self.client.post(reverse('orden-confirmar-orden', kwargs={'pk': orden.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(RetencionStock.objects.filter(orden_compra_cliente=orden).exists())
+        response = self.client.get(url)
+        self.assertEqual(response.data['data'], {'stock': 95, 'retenido': 25, 'disponible': 70})
+
+        self.assertEqual(purgar_vencidas(timezone.now()), 0)
+        self.assertEqual(purgar_vencidas(timezone.now() + timedelta(days=1)), 1)
+        self.assertEqual(self.client.get(url).data['data']['retenido'], 0)
+
+        retener(otra)
+        response = self.client.post(reverse('orden-anular-orden', kwargs={'pk': otra.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(RetencionStock.objects.exists())
+
+        response = self.client.get(reverse('articulo-disponible', kwargs={'articulo_id': uuid.uuid4()}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        with override_settings(STOCK_REGISTRO='libro'):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+            response = self.client.get(url, {'sucursal': self.sucursal.sucursal_id})
+            self.assertEqual(response.data['data'], {'stock': 0, 'retenido': 0, 'disponible': 0})
+
+    def test_creacion_idempotente(self):
+        self._como_staff()
+        url = reverse('orden-list')
+        encabezado = {'HTTP_IDEMPOTENCY_KEY': 'movil-123'}
+
+        response = self.client.post(url, self.orden_data, format='json', **encabezado)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        registro = ClaveIdempotencia.objects.get()
+        self.assertEqual(str(registro.orden_compra_cliente_id), response.data['orden_compra_cliente_id'])
+
+        # El reintento no calcula precios, no lee la orden ni escribe: repite la
+        # respuesta del primer intento aunque la orden haya cambiado después
+        OrdenCompraCliente.objects.filter(pk=registro.orden_compra_cliente_id).update(estado=EstadoOrden.PROCESANDO)
+        with unittest.mock.patch('ventas.serializers.calculate_order_prices') as calcular, \
+                CaptureQueriesContext(connection) as consultas:
+            repetida = self.client.post(url, self.orden_data, format='json', **encabezado)
+        self.assertEqual(repetida.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(repetida.json(), response.json())
+        calcular.assert_not_called()
+        self.assertFalse([q for q in consultas.captured_queries if '"ordenes_compra_cliente"' in q['sql']])
+        self.assertFalse([q for q in consultas.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))])
+        self.assertEqual(OrdenCompraCliente.objects.count(), 1)
+
+        otra = dict(self.orden_data, detalles=self.orden_data['detalles'][:1])
+        response = self.client.post(url, otra, format='json', **encabezado)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        # Un intento que falla no deja la clave tomada
+        response = self.client.post(url, dict(otra, canal=99), format='json', HTTP_IDEMPOTENCY_KEY='movil-124')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, otra, format='json', HTTP_IDEMPOTENCY_KEY='movil-124')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(idempotencia.purgar_vencidas(), 0)
+        self.assertEqual(idempotencia.purgar_vencidas(timezone.now() + timedelta(days=2)), 2)
+        response = self.client.post(url, otra, format='json', **encabezado)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(OrdenCompraCliente.objects.count(), 3)
+
+    def test_plan_de_carga_consultas_constantes(self):
+        self._como_staff()
+        self.assertEqual(
+            plan_de_carga(OrdenReadSerializer),
+            (['empresa', 'sucursal', 'cliente', 'vendedor', 'lista_precio'], ['detalles_orden_compra_cliente'])
+        )
+
+        def crear(lineas):
+            return self._crear_orden(*[(self.articulo1, 1), (self.articulo2, 1)] * (lineas // 2))
+
+        def consultas(metodo, url, **kwargs):
+            with CaptureQueriesContext(connection) as capturadas:
+                response = metodo(url, **kwargs)
+            self.assertIn(response.status_code, (status.HTTP_200_OK, status.HTTP_201_CREATED))
+            # Sin el pedido de un bloque de números de orden, que ocurre cada tanto (ventas.numeracion)
+            return len([q for q in capturadas.captured_queries if 'nextval' not in q['sql']])
+
+        url = reverse('orden-list')
+        crear(2)
+        pocas = consultas(self.client.get, url, data={'page_size': 50})
+        for lineas in (2, 4, 6, 8, 10, 12):
+            crear(lineas)
+        muchas = consultas(self.client.get, url, data={'page_size': 50})
+        # EXPLAIN (conteo estimado, ver core.pagination), COUNT, órdenes con sus FK y líneas con sus artículos
+        self.assertEqual((pocas, muchas), (4, 4))
+
+        chica, grande = crear(2), crear(20)
+        detalle = lambda orden: reverse('orden-detail', kwargs={'pk': orden.pk})
+        self.assertEqual(consultas(self.client.get, detalle(chica)), consultas(self.client.get, detalle(grande)))
+        confirmar = lambda orden: reverse('orden-confirmar-orden', kwargs={'pk': orden.pk})
+        self.assertEqual(consultas(self.client.post, confirmar(chica)), consultas(self.client.post, confirmar(grande)))
+        self.assertEqual(
+            consultas(self.client.post, reverse('orden-list'), data=self.orden_data, format='json'),
+            consultas(self.client.post, reverse('orden-list'), format='json', data=dict(
+                self.orden_data, detalles=self.orden_data['detalles'] * 10
+            ))
+        )
+
+    def test_paginacion_keyset(self):
+        self.client.force_authenticate(user=self.admin_user)
+        for _ in range(7):
+            self._crear_orden()
+        # Todas tienen la misma fecha_orden: el id desempata
+        esperado = [str(pk) for pk in OrdenCompraCliente.objects.order_by('-fecha_orden', '-orden_compra_cliente_id')
+                    .values_list('orden_compra_cliente_id', flat=True)]
+
+        url = reverse('orden-list') + '?paginacion=keyset&page_size=3'
+        paginas = []
+        with CaptureQueriesContext(connection) as consultas:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertNotIn('count', response.data)
+                paginas.append(response.data)
+                url = response.data['next']
+        self.assertFalse([q for q in consultas.captured_queries if 'COUNT(' in q['sql'] or 'OFFSET' in q['sql']])
+        self.assertEqual([len(pagina['results']) for pagina in paginas], [3, 3, 1])
+        # La posición es una comparación de filas que Postgres resuelve en el índice del orden
+        fila = '("ordenes_compra_cliente"."fecha_orden", "ordenes_compra_cliente"."orden_compra_cliente_id") <'
+        pagina = next(q['sql'] for q in consultas.captured_queries if fila in q['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + pagina)
+            plan = '\n'.join(linea for linea, in cursor.fetchall())
+        self.assertIn('orden_fecha_keyset_idx', plan)
+        self.assertRegex(plan, r'Index Cond: \(ROW\(fecha_orden, orden_compra_cliente_id\) < ROW\(')
+        self.assertEqual([o['orden_compra_cliente_id'] for pagina in paginas for o in pagina['results']], esperado)
+        self.assertIsNone(paginas[0]['previous'])
+
+        # Hacia atrás desde la última página
+        response = self.client.get(paginas[-1]['previous'])
+        self.assertEqual([o['orden_compra_cliente_id'] for o in response.data['results']], esperado[3:6])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([o['orden_compra_cliente_id'] for o in response.data['results']], esperado[:3])
+        self.assertIsNone(response.data['previous'])
+        self.assertEqual(response.data['next'], paginas[0]['next'])
+
+        response = self.client.get(reverse('orden-list'), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        # Sin el parámetro, la paginación estándar
+        self.assertEqual(self.client.get(reverse('orden-list')).data['count'], 7)
+        for nombre in ('historial-precio-list', 'auditoria-regla-list'):
+            response = self.client.get(reverse(nombre), {'paginacion': 'keyset'})
+            self.assertEqual((response.status_code, response.data['next']), (status.HTTP_200_OK, None))
+
+    def test_conteo_estimado_en_paginacion(self):
+        self.client.force_authenticate(user=self.admin_user)
+        for _ in range(7):
+            self._crear_orden()
+        url = reverse('orden-list')
+
+        # Por debajo del umbral el conteo es exacto
+        response = self.client.get(url)
+        self.assertEqual((response.data['count'], response.data['count_is_approximate']), (7, False))
+
+        with override_settings(PAGINACION_CONTEO_ESTIMADO_DESDE=1):
+            with CaptureQueriesContext(connection) as consultas:
+                response = self.client.get(url, {'page_size': 3})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.data['count_is_approximate'])
+            self.assertGreaterEqual(response.data['count'], 1)
+            self.assertFalse([q for q in consultas.captured_queries if 'COUNT(' in q['sql']])
+            # Las páginas no dependen del total estimado: next existe mientras haya filas
+            paginas = []
+            while url:
+                response = self.client.get(url, {'page_size': 3} if not paginas else None)
+                paginas.append(len(response.data['results']))
+                url = response.data['next']
+            self.assertEqual(paginas, [3, 3, 1])
+            response = self.client.get(reverse('orden-list'), {'page_size': 3, 'page': 4})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+            response = self.client.get(reverse('orden-list'), {'exact_count': 1, 'page_size': 3})
+            self.assertEqual((response.data['count'], response.data['count_is_approximate']), (7, False))
+            self.assertEqual(response.data['total_pages'], 3)
+
     def test_list_ordenes(self):
         self.test_create_orden()  # Create an order first
         url = reverse('orden-list')
@@ -284,4 +741,758 @@ class OrdenAPITestCase(APITestCase):
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('ventas_hoy', response.data)
-        self.assertIn('ordenes_mes', response.data)
\ No newline at end of file
+        self.assertIn('ordenes_mes', response.data)
+
+    def test_calculate_price_aplica_regla_e_invalida_indice(self):
+        regla = ReglaPrecio.objects.create(
+            regla_precio_id=uuid.uuid4(),
+            codigo='R001',
+            lista_precio=self.lista_precio,
+            tipo_regla=TipoRegla.GRUPO,
+            prioridad=1,
+            aplica_grupo=self.grupo,
+            tipo_descuento=TipoDescuento.PORCENTAJE,
+            valor_descuento=Decimal('10.00'),
+            fecha_inicio=date.today() - timedelta(days=1),
+            fecha_fin=date.today() + timedelta(days=1),
+            descripcion='10% grupo 1',
+            estado=EstadoEntidades.ACTIVO
+        )
+        resultado = calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)
+        self.assertEqual(resultado['precio_final'], Decimal('90.00'))
+        self.assertEqual(resultado['reglas_aplicadas'], ['10% grupo 1'])
+
+        # Modificar la regla debe invalidar el índice compilado de la lista
+        regla.valor_descuento = Decimal('15.00')
+        regla.save()
+        resultado = calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)
+        self.assertEqual(resultado['precio_final'], Decimal('85.00'))
+
+        # 100 - 30% = 70, por debajo del mínimo de 80
+        regla.valor_descuento = Decimal('30.00')
+        regla.save()
+        resultado = calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)
+        self.assertEqual(resultado['precio_final'], Decimal('80.00'))
+        self.assertIn("Ajustado a precio mínimo de venta.", resultado['reglas_aplicadas'])
+
+        regla.delete()
+        resultado = calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)
+        self.assertEqual(resultado['precio_final'], Decimal('100.00'))
+
+    def test_indice_invalidado_en_otro_proceso(self):
+        indice = obtener_indice(self.lista_precio)
+        self.assertIs(obtener_indice(self.lista_precio), indice)
+        self.assertIs(indice_cargado(self.lista_precio), indice)
+
+        # Otro worker guarda una regla: aquí no corren sus signals, solo cambia la generación compartida
+        with unittest.mock.patch('auditoria.signals.invalidar_indice'):
+            self._crear_regla('OTRO', aplica_grupo=self.grupo)
+        self.assertIs(obtener_indice(self.lista_precio), indice)
+        generaciones.subir(f'indice:{self.lista_precio.lista_precio_id}')
+        self.assertIsNone(indice_cargado(self.lista_precio))
+        nuevo = obtener_indice(self.lista_precio)
+        self.assertIsNot(nuevo, indice)
+        self.assertEqual([r.codigo for r in nuevo.reglas_candidatas(self.articulo1.articulo_id, self.grupo.grupo_id, None)],
+                         ['OTRO'])
+
+    def test_calculate_prices_consultas_constantes(self):
+        lineas = []
+        for i in range(20):
+            articulo = Articulo.objects.create(
+                articulo_id=uuid.uuid4(),
+                codigo_articulo=f'BLK{i:03d}',
+                descripcion=f'Articulo bloque {i}',
+                stock=10,
+                unidad_medida='UND',
+                costo_actual=5.00,
+                precio_sugerido=10.00,
+                grupo_id=self.grupo
+            )
+            PrecioArticulo.objects.create(
+                precio_articulo_id=uuid.uuid4(),
+                lista_precio=self.lista_precio,
+                articulo=articulo,
+                precio_base=10.00,
+                precio_minimo=8.00,
+                estado=EstadoEntidades.ACTIVO
+            )
+            lineas.append({'articulo_id': articulo.articulo_id, 'cantidad': i + 1})
+
+        invalidar_indice(self.lista_precio.lista_precio_id)
+
+        # Índice frío: precios + reglas + artículos
+        with self.assertNumQueries(3):
+            resultados = calculate_prices(lineas, self.lista_precio, CanalVenta.B2C)
+        self.assertEqual(len(resultados), 20)
+        self.assertTrue(all(r['precio_final'] == Decimal('10.00') for r in resultados))
+
+        # Índice caliente: solo la carga de artículos, sin importar las líneas
+        with self.assertNumQueries(1):
+            calculate_prices(lineas, self.lista_precio, CanalVenta.B2C)
+        with self.assertNumQueries(1):
+            calculate_prices(lineas[:2], self.lista_precio, CanalVenta.B2C)
+
+    def _crear_regla(self, codigo, **kwargs):
+        datos = {
+            'regla_precio_id': uuid.uuid4(),
+            'codigo': codigo,
+            'lista_precio': self.lista_precio,
+            'tipo_regla': TipoRegla.GRUPO,
+            'prioridad': 1,
+            'tipo_descuento': TipoDescuento.PORCENTAJE,
+            'valor_descuento': Decimal('10.00'),
+            'fecha_inicio': date.today() - timedelta(days=1),
+            'fecha_fin': date.today() + timedelta(days=1),
+            'descripcion': f'Regla {codigo}',
+            'estado': EstadoEntidades.ACTIVO,
+        }
+        datos.update(kwargs)
+        return ReglaPrecio.objects.create(**datos)
+
+    @unittest.skipIf(vectorizado.np is None, "numpy no está instalado")
+    def test_repricing_vectorizado_coincide_con_calculate_price(self):
+        self._crear_regla('V1', aplica_grupo=self.grupo, valor_descuento=Decimal('12.50'))
+        self._crear_regla('V2', aplica_articulo=self.articulo1, prioridad=2, aplica_canal=str(CanalVenta.B2B),
+                          tipo_descuento=TipoDescuento.MONTO_FIJO, valor_descuento=Decimal('3.33'))
+        self._crear_regla('V3', aplica_linea=self.linea, prioridad=3, tipo_regla=TipoRegla.ESCALA_CANTIDAD,
+                          cantidad_minima=10, valor_descuento=Decimal('7.77'))
+        self._crear_regla('V4', aplica_articulo=self.articulo2, prioridad=4, cantidad_minima=50,
+                          valor_descuento=Decimal('40.00'))
+
+        matriz = vectorizado.repreciar_lista(self.lista_precio)
+        self.assertEqual(list(matriz.tramos), [1, 10, 50])
+
+        for articulo in (self.articulo1, self.articulo2):
+            articulo.refresh_from_db()
+            for canal in CanalVenta.values:
+                for cantidad in (1, 9, 10, 49, 50, 500):
+                    esperado = calculate_price(articulo, self.lista_precio, canal, cantidad)
+                    celda = matriz.celda(articulo.articulo_id, canal, cantidad)
+                    self.assertEqual(celda['precio_final'], esperado['precio_final'])
+                    self.assertEqual(celda['descuento_total'], esperado['descuento_total'])
+                    self.assertEqual(celda['vendido_bajo_costo'], esperado['vendido_bajo_costo'])
+
+    def test_precios_efectivos_refresco_incremental(self):
+        refrescar_precios_efectivos(self.lista_precio.lista_precio_id)
+        # 2 artículos x 3 canales x 1 tramo
+        self.assertEqual(PrecioEfectivo.objects.filter(lista_precio=self.lista_precio).count(), 6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._crear_regla('E1', aplica_articulo=self.articulo1, tipo_regla=TipoRegla.ESCALA_CANTIDAD,
+                              cantidad_minima=10, valor_descuento=Decimal('5.00'))
+
+        filas = PrecioEfectivo.objects.filter(lista_precio=self.lista_precio, articulo=self.articulo1,
+                                              canal=CanalVenta.B2C)
+        self.assertEqual([(f.cantidad_desde, f.precio_final) for f in filas],
+                         [(1, Decimal('100.00')), (10, Decimal('95.00'))])
+
+        # El cambio de costo solo refresca al artículo afectado
+        with self.captureOnCommitCallbacks(execute=True):
+            self.articulo2.costo_actual = Decimal('45.00')
+            self.articulo2.save()
+        fila = PrecioEfectivo.objects.get(lista_precio=self.lista_precio, articulo=self.articulo2,
+                                          canal=CanalVenta.B2C, cantidad_desde=1)
+        self.assertTrue(fila.vendido_bajo_costo)
+
+        url = reverse('calcular_precio_articulo')
+        calc_data = {
+            'articulo_id': str(self.articulo1.articulo_id),
+            'lista_precio_id': str(self.lista_precio.lista_precio_id),
+            'canal': CanalVenta.B2C,
+            'cantidad': 12
+        }
+        with self.assertNumQueries(1):
+            response = self.client.post(url, calc_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['precio_unitario_calculado'], Decimal('95.00'))
+
+    @override_settings(PRECIOS_EFECTIVOS_REFRESCO_MAXIMO=1)
+    def test_precios_efectivos_porcion_grande_se_difiere(self):
+        refrescar_precios_efectivos(self.lista_precio.lista_precio_id)
+        # La regla del grupo alcanza a los dos artículos: no se recalculan en la solicitud
+        with self.captureOnCommitCallbacks(execute=True):
+            self._crear_regla('G1', aplica_grupo=self.grupo, valor_descuento=Decimal('10.00'))
+        self.assertFalse(PrecioEfectivo.objects.filter(lista_precio=self.lista_precio).exists())
+
+        response = self.client.post(reverse('calcular_precio_articulo'), {
+            'articulo_id': str(self.articulo1.articulo_id),
+            'lista_precio_id': str(self.lista_precio.lista_precio_id),
+            'canal': CanalVenta.B2C,
+            'cantidad': 1
+        }, format='json')
+        self.assertEqual(response.data['precio_unitario_calculado'], Decimal('90.00'))
+
+        call_command('refrescar_precios_efectivos', stdout=io.StringIO())
+        self.assertEqual(PrecioEfectivo.objects.get(lista_precio=self.lista_precio, articulo=self.articulo1,
+                                                    canal=CanalVenta.B2C).precio_final, Decimal('90.00'))
+
+    def test_repricing_por_particiones(self):
+        self._crear_regla('E1', aplica_articulo=self.articulo1, tipo_regla=TipoRegla.ESCALA_CANTIDAD,
+                          cantidad_minima=10, valor_descuento=Decimal('5.00'))
+        refrescar_precios_efectivos(self.lista_precio.lista_precio_id)
+        esperado = sorted(PrecioEfectivo.objects.filter(lista_precio=self.lista_precio).values_list(
+            'articulo_id', 'canal', 'cantidad_desde', 'precio_final', 'reglas_aplicadas'
+        ))
+        # Fila de un tramo que ya no existe: el recálculo la borra
+        obsoleta = PrecioEfectivo.objects.create(
+            lista_precio=self.lista_precio, articulo=self.articulo2, canal=CanalVenta.B2C, cantidad_desde=99,
+            precio_base=Decimal('50.00'), precio_final=Decimal('1.00'), fecha_calculo=date.today() - timedelta(days=1)
+        )
+        PrecioEfectivo.objects.filter(pk=obsoleta.pk).update(fecha_modificacion=timezone.now() - timedelta(days=1))
+
+        resultado = recalcular_lista(self.lista_precio.lista_precio_id, workers=1)
+        self.assertEqual((resultado['filas'], resultado['borradas']), (len(esperado), 1))
+        self.assertEqual(sorted(PrecioEfectivo.objects.filter(lista_precio=self.lista_precio).values_list(
+            'articulo_id', 'canal', 'cantidad_desde', 'precio_final', 'reglas_aplicadas'
+        )), esperado)
+
+        # Lo que calcula cada proceso a partir de la copia serializada del índice
+        indice = obtener_indice(self.lista_precio)
+        articulos = articulos_de_lista(self.lista_precio.lista_precio_id)
+        paralelo._iniciar_proceso(pickle.dumps(indice))
+        self.assertEqual(paralelo._calcular_particion(articulos), calcular_valores(indice, articulos))
+        self.assertEqual([len(p) for p in paralelo.particionar_por_linea(articulos, minimo_particiones=4)], [1, 1])
+
+        with self.assertRaises(TransactionManagementError):
+            recalcular_lista(self.lista_precio.lista_precio_id, workers=2)
+
+    def test_cache_cotizaciones_aciertos_y_desalojo(self):
+        cache = obtener_cache()
+        self._crear_regla('R-VOL', aplica_grupo=self.grupo, cantidad_minima=10, valor_descuento=Decimal('5.00'))
+        calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)
+
+        # Las cantidades 1-9 y 10+ comparten entrada por tramo: sin consultas
+        aciertos = cache.aciertos
+        with self.assertNumQueries(0):
+            self.assertEqual(calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 7)['precio_final'], Decimal('100.00'))
+            calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 10)
+            self.assertEqual(calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 50)['precio_final'], Decimal('95.00'))
+        self.assertEqual(cache.aciertos, aciertos + 2)
+
+        # Modificar los resultados devueltos no altera la cache
+        resultado = calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)
+        resultado['reglas_aplicadas'].append('otra')
+        self.assertEqual(calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)['reglas_aplicadas'], [])
+
+        # Cambiar el precio invalida el índice de la lista, cuya generación es parte de la clave
+        precio = PrecioArticulo.objects.get(lista_precio=self.lista_precio, articulo=self.articulo1)
+        precio.precio_base = Decimal('120.00')
+        precio.save()
+        self.assertEqual(calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)['precio_final'], Decimal('120.00'))
+
+        # Subir el costo por encima del precio cambia vendido_bajo_costo y desaloja solo ese artículo
+        calculate_price(self.articulo2, self.lista_precio, CanalVenta.B2C, 1)
+        self.articulo1.costo_actual = Decimal('130.00')
+        self.articulo1.save()
+        aciertos = cache.aciertos
+        calculate_price(self.articulo2, self.lista_precio, CanalVenta.B2C, 1)
+        self.assertEqual(cache.aciertos, aciertos + 1)
+        self.assertTrue(calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)['vendido_bajo_costo'])
+
+        # Otro worker cambia el costo: aquí no corren sus signals, solo sube la generación compartida
+        calculate_price(self.articulo2, self.lista_precio, CanalVenta.B2C, 1)
+        Articulo.objects.filter(pk=self.articulo2.pk).update(costo_actual=Decimal('130.00'))
+        self.articulo2.refresh_from_db()
+        self.assertFalse(calculate_price(self.articulo2, self.lista_precio, CanalVenta.B2C, 1)['vendido_bajo_costo'])
+        generaciones.subir(f'cotizacion:{self.lista_precio.lista_precio_id}:{self.articulo2.articulo_id}')
+        self.assertTrue(calculate_price(self.articulo2, self.lista_precio, CanalVenta.B2C, 1)['vendido_bajo_costo'])
+        # Y una regla nueva cambia la generación del índice, que también es parte de la clave
+        with unittest.mock.patch('auditoria.signals.invalidar_indice'), \
+                unittest.mock.patch('auditoria.signals.invalidar_cotizaciones'):
+            self._crear_regla('R-OTRO', aplica_grupo=self.grupo, valor_descuento=Decimal('1.00'))
+        invalidar_indice(self.lista_precio.lista_precio_id)
+        self.assertIn('Regla R-OTRO', calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)['reglas_aplicadas'])
+
+        response = self.client.get(reverse('cache_cotizaciones'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['habilitado'])
+        self.assertIn('aciertos', response.data)
+        self.assertIn('fallos', response.data)
+
+    def test_escalas_por_cantidad(self):
+        self._crear_regla('R-E10', aplica_grupo=self.grupo, cantidad_minima=10, valor_descuento=Decimal('5.00'))
+        self._crear_regla('R-E50', aplica_articulo=self.articulo1, tipo_regla=TipoRegla.ARTICULO,
+                          prioridad=2, cantidad_minima=50, valor_descuento=Decimal('5.00'))
+        self._crear_regla('R-OTRO', aplica_articulo=self.articulo2, tipo_regla=TipoRegla.ARTICULO, cantidad_minima=30)
+
+        indice = obtener_indice(self.lista_precio)
+        self.assertEqual(indice.tramos_cantidad(self.articulo1.articulo_id, self.grupo.grupo_id, self.linea.linea_id), [1, 10, 50])
+        self.assertEqual(indice.tramo_articulo(self.articulo1.articulo_id, self.grupo.grupo_id, self.linea.linea_id, 49), 10)
+
+        url = reverse('lista-precio-escalas', args=[self.lista_precio.lista_precio_id])
+        response = self.client.get(url, {'articulo': str(self.articulo1.articulo_id), 'canal': CanalVenta.B2C})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        escalas = response.data['escalas']
+        self.assertEqual([(e['cantidad_desde'], e['cantidad_hasta']) for e in escalas], [(1, 9), (10, 49), (50, None)])
+        self.assertEqual([e['precio_final'] for e in escalas], [Decimal('100.00'), Decimal('95.00'), Decimal('90.25')])
+
+        # Cada tramo coincide con calculate_price en cualquier cantidad dentro del tramo
+        for escala in escalas:
+            for cantidad in (escala['cantidad_desde'], (escala['cantidad_hasta'] or 80)):
+                resultado = calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, cantidad)
+                self.assertEqual(resultado['precio_final'], escala['precio_final'])
+
+        response = self.client.get(url, {'articulo': 'no-es-uuid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_calculate_order_prices_reglas_de_pedido(self):
+        self._crear_regla('R-PED', tipo_regla=TipoRegla.MONTO_PEDIDO, monto_minimo=Decimal('500.00'),
+                          tipo_descuento=TipoDescuento.MONTO_FIJO, valor_descuento=Decimal('30.00'),
+                          descripcion='30 por pedido')
+        self._crear_regla('R-ESC', tipo_regla=TipoRegla.ESCALA_MONTO, aplica_articulo=self.articulo2, prioridad=2,
+                          monto_minimo=Decimal('1000.00'), valor_descuento=Decimal('5.00'))
+
+        # La regla de pedido no interviene al cotizar una línea suelta
+        self.assertEqual(calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 10)['precio_final'], Decimal('100.00'))
+
+        # Subtotal 240 < 500: sin reglas de pedido
+        pedido = calculate_order_prices([
+            {'articulo_id': self.articulo1.articulo_id, 'cantidad': 2},
+            {'articulo_id': self.articulo2.articulo_id, 'cantidad': 1},
+        ], self.lista_precio, CanalVenta.B2C)
+        self.assertEqual(pedido['subtotal'], Decimal('240.00'))
+        self.assertEqual(pedido['reglas_pedido'], [])
+
+        # Subtotal 600: 30 repartidos en proporción (100/600 y 40/600 por unidad)
+        pedido = calculate_order_prices([
+            {'articulo_id': self.articulo1.articulo_id, 'cantidad': 4},
+            {'articulo_id': self.articulo2.articulo_id, 'cantidad': 5},
+        ], self.lista_precio, CanalVenta.B2C)
+        self.assertEqual(pedido['subtotal'], Decimal('600.00'))
+        self.assertEqual(pedido['reglas_pedido'], ['30 por pedido'])
+        linea1, linea2 = pedido['lineas']
+        self.assertEqual(linea1['precio_final'], Decimal('95.00'))
+        self.assertEqual(linea2['precio_final'], Decimal('38.00'))
+        self.assertEqual(pedido['total'], Decimal('570.00'))
+        self.assertIn('30 por pedido', linea2['reglas_aplicadas'])
+
+        # Subtotal 1200: además 5% al artículo 2, con el precio mínimo de 30
+        pedido = calculate_order_prices([
+            {'articulo_id': self.articulo1.articulo_id, 'cantidad': 4},
+            {'articulo_id': self.articulo2.articulo_id, 'cantidad': 20},
+        ], self.lista_precio, CanalVenta.B2C)
+        self.assertEqual(pedido['reglas_pedido'], ['30 por pedido', 'Regla R-ESC'])
+        self.assertEqual(pedido['lineas'][1]['precio_final'], Decimal('37.05'))
+
+    def test_evaluar_carrito_combos(self):
+        hoy = date.today()
+        combo_a = CombinacionProducto.objects.create(
+            combinacion_id=uuid.uuid4(), lista_precio=self.lista_precio, nombre='Combo A',
+            tipo_beneficio=TipoBeneficio.DESCUENTO_PORCENTAJE, valor_beneficio=Decimal('10.00'),
+            fecha_inicio=hoy, fecha_fin=hoy, estado=EstadoEntidades.ACTIVO
+        )
+        DetalleCombinacionProducto.objects.create(
+            detalle_combinacion_id=uuid.uuid4(), combinacion_producto=combo_a,
+            tipo_item=TipoItem.ARTICULO, articulo=self.articulo1, cantidad_requerida=2
+        )
+        DetalleCombinacionProducto.objects.create(
+            detalle_combinacion_id=uuid.uuid4(), combinacion_producto=combo_a,
+            tipo_item=TipoItem.GRUPO, grupo=self.grupo, cantidad_requerida=1
+        )
+        combo_b = CombinacionProducto.objects.create(
+            combinacion_id=uuid.uuid4(), lista_precio=self.lista_precio, nombre='Combo B',
+            tipo_beneficio=TipoBeneficio.DESCUENTO_MONTO_FIJO, valor_beneficio=Decimal('5.00'),
+            fecha_inicio=hoy, fecha_fin=hoy, estado=EstadoEntidades.ACTIVO
+        )
+        DetalleCombinacionProducto.objects.create(
+            detalle_combinacion_id=uuid.uuid4(), combinacion_producto=combo_b,
+            tipo_item=TipoItem.ARTICULO, articulo=self.articulo2, cantidad_requerida=1
+        )
+
+        url = reverse('combinacion-evaluar-carrito')
+        data = {
+            'lista_precio_id': str(self.lista_precio.lista_precio_id),
+            'items': [
+                {'articulo_id': str(self.articulo1.articulo_id), 'cantidad': 2},
+                {'articulo_id': str(self.articulo2.articulo_id), 'cantidad': 1},
+            ]
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({c['combo_nombre'] for c in response.data['combos_cumplidos']}, {'Combo A', 'Combo B'})
+
+        # El artículo 2 solo alcanza para uno: gana el 10% de 240 sobre 5 fijos
+        self.assertEqual([a['combo_nombre'] for a in response.data['asignacion']], ['Combo A'])
+        self.assertEqual(response.data['beneficio_total'], Decimal('24.00'))
+
+        # Con una unidad más del artículo 1, el grupo la toma y quedan ambos
+        data['items'][0]['cantidad'] = 3
+        response = self.client.post(url, data, format='json')
+        self.assertEqual([a['combo_nombre'] for a in response.data['asignacion']], ['Combo A', 'Combo B'])
+        self.assertEqual(response.data['beneficio_total'], Decimal('35.00'))
+
+        # Datos mal formados: 400 en lugar de un error del ORM
+        for invalido in (
+            {**data, 'lista_precio_id': 'no-es-uuid'},
+            {**data, 'canal': 99},
+            {**data, 'items': [{'articulo_id': 'no-es-uuid', 'cantidad': 1}]},
+            {**data, 'items': [{'articulo_id': str(self.articulo1.articulo_id), 'cantidad': -1}]},
+            {**data, 'items': []},
+        ):
+            self.assertEqual(self.client.post(url, invalido, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Desactivar un combo invalida el índice de la lista
+        combo_a.estado = EstadoEntidades.DE_BAJA
+        combo_a.save()
+        response = self.client.post(url, data, format='json')
+        self.assertEqual([a['combo_nombre'] for a in response.data['asignacion']], ['Combo B'])
+
+        # Otro worker reactiva el combo: aquí no corren sus signals, solo cambia la generación compartida
+        indice = obtener_indice_combos(self.lista_precio)
+        with unittest.mock.patch('auditoria.signals.invalidar_indice_combos'):
+            combo_a.estado = EstadoEntidades.ACTIVO
+            combo_a.save()
+        self.assertIs(obtener_indice_combos(self.lista_precio), indice)
+        generaciones.subir(f'combos:{self.lista_precio.lista_precio_id}')
+        self.assertIsNot(obtener_indice_combos(self.lista_precio), indice)
+        response = self.client.post(url, data, format='json')
+        self.assertEqual([a['combo_nombre'] for a in response.data['asignacion']], ['Combo A', 'Combo B'])
+
+    def test_explain_calcular_precio_y_pedido(self):
+        self._crear_regla('R-GRP', aplica_grupo=self.grupo)
+        self._crear_regla('R-B2B', aplica_grupo=self.grupo, prioridad=2, aplica_canal=str(CanalVenta.B2B))
+        self._crear_regla('R-Q10', aplica_articulo=self.articulo1, tipo_regla=TipoRegla.ARTICULO,
+                          prioridad=3, cantidad_minima=10)
+        self._crear_regla('R-PED', tipo_regla=TipoRegla.MONTO_PEDIDO, monto_minimo=Decimal('1000.00'))
+
+        url = reverse('calcular_precio_articulo') + '?explain=1'
+        calc_data = {
+            'articulo_id': str(self.articulo1.articulo_id),
+            'lista_precio_id': str(self.lista_precio.lista_precio_id),
+            'canal': CanalVenta.B2C,
+            'cantidad': 2
+        }
+        response = self.client.post(url, calc_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['precio_unitario_calculado'], Decimal('90.00'))
+
+        explain = response.data['explain']
+        self.assertEqual(explain['fuente'], 'calculo')
+        self.assertEqual(
+            [(paso['codigo'], paso['estado']) for paso in explain['reglas']],
+            [('R-GRP', 'aplicada'), ('R-B2B', 'omitida'), ('R-Q10', 'omitida')]
+        )
+        self.assertEqual(explain['reglas'][0]['precio_despues'], Decimal('90.00'))
+        self.assertFalse(explain['ajustado_a_minimo'])
+        self.assertEqual(
+            set(explain['etapas']),
+            {'precio_efectivo', 'indice', 'busqueda_precio', 'busqueda_reglas', 'aplicacion_reglas'}
+        )
+        self.assertEqual(explain['etapas']['precio_efectivo']['consultas'], 1)
+
+        # Sin el parámetro la respuesta no cambia
+        response = self.client.post(reverse('calcular_precio_articulo'), calc_data, format='json')
+        self.assertNotIn('explain', response.data)
+
+        lineas = [
+            {'articulo_id': self.articulo1.articulo_id, 'cantidad': 10},
+            {'articulo_id': self.articulo2.articulo_id, 'cantidad': 5},
+        ]
+        explicado = explicar_pedido(lineas, self.lista_precio, CanalVenta.B2C)
+        esperado = calculate_order_prices(lineas, self.lista_precio, CanalVenta.B2C)
+        for campo in ('subtotal', 'total', 'reglas_pedido'):
+            self.assertEqual(explicado[campo], esperado[campo])
+        for obtenida, linea in zip(explicado['lineas'], esperado['lineas']):
+            self.assertEqual(obtenida['precio_final'], linea['precio_final'])
+            self.assertEqual(obtenida['reglas_aplicadas'], linea['reglas_aplicadas'])
+        self.assertEqual(
+            [(regla['codigo'], regla['estado']) for regla in explicado['explicacion']['reglas_pedido']],
+            [('R-PED', 'omitida')]
+        )
+        self.assertEqual([paso['estado'] for paso in explicado['explicacion']['lineas'][0]['reglas']],
+                         ['aplicada', 'omitida', 'aplicada'])
+
+        # La explicación sale del mismo cálculo, también con la aritmética de enteros
+        with override_settings(PRECIOS_ARITMETICA='enteros'):
+            explicado = explicar_pedido(lineas, self.lista_precio, CanalVenta.B2C)
+        pasos = explicado['explicacion']['lineas'][0]['reglas']
+        self.assertEqual([paso['precio_despues'] for paso in pasos if paso['estado'] == 'aplicada'],
+                         [Decimal('90.00'), Decimal('81.00')])
+        self.assertEqual(explicado['lineas'][0]['precio_final'], esperado['lineas'][0]['precio_final'])
+
+    def test_endpoints_asincronos_igual_que_sincronos(self):
+        self._crear_regla('R-GRP', aplica_grupo=self.grupo)
+        encabezados = self._como_staff()
+
+        calc_data = {
+            'articulo_id': str(self.articulo1.articulo_id),
+            'lista_precio_id': str(self.lista_precio.lista_precio_id),
+            'canal': CanalVenta.B2C,
+            'cantidad': 2
+        }
+        url_async = reverse('calcular_precio_articulo_async')
+        sincrona = self.client.post(reverse('calcular_precio_articulo'), calc_data, format='json')
+        asincrona = async_to_sync(self.async_client.post)(
+            url_async, calc_data, content_type='application/json', headers=encabezados
+        )
+        self.assertEqual(asincrona.status_code, status.HTTP_200_OK)
+        self.assertEqual(asincrona.json(), json.loads(sincrona.content))
+
+        sim_data = {
+            'lista_precio_id': str(self.lista_precio.lista_precio_id),
+            'canal': CanalVenta.B2C,
+            'detalles': [
+                {'articulo_id': str(self.articulo1.articulo_id), 'cantidad': 3},
+                {'articulo_id': str(self.articulo2.articulo_id), 'cantidad': 2},
+            ]
+        }
+        sincrona = self.client.post(reverse('orden-simular-pedido'), sim_data, format='json')
+        asincrona = async_to_sync(self.async_client.post)(
+            reverse('simular_pedido_async'), sim_data, content_type='application/json', headers=encabezados
+        )
+        self.assertEqual(asincrona.status_code, status.HTTP_200_OK)
+        self.assertEqual(asincrona.json(), json.loads(sincrona.content))
+
+        # Sin credenciales, el mismo error que la vista síncrona
+        self.client.force_authenticate(user=None)
+        sincrona = self.client.post(reverse('calcular_precio_articulo'), calc_data, format='json')
+        asincrona = async_to_sync(self.async_client.post)(url_async, calc_data, content_type='application/json')
+        self.assertEqual(asincrona.status_code, sincrona.status_code)
+        self.assertEqual(asincrona.json(), json.loads(sincrona.content))
+
+    @override_settings(
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'generaciones': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                             'LOCATION': 'cache_generaciones'},
+        },
+        GENERACIONES_CACHE='generaciones',
+    )
+    def test_endpoints_asincronos_con_generaciones_en_base(self):
+        call_command('createcachetable', stdout=io.StringIO())
+        encabezados = self._como_staff()
+        # Con el índice ya cargado, validar su generación igual consulta la base: no puede hacerse en el event loop
+        obtener_indice(self.lista_precio)
+
+        calc_data = {
+            'articulo_id': str(self.articulo1.articulo_id),
+            'lista_precio_id': str(self.lista_precio.lista_precio_id),
+            'canal': CanalVenta.B2C,
+            'cantidad': 2
+        }
+        sincrona = self.client.post(reverse('calcular_precio_articulo'), calc_data, format='json')
+        asincrona = async_to_sync(self.async_client.post)(
+            reverse('calcular_precio_articulo_async'), calc_data, content_type='application/json', headers=encabezados
+        )
+        self.assertEqual(asincrona.status_code, status.HTTP_200_OK)
+        self.assertEqual(asincrona.json(), json.loads(sincrona.content))
+
+        sim_data = {
+            'lista_precio_id': str(self.lista_precio.lista_precio_id),
+            'canal': CanalVenta.B2C,
+            'detalles': [{'articulo_id': str(self.articulo1.articulo_id), 'cantidad': 3}],
+        }
+        asincrona = async_to_sync(self.async_client.post)(
+            reverse('simular_pedido_async'), sim_data, content_type='application/json', headers=encabezados
+        )
+        self.assertEqual(asincrona.status_code, status.HTTP_200_OK)
+
+    def test_analisis_de_reglas(self):
+        self._crear_regla('R-GRP', aplica_grupo=self.grupo, valor_descuento=Decimal('30.00'))
+        self._crear_regla('R-ART', aplica_articulo=self.articulo1, tipo_regla=TipoRegla.ARTICULO,
+                          prioridad=2, valor_descuento=Decimal('5.00'))
+        self._crear_regla('R-DUP', aplica_articulo=self.articulo1, tipo_regla=TipoRegla.ARTICULO,
+                          prioridad=3, valor_descuento=Decimal('5.00'))
+        self._crear_regla('R-CERO', aplica_linea=self.linea, tipo_regla=TipoRegla.LINEA, valor_descuento=Decimal('0.00'))
+        self._crear_regla('R-CANAL', tipo_regla=TipoRegla.CANAL, aplica_canal=str(CanalVenta.B2C))
+        self._crear_regla('R-VENC', aplica_grupo=self.grupo, fecha_inicio=date(2020, 1, 1), fecha_fin=date(2020, 12, 31))
+
+        response = self.client.get(reverse('regla-precio-analisis'), {'lista_precio': str(self.lista_precio.lista_precio_id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_reglas'], 6)
+
+        muertas = {regla['codigo']: [motivo['codigo'] for motivo in regla['motivos']] for regla in response.data['muertas']}
+        self.assertEqual(muertas, {'R-CERO': ['descuento_cero'], 'R-CANAL': ['sin_alcance'], 'R-VENC': ['vencida']})
+
+        pares = {(par['regla_a']['codigo'], par['regla_b']['codigo']) for par in response.data['solapamientos']['pares']}
+        self.assertEqual(len(pares), 3)
+        self.assertIn(('R-ART', 'R-DUP'), {tuple(sorted(par)) for par in pares})
+
+        # Con 30% el artículo 1 queda en 70 < 80 (mínimo): los descuentos por artículo no cambian el precio
+        sombreadas = {regla['codigo']: regla['sombreada_por'] for regla in response.data['sombreadas']}
+        self.assertEqual(sombreadas, {'R-ART': ['R-GRP'], 'R-DUP': ['R-ART', 'R-GRP']})
+        self.assertEqual(
+            [(regla['codigo'], regla['duplica_a']['codigo']) for regla in response.data['redundantes']],
+            [('R-DUP', 'R-ART')]
+        )
+
+        # Las reglas podables no cambian ningún precio final
+        precio = calculate_price(self.articulo1, self.lista_precio, CanalVenta.B2C, 1)
+        self.assertEqual(precio['precio_final'], Decimal('80.00'))
+        self.assertEqual(len(response.data['podables']), 5)
+
+        # Las reglas muertas no se evalúan al cotizar
+        indice = obtener_indice(self.lista_precio)
+        self.assertNotIn('R-CERO', [regla.codigo for regla in indice.reglas_candidatas(
+            self.articulo1.articulo_id, self.grupo.grupo_id, self.linea.linea_id
+        )])
+
+        response = self.client.get(reverse('regla-precio-analisis'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_listas_vigentes_indice_de_vigencias(self):
+        hoy = date.today()
+        lista_vigente = ListaPrecio.objects.create(
+            lista_precio_id=uuid.uuid4(), empresa=self.empresa, sucursal=self.sucursal, codigo='LP-HOY',
+            nombre='Lista Vigente', tipo=Tipo.MINORISTA, canal=CanalVenta.B2C, tipo_moneda=Moneda.SOL,
+            estado=EstadoEntidades.ACTIVO, modificado_por=self.admin_user,
+            fecha_vigencia_inicio=hoy - timedelta(days=10), fecha_vigencia_fin=hoy + timedelta(days=10)
+        )
+        url = reverse('lista-precio-vigentes')
+
+        response = self.client.get(url, {'empresa': self.empresa.empresa_id, 'fecha': hoy.isoformat()})
+        self.assertEqual([lista['codigo'] for lista in response.data['listas']], ['LP-HOY'])
+
+        # Fechas anteriores al índice se resuelven con el filtro por rango
+        response = self.client.get(url, {'empresa': self.empresa.empresa_id, 'fecha': '2023-06-01'})
+        self.assertEqual([lista['codigo'] for lista in response.data['listas']], ['LP001'])
+
+        # Un árbol por empresa, con sus listas no vencidas
+        self.assertEqual(obtener_indice_vigencias('listas_precio', self.empresa.empresa_id).vigentes(hoy),
+                         [lista_vigente.pk])
+
+        # Dar de baja la lista invalida el índice
+        lista_vigente.estado = EstadoEntidades.DE_BAJA
+        lista_vigente.save()
+        response = self.client.get(url, {'empresa': self.empresa.empresa_id, 'fecha': hoy.isoformat()})
+        self.assertEqual(response.data['cantidad'], 0)
+
+        # Otro worker la reactiva: aquí no corren sus signals, solo cambia la generación compartida
+        with unittest.mock.patch('auditoria.signals.invalidar_vigencias'):
+            lista_vigente.estado = EstadoEntidades.ACTIVO
+            lista_vigente.save()
+        generaciones.subir('vigencias:listas_precio')
+        response = self.client.get(url, {'empresa': self.empresa.empresa_id, 'fecha': hoy.isoformat()})
+        self.assertEqual([lista['codigo'] for lista in response.data['listas']], ['LP-HOY'])
+
+    def test_bench_pricing_catalogo_sintetico(self):
+        articulos_antes = Articulo.objects.count()
+        salida = io.StringIO()
+        call_command(
+            'bench_pricing', lineas=1, grupos_por_linea=2, articulos_por_grupo=5, combos=2,
+            cotizaciones=20, carritos=3, lineas_carrito=4, ordenes=1, stdout=salida
+        )
+        resultado = json.loads(salida.getvalue())
+        self.assertEqual(resultado['catalogo']['articulos'], 10)
+        self.assertEqual(resultado['cotizacion']['cache_caliente']['muestras'], 20)
+        self.assertEqual(resultado['carritos']['latencia_carrito']['muestras'], 3)
+        self.assertEqual(resultado['ordenes']['latencia_creacion']['muestras'], 1)
+        # Sin --conservar el catálogo generado se deshace
+        self.assertEqual(Articulo.objects.count(), articulos_antes)
+
+
+    def test_primera_orden_numero_uno(self):
+        # Secuencia recién creada sobre la tabla vacía (el DROP se revierte con la transacción del test)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP SEQUENCE {SECUENCIA}')
+        crear_secuencia()
+        crear_secuencia()
+        with unittest.mock.patch('ventas.numeracion._numerador', Numerador(bloque=1)):
+            orden = self._crear_orden()
+            self.assertEqual(orden.numero_orden, 1)
+            # Volver a ejecutarla (otro migrate) no salta números
+            crear_secuencia()
+            self.assertEqual(siguiente_numero(), 2)
+
+
+class NumeracionOrdenesTestCase(APITransactionTestCase):
+    # Los hilos usan sus propias conexiones: los datos de setUp deben estar confirmados
+    setUp = OrdenAPITestCase.setUp
+    _datos_orden = OrdenAPITestCase._datos_orden
+    _crear_orden = OrdenAPITestCase._crear_orden
+
+    def test_creacion_concurrente_sin_numeros_repetidos(self):
+        numeros, errores = [], []
+
+        def crear():
+            try:
+                for _ in range(5):
+                    orden = self._crear_orden()
+                    numeros.append(orden.numero_orden)
+            except Exception as exc:
+                errores.append(exc)
+            finally:
+                connections.close_all()
+
+        with override_settings(NUMERACION_ORDENES_BLOQUE=3):
+            hilos = [threading.Thread(target=crear) for _ in range(6)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertEqual(len(set(numeros)), 30)
+        self.assertEqual(set(OrdenCompraCliente.objects.values_list('numero_orden', flat=True)), set(numeros))
+
+        # Otro proceso (otro Numerador) recibe sus propios bloques
+        otro = Numerador(bloque=4)
+        self.assertFalse({otro.siguiente() for _ in range(10)} & set(numeros))
+
+        # Después de migrate la secuencia se adelanta a los números existentes
+        OrdenCompraCliente.objects.filter(numero_orden=max(numeros)).update(numero_orden=10 ** 9)
+        crear_secuencia()
+        self.assertGreater(Numerador(bloque=1).siguiente(), 10 ** 9)
+
+
+class ArbolIntervalosTestCase(SimpleTestCase):
+
+    def test_en_coincide_con_busqueda_lineal(self):
+        rnd = random.Random(11)
+        intervalos = []
+        for valor in range(500):
+            inicio = rnd.randrange(0, 1000)
+            intervalos.append((inicio, inicio + rnd.randrange(0, 120), valor))
+        arbol = ArbolIntervalos(intervalos)
+
+        self.assertEqual(len(arbol), 500)
+        for punto in range(-5, 1130, 7):
+            esperado = sorted(valor for inicio, fin, valor in intervalos if inicio <= punto <= fin)
+            self.assertEqual(sorted(arbol.en(punto)), esperado, punto)
+
+    def test_extremos_inclusivos_y_fechas(self):
+        arbol = ArbolIntervalos([
+            (date(2024, 1, 1), date(2024, 1, 31), 'enero'),
+            (date(2024, 1, 31), date(2024, 2, 29), 'febrero'),
+            (date(2024, 3, 5), date(2024, 3, 1), 'invertido'),
+        ])
+        self.assertEqual(sorted(arbol.en(date(2024, 1, 31))), ['enero', 'febrero'])
+        self.assertEqual(arbol.en(date(2024, 1, 1)), ['enero'])
+        self.assertEqual(arbol.en(date(2024, 3, 2)), [])
+
+
+class AritmeticaEnterosTestCase(SimpleTestCase):
+    """Paridad del cálculo con enteros escalados contra el cálculo con Decimal"""
+
+    def _resultado(self, kernel, caso):
+        try:
+            return kernel(*caso)
+        except InvalidOperation:
+            return InvalidOperation
+
+    def test_paridad_con_decimal_en_casos_aleatorios(self):
+        rnd = random.Random(20240611)
+        for caso in casos_aritmetica(rnd, 5000, maximo_reglas=15):
+            esperado = self._resultado(aplicar_reglas_decimal, caso)
+            obtenido = self._resultado(aplicar_reglas_enteros, caso)
+            self.assertEqual(obtenido, esperado, caso)
+            if esperado is not InvalidOperation:
+                # Mismo exponente y signo, no solo el mismo valor
+                self.assertEqual(str(obtenido['precio_final']), str(esperado['precio_final']), caso)
+                self.assertEqual(str(obtenido['descuento_total']), str(esperado['descuento_total']), caso)
+
+    def test_redondeo_mitad_par_como_quantize(self):
+        regla = regla_aleatoria(random.Random(1), 1)._replace(
+            tipo_descuento=TipoDescuento.PORCENTAJE, valor_descuento=Decimal('50.00')
+        )
+        # 0.05 * 50% = 0.025 -> 0.02 y 0.15 * 50% = 0.075 -> 0.08
+        for precio, final in ((Decimal('0.05'), Decimal('0.02')), (Decimal('0.15'), Decimal('0.08'))):
+            resultado = aplicar_reglas_enteros(precio, Decimal('0.00'), Decimal('0.00'), [regla])
+            self.assertEqual(resultado['precio_final'], final)
+            self.assertEqual(resultado, aplicar_reglas_decimal(precio, Decimal('0.00'), Decimal('0.00'), [regla]))
+
+    @override_settings(PRECIOS_ARITMETICA='enteros')
+    def test_setting_selecciona_enteros(self):
+        with unittest.mock.patch('ventas.utils.aplicar_reglas_enteros', wraps=aplicar_reglas_enteros) as kernel:
+            aplicar_reglas(Decimal('10.00'), Decimal('5.00'), Decimal('1.00'), [])
+        kernel.assert_called_once()
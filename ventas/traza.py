@@ -0,0 +1,204 @@
+"""
+Modo explicación (?explain=1) de las cotizaciones.
+
+Cotiza con el mismo cálculo de ventas.utils (precio_linea y aplicar_reglas,
+con la aritmética configurada) pasándole una traza y una lista de pasos: el
+cálculo mide el tiempo total y de SQL de cada etapa (búsqueda del precio,
+búsqueda de reglas y aplicación de reglas con el ajuste al precio mínimo) y
+registra el precio antes y después de cada regla que aplica. Este módulo solo
+agrega las reglas candidatas que se omitieron y por qué.
+
+Con el modo apagado no se ejecuta nada de este módulo. Con el modo encendido
+el cálculo se ejecuta aunque la cotización esté en la cache, y el precio que
+se informa es el de la cache, el mismo que se cobra.
+"""
+import time
+from contextlib import contextmanager, nullcontext
+from decimal import Decimal
+
+from django.db import connection
+
+from precios.indice import obtener_indice
+from ventas.utils import precio_linea, aplicar_reglas_pedido, cargar_articulos
+
+
+def solicitado(request):
+    """True si la petición pide el modo explicación"""
+    return request.query_params.get('explain', '').lower() in ('1', 'true')
+
+
+class Traza:
+    """Tiempo total, tiempo de SQL y consultas acumulados por etapa"""
+
+    def __init__(self):
+        self.etapas = {}
+        self._consultas = 0
+        self._segundos_sql = 0.0
+
+    def _medir_sql(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self._consultas += 1
+            self._segundos_sql += time.perf_counter() - inicio
+
+    @contextmanager
+    def etapa(self, nombre):
+        consultas, segundos_sql = self._consultas, self._segundos_sql
+        inicio = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self._medir_sql):
+                yield
+        finally:
+            etapa = self.etapas.setdefault(nombre, {'ms': 0.0, 'sql_ms': 0.0, 'consultas': 0})
+            etapa['ms'] += (time.perf_counter() - inicio) * 1000
+            etapa['sql_ms'] += (self._segundos_sql - segundos_sql) * 1000
+            etapa['consultas'] += self._consultas - consultas
+
+    def resumen(self):
+        return {
+            nombre: {'ms': round(etapa['ms'], 3), 'sql_ms': round(etapa['sql_ms'], 3), 'consultas': etapa['consultas']}
+            for nombre, etapa in self.etapas.items()
+        }
+
+
+def medir(traza, nombre):
+    """Etapa de la traza, o un contexto vacío si no hay traza"""
+    return traza.etapa(nombre) if traza is not None else nullcontext()
+
+
+def _alcance(regla, articulo):
+    if regla.articulo_id == str(articulo.articulo_id):
+        return 'articulo'
+    if regla.grupo_id == str(articulo.grupo_id_id):
+        return 'grupo'
+    return 'linea'
+
+
+def explicar_linea(traza, indice, lista_precio, articulo, canal, cantidad):
+    """
+    Cotiza una línea registrando cada etapa en la traza.
+
+    Returns:
+        dict: El formato de calculate_price más la clave "explicacion".
+    """
+    pasos = []
+    resultado = precio_linea(indice, lista_precio, articulo, canal, cantidad, traza=traza, pasos=pasos)
+    if "error" in resultado:
+        return resultado
+
+    precio_info = indice.precio(articulo.articulo_id)
+    tramo = indice.tramo_lista(cantidad) if cantidad >= 1 else cantidad
+    aplicadas = {regla.regla_precio_id: (antes, descuento, despues) for regla, antes, descuento, despues in pasos}
+    reglas = []
+    for regla in indice.reglas_candidatas(articulo.articulo_id, articulo.grupo_id_id, articulo.grupo_id.linea_id):
+        paso = {
+            "codigo": regla.codigo,
+            "descripcion": regla.descripcion,
+            "prioridad": regla.prioridad,
+            "alcance": _alcance(regla, articulo),
+        }
+        if regla.regla_precio_id in aplicadas:
+            antes, descuento, despues = aplicadas[regla.regla_precio_id]
+            paso.update({
+                "estado": "aplicada" if descuento else "sin_efecto",
+                "motivo": None if descuento else 'El descuento calculado es cero.',
+                "precio_antes": antes,
+                "descuento": descuento,
+                "precio_despues": despues,
+            })
+        elif not regla.aplica_a_canal(canal):
+            paso.update({"estado": "omitida", "motivo": f'Solo aplica al canal {regla.aplica_canal}.'})
+        else:
+            paso.update({"estado": "omitida", "motivo": f'Requiere una cantidad mínima de {regla.cantidad_minima}.'})
+        reglas.append(paso)
+
+    precio_calculado = pasos[-1][3] if pasos else precio_info.precio_base
+    return {
+        **resultado,
+        "explicacion": {
+            "articulo_id": str(articulo.articulo_id),
+            "cantidad": cantidad,
+            "tramo": tramo,
+            "precio_base": precio_info.precio_base,
+            "precio_minimo": precio_info.precio_minimo,
+            "reglas": reglas,
+            "precio_calculado": precio_calculado,
+            "ajustado_a_minimo": precio_calculado < precio_info.precio_minimo,
+        },
+    }
+
+
+def explicar_precio(articulo, lista_precio, canal, cantidad, traza=None):
+    """
+    Versión explicada de calculate_price.
+
+    Returns:
+        dict: El formato de calculate_price más "explicacion" (con las etapas).
+    """
+    traza = traza or Traza()
+    with traza.etapa('indice'):
+        indice = obtener_indice(lista_precio)
+    resultado = explicar_linea(traza, indice, lista_precio, articulo, canal, cantidad)
+    if "explicacion" in resultado:
+        resultado["explicacion"]["etapas"] = traza.resumen()
+    return resultado
+
+
+def explicar_pedido(lineas, lista_precio, canal, traza=None):
+    """
+    Versión explicada de calculate_order_prices.
+
+    Returns:
+        dict: El formato de calculate_order_prices más "explicacion", con la
+            explicación de cada línea, las reglas de pedido consideradas y
+            las etapas.
+    """
+    traza = traza or Traza()
+    lineas = list(lineas)
+    with traza.etapa('indice'):
+        indice = obtener_indice(lista_precio)
+    with traza.etapa('carga_articulos'):
+        articulos = cargar_articulos(linea['articulo_id'] for linea in lineas)
+
+    resultados = []
+    for linea in lineas:
+        articulo = articulos.get(str(linea['articulo_id']))
+        if articulo is None:
+            return {"lineas": resultados, "error": f"Artículo con ID {linea['articulo_id']} no encontrado."}
+        resultado = explicar_linea(traza, indice, lista_precio, articulo, canal, linea['cantidad'])
+        if "error" in resultado:
+            return {"lineas": resultados, "error": resultado["error"]}
+        resultado["articulo"] = articulo
+        resultado["cantidad"] = linea['cantidad']
+        resultados.append(resultado)
+
+    with traza.etapa('reglas_pedido'):
+        subtotal = sum((r["precio_final"] * r["cantidad"] for r in resultados), Decimal('0.00'))
+        pedido = aplicar_reglas_pedido(resultados, indice, canal)
+
+    reglas_pedido = []
+    for regla in indice.reglas_pedido:
+        if not regla.aplica_a_canal(canal):
+            estado, motivo = "omitida", f'Solo aplica al canal {regla.aplica_canal}.'
+        elif not regla.aplica_a_monto(subtotal):
+            estado, motivo = "omitida", f'Requiere un monto mínimo de {regla.monto_minimo}.'
+        elif regla.descripcion in pedido["reglas_pedido"]:
+            estado, motivo = "aplicada", None
+        else:
+            estado, motivo = "sin_efecto", 'Ninguna línea del pedido está en su alcance.'
+        reglas_pedido.append({
+            "codigo": regla.codigo,
+            "descripcion": regla.descripcion,
+            "prioridad": regla.prioridad,
+            "estado": estado,
+            "motivo": motivo,
+        })
+
+    pedido["explicacion"] = {
+        "lineas": [resultado.pop("explicacion") for resultado in pedido["lineas"]],
+        "reglas_pedido": reglas_pedido,
+        "etapas": traza.resumen(),
+    }
+    return pedido
@@ -1,6 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from ventas.views import OrdenViewSet, CalcularPrecioArticuloAPIView, EstadisticasGeneralesAPIView # EstadisticasGeneralesAPIView will be added next
+from ventas.views import (
+    OrdenViewSet, CalcularPrecioArticuloAPIView, EstadisticasGeneralesAPIView, EstadisticasCacheCotizacionesAPIView
+)
+from ventas.views import CalcularPrecioArticuloAsyncAPIView, SimularPedidoAsyncAPIView
 
 router = DefaultRouter()
 router.register(r'ordenes', OrdenViewSet, basename='orden')
@@ -9,4 +12,8 @@ urlpatterns = [
     path('', include(router.urls)),
     path('calcular-precio-articulo/', CalcularPrecioArticuloAPIView.as_view(), name='calcular_precio_articulo'),
     path('estadisticas/', EstadisticasGeneralesAPIView.as_view(), name='estadisticas_ventas'), # Will be implemented next
+    path('cache-cotizaciones/', EstadisticasCacheCotizacionesAPIView.as_view(), name='cache_cotizaciones'),
+    # Versiones asíncronas para ASGI (trading_system/asgi.py)
+    path('async/calcular-precio-articulo/', CalcularPrecioArticuloAsyncAPIView.as_view(), name='calcular_precio_articulo_async'),
+    path('async/simular-pedido/', SimularPedidoAsyncAPIView.as_view(), name='simular_pedido_async'),
 ]
@@ -1,10 +1,14 @@
-from datetime import date
+from contextlib import nullcontext
 from decimal import Decimal
-from django.db.models import Q
 
-from precios.models import PrecioArticulo, ReglaPrecio, ListaPrecio
+from django.conf import settings
+
+from precios.indice import obtener_indice
+from precios.models import ListaPrecio
 from productos.models import Articulo
-from trading_system.choices import EstadoEntidades, TipoRegla, TipoDescuento, CanalVenta
+from trading_system.choices import TipoDescuento
+from ventas.aritmetica import aplicar_reglas_enteros
+from ventas.cache_cotizaciones import obtener_cache
 
 
 def calculate_price(articulo: Articulo, lista_precio: ListaPrecio, canal: int, cantidad: int):
@@ -28,81 +32,313 @@ def calculate_price(articulo: Articulo, lista_precio: ListaPrecio, canal: int, c
                 "error": str # Si ocurre un error
             }
     """
-    today = date.today()
+    indice = obtener_indice(lista_precio)
+    return precio_linea(indice, lista_precio, articulo, canal, cantidad)
+
+
+_SIN_ETAPA = nullcontext()
+
+
+def _etapa(traza, nombre):
+    return traza.etapa(nombre) if traza is not None else _SIN_ETAPA
+
+
+def precio_linea(indice, lista_precio, articulo, canal, cantidad, traza=None, pasos=None):
+    """
+    Cotiza una línea con el índice de la lista, pasando por la cache de
+    cotizaciones. Los errores no se guardan en la cache.
+
+    El modo explicación (ventas.traza) usa este mismo cálculo: con traza se
+    mide cada etapa, y con pasos (una lista) el cálculo se ejecuta aunque la
+    cotización esté en la cache y registra en ella cada regla que aplica
+    (ver aplicar_reglas). El resultado sigue siendo el de la cache si lo hay.
+    """
+    cache = obtener_cache()
+    en_cache = None
+    if cache is not None:
+        clave = cache.clave(articulo.articulo_id, indice.lista_precio_id, canal, indice.tramo_lista(cantidad), indice.fecha,
+                            indice.generacion)
+        en_cache = cache.obtener(clave)
+        if en_cache is not None and pasos is None:
+            return en_cache
 
     # 1. Obtener el precio base y mínimo del artículo en la lista de precios
-    try:
-        precio_info = PrecioArticulo.objects.get(
-            lista_precio=lista_precio,
-            articulo=articulo,
-            estado=EstadoEntidades.ACTIVO
-        )
-        precio_base = precio_info.precio_base
-        precio_minimo = precio_info.precio_minimo
-    except PrecioArticulo.DoesNotExist:
+    with _etapa(traza, 'busqueda_precio'):
+        precio_info = indice.precio(articulo.articulo_id)
+    if precio_info is None:
         # Si no hay un precio definido, no se puede vender.
         return {
             "error": f"El artículo {articulo.descripcion} no tiene un precio definido en la lista {lista_precio.nombre}."
         }
 
-    # 2. Inicializar variables
-    precio_calculado = precio_base
-    descuento_total = Decimal('0.0')
-    reglas_aplicadas = []
+    # 2. Reglas aplicables por jerarquía de producto (artículo, grupo o línea),
+    # canal y cantidad mínima, ya ordenadas por prioridad en el índice
+    with _etapa(traza, 'busqueda_reglas'):
+        reglas = indice.reglas_aplicables(
+            articulo.articulo_id,
+            articulo.grupo_id_id,
+            articulo.grupo_id.linea_id,
+            canal,
+            cantidad
+        )
 
-    # 3. Buscar y filtrar todas las reglas de precios aplicables
-    # Filtro por jerarquía de producto: artículo, grupo o línea
-    # Se asume que Articulo tiene un FK a GrupoArticulo y GrupoArticulo a LineaArticulo
-    q_rules = Q(lista_precio=lista_precio) & \
-              Q(estado=EstadoEntidades.ACTIVO) & \
-              Q(fecha_inicio__lte=today) & \
-              Q(fecha_fin__gte=today) & \
-              (
-                      Q(aplica_articulo=articulo) |
-                      Q(aplica_grupo=articulo.grupo_id) |
-                      Q(aplica_linea=articulo.grupo_id.linea))
+    with _etapa(traza, 'aplicacion_reglas'):
+        resultado = aplicar_reglas(precio_info.precio_base, precio_info.precio_minimo, articulo.costo_actual, reglas,
+                                   pasos)
+    if en_cache is not None:
+        return en_cache
+    if cache is not None:
+        cache.guardar(clave, resultado)
+    return resultado
 
-    # Filtro por canal de venta (si la regla lo especifica)
-    q_rules &= (Q(aplica_canal__isnull=True) | Q(aplica_canal='') | Q(aplica_canal=str(canal)))
 
-    # Filtro por cantidad mínima
-    q_rules &= (Q(cantidad_minima__isnull=True) | Q(cantidad_minima__lte=cantidad))
+def cargar_articulos(articulo_ids):
+    """
+    Carga en una sola consulta los artículos indicados con su grupo y línea.
+
+    Returns:
+        dict: articulo_id (str) -> Articulo
+    """
+    articulos = Articulo.objects.select_related('grupo_id__linea').in_bulk(
+        {str(articulo_id) for articulo_id in articulo_ids}
+    )
+    return {str(articulo_id): articulo for articulo_id, articulo in articulos.items()}
 
-    reglas = ReglaPrecio.objects.filter(q_rules).order_by('prioridad')
 
-    # 4. Aplicar las reglas en orden de prioridad
-    for regla in reglas:
-        descuento_de_regla = Decimal('0.0')
+def calculate_prices(lineas, lista_precio: ListaPrecio, canal: int):
+    """
+    Calcula el precio de varias líneas de un pedido con un número constante de consultas.
 
-        if regla.tipo_regla == TipoRegla.PRECIO_FINAL:
-            # Esta regla establece un precio final, ignorando cálculos anteriores.
-            # El descuento se calcula como la diferencia para fines informativos.
-            descuento_de_regla = precio_calculado - regla.valor_descuento
-            precio_calculado = regla.valor_descuento
+    Los artículos se cargan en bloque (con grupo y línea) y los precios y reglas
+    salen del índice compilado de la lista, por lo que el costo no depende de la
+    cantidad de líneas.
 
-        elif regla.tipo_regla == TipoRegla.DESCUENTO:
-            if regla.tipo_descuento == TipoDescuento.PORCENTAJE:
-                descuento_de_regla = (precio_calculado * regla.valor_descuento) / 100
-            elif regla.tipo_descuento == TipoDescuento.MONTO:
-                descuento_de_regla = regla.valor_descuento
+    Args:
+        lineas (list[dict]): Líneas con las claves 'articulo_id' y 'cantidad'.
+        lista_precio (ListaPrecio): La lista de precios a aplicar.
+        canal (int): El canal de venta (de trading_system.choices.CanalVenta).
+
+    Returns:
+        list[dict]: Un resultado por línea, en el mismo orden, con el formato de
+            calculate_price más las claves "articulo" y "cantidad". Si el artículo
+            no existe o no tiene precio, el resultado contiene "error".
+    """
+    lineas = list(lineas)
+    indice = obtener_indice(lista_precio)
+    articulos = cargar_articulos(linea['articulo_id'] for linea in lineas)
+    return cotizar_lineas(indice, lista_precio, lineas, articulos, canal)
+
+
+def cotizar_lineas(indice, lista_precio, lineas, articulos, canal):
+    """
+    Cotiza las líneas con el índice de la lista y los artículos ya cargados
+    (articulo_id (str) -> Articulo con grupo y línea). No consulta la base de datos.
+
+    Returns:
+        list[dict]: El formato de calculate_prices.
+    """
+    resultados = []
+    for linea in lineas:
+        articulo_id = linea['articulo_id']
+        cantidad = linea['cantidad']
+        articulo = articulos.get(str(articulo_id))
+
+        if articulo is None:
+            resultados.append({"error": f"Artículo con ID {articulo_id} no encontrado."})
+            continue
 
-            precio_calculado -= descuento_de_regla
+        resultado = precio_linea(indice, lista_precio, articulo, canal, cantidad)
+        if "error" in resultado:
+            resultados.append(resultado)
+            continue
 
-        elif regla.tipo_regla == TipoRegla.RECARGO:
+        resultado["articulo"] = articulo
+        resultado["cantidad"] = cantidad
+        resultados.append(resultado)
+
+    return resultados
+
+
+def calculate_order_prices(lineas, lista_precio: ListaPrecio, canal: int):
+    """
+    Calcula el precio de un pedido completo en dos fases.
+
+    1. Cotiza cada línea con calculate_prices (reglas de artículo, grupo,
+       línea, canal y cantidad).
+    2. Con el subtotal del pedido calculado una sola vez, aplica en una pasada
+       las reglas MONTO_PEDIDO y ESCALA_MONTO cuyo monto_minimo se alcanza.
+       Un descuento porcentual se aplica al precio unitario de cada línea del
+       alcance de la regla; un monto fijo se reparte entre esas líneas en
+       proporción a su importe. El precio mínimo se valida al final.
+
+    Args:
+        lineas (list[dict]): Líneas con las claves 'articulo_id' y 'cantidad'.
+        lista_precio (ListaPrecio): La lista de precios a aplicar.
+        canal (int): El canal de venta (de trading_system.choices.CanalVenta).
+
+    Returns:
+        dict: {
+                "lineas": list[dict],  # formato de calculate_prices
+                "subtotal": Decimal,   # importe de las líneas antes de las reglas del pedido
+                "total": Decimal,
+                "reglas_pedido": list[str],
+                "error": str # Si alguna línea tiene error
+            }
+    """
+    resultados = calculate_prices(lineas, lista_precio, canal)
+    for resultado in resultados:
+        if "error" in resultado:
+            return {"lineas": resultados, "error": resultado["error"]}
+
+    return aplicar_reglas_pedido(resultados, obtener_indice(lista_precio), canal)
+
+
+def aplicar_reglas_pedido(resultados, indice, canal):
+    """
+    Segunda fase de calculate_order_prices: aplica las reglas MONTO_PEDIDO y
+    ESCALA_MONTO sobre las líneas ya cotizadas (formato de calculate_prices,
+    sin errores), modificándolas.
+
+    Returns:
+        dict: El formato de calculate_order_prices.
+    """
+    subtotal = sum((r["precio_final"] * r["cantidad"] for r in resultados), Decimal('0.00'))
+
+    reglas = [
+        regla for regla in indice.reglas_pedido
+        if regla.aplica_a_canal(canal) and regla.aplica_a_monto(subtotal)
+    ]
+
+    precios = [r["precio_final"] for r in resultados]
+    descuentos = [Decimal('0.0')] * len(resultados)
+    reglas_pedido = []
+
+    for regla in reglas:
+        alcance = [
+            i for i, r in enumerate(resultados)
+            if regla.aplica_a_articulo(r["articulo"].articulo_id, r["articulo"].grupo_id_id, r["articulo"].grupo_id.linea_id)
+        ]
+        if regla.tipo_descuento == TipoDescuento.MONTO_FIJO:
+            importe_alcance = sum(precios[i] * resultados[i]["cantidad"] for i in alcance)
+            if not importe_alcance:
+                continue
+
+        aplicada = False
+        for i in alcance:
             if regla.tipo_descuento == TipoDescuento.PORCENTAJE:
-                recargo = (precio_calculado * regla.valor_descuento) / 100
-                precio_calculado += recargo
-                # El recargo se trata como un descuento negativo
-                descuento_de_regla = -recargo
-            elif regla.tipo_descuento == TipoDescuento.MONTO:
-                precio_calculado += regla.valor_descuento
-                descuento_de_regla = -regla.valor_descuento
+                descuento_unitario = (precios[i] * regla.valor_descuento) / 100
+            elif regla.tipo_descuento == TipoDescuento.MONTO_FIJO:
+                descuento_unitario = regla.valor_descuento * precios[i] / importe_alcance
+            else:
+                continue
+
+            if descuento_unitario != Decimal('0.0'):
+                precios[i] -= descuento_unitario
+                descuentos[i] += descuento_unitario
+                resultados[i]["reglas_aplicadas"].append(regla.descripcion)
+                aplicada = True
+
+        if aplicada:
+            reglas_pedido.append(regla.descripcion)
+
+    for i, resultado in enumerate(resultados):
+        if not descuentos[i]:
+            continue
+
+        articulo = resultado["articulo"]
+        precio_minimo = indice.precio(articulo.articulo_id).precio_minimo
+        if precios[i] < precio_minimo:
+            resultado["descuento_total"] = resultado["precio_base"] - precio_minimo
+            precios[i] = precio_minimo
+            if "Ajustado a precio mínimo de venta." not in resultado["reglas_aplicadas"]:
+                resultado["reglas_aplicadas"].append("Ajustado a precio mínimo de venta.")
+        else:
+            resultado["descuento_total"] += descuentos[i]
+
+        resultado["precio_final"] = precios[i].quantize(Decimal('0.01'))
+        resultado["descuento_total"] = resultado["descuento_total"].quantize(Decimal('0.01'))
+        resultado["vendido_bajo_costo"] = resultado["precio_final"] < articulo.costo_actual
+
+    return {
+        "lineas": resultados,
+        "subtotal": subtotal,
+        "total": sum((r["precio_final"] * r["cantidad"] for r in resultados), Decimal('0.00')),
+        "reglas_pedido": reglas_pedido,
+    }
+
+
+def escalas_precio(articulo: Articulo, lista_precio: ListaPrecio, canal: int):
+    """
+    Retorna la escala completa de precios por cantidad de un artículo.
+
+    Returns:
+        list[dict]: Un tramo por cada cantidad desde la que cambian las reglas,
+            con "cantidad_desde", "cantidad_hasta" (None en el último tramo) y
+            el formato de calculate_price. Si el artículo no tiene precio, el
+            único elemento contiene "error".
+    """
+    indice = obtener_indice(lista_precio)
+    tramos = indice.tramos_cantidad(articulo.articulo_id, articulo.grupo_id_id, articulo.grupo_id.linea_id)
+
+    escalas = []
+    for i, cantidad_desde in enumerate(tramos):
+        resultado = precio_linea(indice, lista_precio, articulo, canal, cantidad_desde)
+        if "error" in resultado:
+            return [resultado]
+        resultado["cantidad_desde"] = cantidad_desde
+        resultado["cantidad_hasta"] = tramos[i + 1] - 1 if i + 1 < len(tramos) else None
+        escalas.append(resultado)
+
+    return escalas
+
+
+def aplicar_reglas(precio_base, precio_minimo, costo_actual, reglas, pasos=None):
+    """
+    Aplica en orden las reglas recibidas sobre el precio base y valida el
+    resultado contra el precio mínimo y el costo del artículo.
+
+    settings.PRECIOS_ARITMETICA elige la implementación: 'decimal' (por
+    defecto) o 'enteros' (ventas.aritmetica), con el mismo resultado.
+
+    Args:
+        precio_base (Decimal): Precio base del artículo en la lista.
+        precio_minimo (Decimal): Precio mínimo de venta en la lista.
+        costo_actual (Decimal): Costo actual del artículo.
+        reglas (list[ReglaCompilada]): Reglas aplicables en orden de prioridad.
+        pasos (list): Opcional (modo explicación). Recibe una tupla
+            (regla, precio antes, descuento, precio después) por regla.
+
+    Returns:
+        dict: El mismo formato que calculate_price (sin la clave "error").
+    """
+    if getattr(settings, 'PRECIOS_ARITMETICA', 'decimal') == 'enteros':
+        return aplicar_reglas_enteros(precio_base, precio_minimo, costo_actual, reglas, pasos)
+    return aplicar_reglas_decimal(precio_base, precio_minimo, costo_actual, reglas, pasos)
+
+
+def aplicar_reglas_decimal(precio_base, precio_minimo, costo_actual, reglas, pasos=None):
+    """Implementación de aplicar_reglas con Decimal"""
+    precio_calculado = precio_base
+    descuento_total = Decimal('0.0')
+    reglas_aplicadas = []
+
+    for regla in reglas:
+        descuento_de_regla = Decimal('0.0')
+
+        if regla.tipo_descuento == TipoDescuento.PORCENTAJE:
+            descuento_de_regla = (precio_calculado * regla.valor_descuento) / 100
+        elif regla.tipo_descuento == TipoDescuento.MONTO_FIJO:
+            descuento_de_regla = regla.valor_descuento
+
+        if pasos is not None:
+            pasos.append((regla, precio_calculado, descuento_de_regla, precio_calculado - descuento_de_regla))
+        precio_calculado -= descuento_de_regla
 
         if descuento_de_regla != Decimal('0.0'):
             descuento_total += descuento_de_regla
             reglas_aplicadas.append(regla.descripcion)
 
-    # 5. Validar contra el precio mínimo
+    # Validar contra el precio mínimo
     if precio_calculado < precio_minimo:
         # Si el precio calculado es menor que el mínimo, se ajusta al mínimo.
         # El descuento se reajusta para reflejar el cambio.
@@ -112,14 +348,13 @@ def calculate_price(articulo: Articulo, lista_precio: ListaPrecio, canal: int, c
     else:
         precio_final = precio_calculado
 
-    # 6. Determinar si la venta es bajo costo
-    vendido_bajo_costo = precio_final < articulo.costo_actual
+    # Determinar si la venta es bajo costo
+    vendido_bajo_costo = precio_final < costo_actual
 
-    # 7. Devolver el resultado
     return {
         "precio_base": precio_base,
         "precio_final": precio_final.quantize(Decimal('0.01')),
         "descuento_total": descuento_total.quantize(Decimal('0.01')),
         "reglas_aplicadas": reglas_aplicadas,
         "vendido_bajo_costo": vendido_bajo_costo
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,200 @@
+"""
+Repricing vectorizado de una lista de precios completa.
+
+Calcula el precio final de todos los artículos de una ListaPrecio para cada
+CanalVenta y cada tramo de cantidad, aplicando las reglas en orden de prioridad
+como operaciones sobre arreglos NumPy de forma (artículos, canales, tramos).
+
+El cálculo se hace en float64 y el redondeo a centavos replica el de
+calculate_price (quantize a 0.01, ROUND_HALF_EVEN). Las celdas cuyo valor cae
+tan cerca de un límite de redondeo, del precio mínimo o del costo que el error
+de float64 podría cambiar el resultado se recalculan con Decimal, así que el
+resultado coincide siempre con calculate_price.
+"""
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+
+from precios.indice import obtener_indice
+from productos.models import Articulo
+from trading_system.choices import CanalVenta, TipoDescuento
+from ventas.utils import aplicar_reglas
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy es opcional
+    np = None
+
+
+# Distancia (en centavos) a un límite por debajo de la cual se recalcula con Decimal
+TOLERANCIA_CENTAVOS = 1e-4
+
+
+class MatrizPrecios:
+    """
+    Resultado del repricing: precios y descuentos en centavos (int64) y la
+    marca de venta bajo costo, indexados por (artículo, canal, tramo).
+    """
+
+    def __init__(self, lista_precio_id, fecha, articulo_ids, canales, tramos,
+                 precio_base, precio_final, descuento_total, vendido_bajo_costo):
+        self.lista_precio_id = lista_precio_id
+        self.fecha = fecha
+        self.articulo_ids = articulo_ids
+        self.canales = canales
+        self.tramos = tramos
+        self.precio_base = precio_base
+        self.precio_final = precio_final
+        self.descuento_total = descuento_total
+        self.vendido_bajo_costo = vendido_bajo_costo
+        self._posicion = {articulo_id: i for i, articulo_id in enumerate(articulo_ids)}
+
+    def tramo(self, cantidad):
+        """Índice del tramo de cantidad que corresponde a la cantidad dada"""
+        return int(np.searchsorted(self.tramos, cantidad, side='right')) - 1
+
+    def celda(self, articulo_id, canal, cantidad):
+        """Resultado para un artículo, canal y cantidad, con valores Decimal"""
+        i = self._posicion[str(articulo_id)]
+        j = self.canales.index(canal)
+        k = self.tramo(cantidad)
+        return {
+            "precio_base": Decimal(int(self.precio_base[i])).scaleb(-2),
+            "precio_final": Decimal(int(self.precio_final[i, j, k])).scaleb(-2),
+            "descuento_total": Decimal(int(self.descuento_total[i, j, k])).scaleb(-2),
+            "vendido_bajo_costo": bool(self.vendido_bajo_costo[i, j, k]),
+        }
+
+    def filas(self):
+        """Itera todas las celdas como (articulo_id, canal, cantidad_desde, resultado)"""
+        for articulo_id in self.articulo_ids:
+            for canal in self.canales:
+                for cantidad in self.tramos:
+                    yield articulo_id, canal, int(cantidad), self.celda(articulo_id, canal, cantidad)
+
+
+def repreciar_lista(lista_precio, canales=None, fecha=None):
+    """
+    Calcula la matriz completa de precios de una lista.
+
+    Args:
+        lista_precio (ListaPrecio | str): La lista o su ID.
+        canales (list[int]): Canales a calcular (por defecto todos los de CanalVenta).
+        fecha (date): Fecha de vigencia de las reglas (por defecto hoy).
+
+    Returns:
+        MatrizPrecios
+    """
+    if np is None:
+        raise ImproperlyConfigured("El repricing vectorizado requiere numpy instalado.")
+
+    indice = obtener_indice(lista_precio, fecha)
+    canales = list(canales or CanalVenta.values)
+
+    filas = list(
+        Articulo.objects.filter(articulo_id__in=list(indice.precios.keys()))
+        .order_by('codigo_articulo')
+        .values_list('articulo_id', 'grupo_id', 'grupo_id__linea_id', 'costo_actual')
+    )
+    articulo_ids = [str(fila[0]) for fila in filas]
+    grupo_ids = [str(fila[1]) for fila in filas]
+    linea_ids = [str(fila[2]) for fila in filas]
+    costos = [fila[3] for fila in filas]
+    precios = [indice.precio(articulo_id) for articulo_id in articulo_ids]
+
+    reglas = sorted({
+        regla
+        for bucket in (indice.por_articulo, indice.por_grupo, indice.por_linea)
+        for reglas_bucket in bucket.values()
+        for regla in reglas_bucket
+    })
+    tramos = np.array(indice.tramos, dtype=np.int64)
+
+    n = len(articulo_ids)
+    base = np.array([float(p.precio_base) for p in precios], dtype=np.float64).reshape(n)
+    minimo = np.array([float(p.precio_minimo) for p in precios], dtype=np.float64).reshape(n)
+    costo = np.array([float(c) for c in costos], dtype=np.float64).reshape(n)
+
+    codigos = {}
+    cod_articulo = np.array([codigos.setdefault(x, len(codigos)) for x in articulo_ids], dtype=np.int64).reshape(n)
+    cod_grupo = np.array([codigos.setdefault(x, len(codigos)) for x in grupo_ids], dtype=np.int64).reshape(n)
+    cod_linea = np.array([codigos.setdefault(x, len(codigos)) for x in linea_ids], dtype=np.int64).reshape(n)
+
+    forma = (n, len(canales), len(tramos))
+    precio = np.broadcast_to(base[:, None, None], forma).copy()
+    descuento = np.zeros(forma, dtype=np.float64)
+
+    # Aplicar reglas en orden de prioridad
+    for regla in reglas:
+        alcance = np.zeros(n, dtype=bool)
+        if regla.articulo_id in codigos:
+            alcance |= cod_articulo == codigos[regla.articulo_id]
+        if regla.grupo_id in codigos:
+            alcance |= cod_grupo == codigos[regla.grupo_id]
+        if regla.linea_id in codigos:
+            alcance |= cod_linea == codigos[regla.linea_id]
+        if not alcance.any():
+            continue
+
+        canal_ok = np.array([regla.aplica_a_canal(canal) for canal in canales], dtype=bool)
+        tramo_ok = np.array([regla.aplica_a_cantidad(int(t)) for t in tramos], dtype=bool)
+        mascara = alcance[:, None, None] & canal_ok[None, :, None] & tramo_ok[None, None, :]
+
+        valor = float(regla.valor_descuento)
+        if regla.tipo_descuento == TipoDescuento.PORCENTAJE:
+            descuento_regla = precio * valor / 100
+        elif regla.tipo_descuento == TipoDescuento.MONTO_FIJO:
+            descuento_regla = np.full(forma, valor)
+        else:
+            continue
+
+        precio = np.where(mascara, precio - descuento_regla, precio)
+        descuento = np.where(mascara, descuento + descuento_regla, descuento)
+
+    # Precio mínimo
+    minimo_3d = minimo[:, None, None]
+    bajo_minimo = precio < minimo_3d
+    precio_final = np.where(bajo_minimo, minimo_3d, precio)
+    descuento = np.where(bajo_minimo, (base - minimo)[:, None, None], descuento)
+    bajo_costo = precio_final < costo[:, None, None]
+
+    # Redondeo a centavos (np.rint redondea mitades al par, como ROUND_HALF_EVEN)
+    final_centavos = precio_final * 100
+    descuento_centavos = descuento * 100
+
+    def cerca_de_mitad(valores):
+        return np.abs(valores - np.floor(valores) - 0.5) < TOLERANCIA_CENTAVOS
+
+    ambiguas = (
+        cerca_de_mitad(final_centavos)
+        | cerca_de_mitad(descuento_centavos)
+        | (np.abs(precio - minimo_3d) * 100 < TOLERANCIA_CENTAVOS)
+        | (np.abs(precio_final - costo[:, None, None]) * 100 < TOLERANCIA_CENTAVOS)
+    )
+
+    precio_final_centavos = np.rint(final_centavos).astype(np.int64)
+    descuento_total_centavos = np.rint(descuento_centavos).astype(np.int64)
+
+    # Recalcular con Decimal las celdas ambiguas
+    for i, j, k in zip(*np.nonzero(ambiguas)):
+        reglas_celda = indice.reglas_aplicables(
+            articulo_ids[i], grupo_ids[i], linea_ids[i], canales[j], int(tramos[k])
+        )
+        exacto = aplicar_reglas(precios[i].precio_base, precios[i].precio_minimo, costos[i], reglas_celda)
+        precio_final_centavos[i, j, k] = int(exacto["precio_final"].scaleb(2))
+        descuento_total_centavos[i, j, k] = int(exacto["descuento_total"].scaleb(2))
+        bajo_costo[i, j, k] = exacto["vendido_bajo_costo"]
+
+    precio_base_centavos = np.array([int(p.precio_base.scaleb(2)) for p in precios], dtype=np.int64).reshape(n)
+
+    return MatrizPrecios(
+        lista_precio_id=indice.lista_precio_id,
+        fecha=indice.fecha,
+        articulo_ids=articulo_ids,
+        canales=canales,
+        tramos=tramos,
+        precio_base=precio_base_centavos,
+        precio_final=precio_final_centavos,
+        descuento_total=descuento_total_centavos,
+        vendido_bajo_costo=bajo_costo,
+    )
@@ -6,29 +6,50 @@ from rest_framework.views import APIView
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.http import Http404
+from django.core.exceptions import ValidationError
+from asgiref.sync import sync_to_async
 from django.utils import timezone
 from django.db.models import Sum, Count
+from datetime import date
 from decimal import Decimal
 
 from ventas.models import OrdenCompraCliente
 from productos.models import Articulo
-from precios.models import ListaPrecio
+from precios.models import ListaPrecio, PrecioEfectivo
 from ventas.serializers import (
     OrdenReadSerializer, OrdenWriteSerializer,
     DetalleOrdenWriteSerializer, ArticuloPrecioCalculateSerializer
 )
 from trading_system.choices import EstadoOrden
-from core.pagination import StandardResultsSetPagination
+from core.pagination import PaginacionSeleccionable
+from core.plan_carga import PlanCargaMixin
 from core.permissions import IsAdminOrReadOnly
 from ventas.permissions import CanApproveLowCostSale
 from auditoria.utils import auditoria_context
-from .utils import calculate_price
+from .utils import calculate_price, calculate_order_prices
+from . import idempotencia
+from .retenciones import liberar_retenciones
+from .stock import StockInsuficiente, cantidades_por_articulo, liberar_stock, reservar_stock
+from .cache_cotizaciones import obtener_cache
+from .traza import Traza, explicar_pedido, explicar_precio, medir, solicitado
+from .asincrono import acalculate_order_prices, acalculate_price
+from core.asincrono import AsyncAPIView
 
 
-class OrdenViewSet(viewsets.ModelViewSet):
+class OrdenViewSet(PlanCargaMixin, viewsets.ModelViewSet):
     queryset = OrdenCompraCliente.objects.all().order_by('-fecha_orden')
-    pagination_class = StandardResultsSetPagination
+    # ?paginacion=keyset pagina por (fecha_orden, id) sin COUNT ni OFFSET
+    pagination_class = PaginacionSeleccionable
+    ordering_keyset = ('-fecha_orden', '-orden_compra_cliente_id')
     permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
+    # Serializador de la respuesta de cada acción; su plan de carga (core.plan_carga) fija las consultas
+    planes_carga = {
+        accion: OrdenReadSerializer
+        for accion in (
+            'list', 'retrieve', 'create', 'update', 'partial_update', 'confirmar_orden', 'anular_orden',
+            'marcar_como_facturada', 'anular_orden_confirmada', 'aprobar_venta_bajo_costo',
+        )
+    }
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -36,11 +57,37 @@ class OrdenViewSet(viewsets.ModelViewSet):
         return OrdenReadSerializer
 
     def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        orden = serializer.save()
-        read_serializer = OrdenReadSerializer(orden)
-        return Response(read_serializer.data, status=status.HTTP_201_CREATED)
+        clave = request.headers.get(idempotencia.ENCABEZADO)
+        if clave is None:
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            orden = serializer.save()
+            return Response(self.serializar_cargado(orden), status=status.HTTP_201_CREATED)
+
+        if not clave or len(clave) > idempotencia.LARGO_MAXIMO:
+            return Response(
+                {"detail": f"{idempotencia.ENCABEZADO} debe tener entre 1 y {idempotencia.LARGO_MAXIMO} caracteres."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic():
+            registro, creada = idempotencia.registrar_clave(request.user, clave, request.data)
+            if not creada:
+                if not idempotencia.coincide(registro, request.data):
+                    return Response(
+                        {"detail": f"{idempotencia.ENCABEZADO} ya se usó con otro contenido."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                # Reintento: se repite la respuesta del primer intento
+                return Response(registro.respuesta, status=status.HTTP_201_CREATED,
+                                headers={'Idempotent-Replayed': 'true'})
+
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            orden = serializer.save()
+            respuesta = self.serializar_cargado(orden)
+            idempotencia.guardar_resultado(registro, orden, respuesta)
+        return Response(respuesta, status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
@@ -55,63 +102,68 @@ class OrdenViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
         orden = serializer.save()
-        read_serializer = OrdenReadSerializer(orden)
-        return Response(read_serializer.data)
+        return Response(self.serializar_cargado(orden))
+
+    @staticmethod
+    def _bloquear_orden(orden):
+        """Relee la orden con bloqueo de fila: dos transiciones concurrentes no leen el mismo estado"""
+        return OrdenCompraCliente.objects.select_for_update().get(pk=orden.pk)
 
     @action(detail=True, methods=['post'], url_path='confirmar')
     def confirmar_orden(self, request, pk=None):
         orden = self.get_object()
-        if orden.estado != EstadoOrden.PENDIENTE:
-            return Response(
-                {"detail": "Solo se pueden confirmar órdenes en estado PENDIENTE."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        with transaction.atomic():
-            for detalle in orden.detalles_orden_compra_cliente.all():
-                if detalle.cantidad > detalle.articulo.stock:
+        try:
+            with transaction.atomic():
+                orden = self._bloquear_orden(orden)
+                if orden.estado != EstadoOrden.PENDIENTE:
                     return Response(
-                        {
-                            "detail": f"Stock insuficiente para el artículo {detalle.articulo.descripcion}. Stock disponible: {detalle.articulo.stock}, solicitado: {detalle.cantidad}."},
+                        {"detail": "Solo se pueden confirmar órdenes en estado PENDIENTE."},
                         status=status.HTTP_400_BAD_REQUEST
                     )
 
-            for detalle in orden.detalles_orden_compra_cliente.all():
-                articulo = detalle.articulo
-                articulo.stock -= detalle.cantidad
-                articulo.save(update_fields=['stock'])
+                reservar_stock(cantidades_por_articulo(orden), orden)
+                liberar_retenciones(orden)
 
-            with auditoria_context(request.user, motivo=f"Orden {orden.orden_compra_cliente_id} confirmada"):
-                orden.estado = EstadoOrden.PROCESANDO
-                orden.save()
+                with auditoria_context(request.user, motivo=f"Orden {orden.orden_compra_cliente_id} confirmada"):
+                    orden.estado = EstadoOrden.PROCESANDO
+                    orden.save()
+        except StockInsuficiente as exc:
+            return Response(
+                {
+                    "detail": "Stock insuficiente para: " + "; ".join(
+                        f"{faltante['descripcion']} (disponible: {faltante['disponible']}, solicitado: {faltante['solicitado']})"
+                        for faltante in exc.faltantes
+                    ) + ".",
+                    "faltantes": exc.faltantes,
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        read_serializer = OrdenReadSerializer(orden)
-        return Response(read_serializer.data, status=status.HTTP_200_OK)
+        return Response(self.serializar_cargado(orden), status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], url_path='anular')
     def anular_orden(self, request, pk=None):
         orden = self.get_object()
-        estado_original = orden.estado
-
-        if estado_original not in [EstadoOrden.PENDIENTE, EstadoOrden.PROCESANDO]:
-            return Response(
-                {"detail": "Solo se pueden anular órdenes en estado PENDIENTE o PROCESANDO."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
 
         with transaction.atomic():
+            orden = self._bloquear_orden(orden)
+            estado_original = orden.estado
+            if estado_original not in [EstadoOrden.PENDIENTE, EstadoOrden.PROCESANDO]:
+                return Response(
+                    {"detail": "Solo se pueden anular órdenes en estado PENDIENTE o PROCESANDO."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
             if estado_original == EstadoOrden.PROCESANDO:
-                for detalle in orden.detalles_orden_compra_cliente.all():
-                    articulo = detalle.articulo
-                    articulo.stock += detalle.cantidad
-                    articulo.save(update_fields=['stock'])
+                liberar_stock(cantidades_por_articulo(orden), orden)
+            else:
+                liberar_retenciones(orden)
 
             with auditoria_context(request.user, motivo=f"Orden {orden.orden_compra_cliente_id} anulada"):
                 orden.estado = EstadoOrden.CANCELADA
                 orden.save()
 
-        read_serializer = OrdenReadSerializer(orden)
-        return Response(read_serializer.data, status=status.HTTP_200_OK)
+        return Response(self.serializar_cargado(orden), status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], url_path='marcar-como-facturada')
     def marcar_como_facturada(self, request, pk=None):
@@ -128,30 +180,27 @@ class OrdenViewSet(viewsets.ModelViewSet):
                 orden.estado = EstadoOrden.COMPLETADA
                 orden.save()
 
-        read_serializer = OrdenReadSerializer(orden)
-        return Response(read_serializer.data, status=status.HTTP_200_OK)
+        return Response(self.serializar_cargado(orden), status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], url_path='anular-confirmada')
     def anular_orden_confirmada(self, request, pk=None):
         orden = self.get_object()
-        if orden.estado != EstadoOrden.COMPLETADA:
-            return Response(
-                {"detail": "Solo se pueden anular órdenes confirmadas/completadas."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
 
         with transaction.atomic():
-            for detalle in orden.detalles_orden_compra_cliente.all():
-                articulo = detalle.articulo
-                articulo.stock += detalle.cantidad
-                articulo.save(update_fields=['stock'])
+            orden = self._bloquear_orden(orden)
+            if orden.estado != EstadoOrden.COMPLETADA:
+                return Response(
+                    {"detail": "Solo se pueden anular órdenes confirmadas/completadas."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            liberar_stock(cantidades_por_articulo(orden), orden)
 
             with auditoria_context(request.user, motivo=f"Orden {orden.orden_compra_cliente_id} confirmada anulada"):
                 orden.estado = EstadoOrden.CANCELADA
                 orden.save()
 
-        read_serializer = OrdenReadSerializer(orden)
-        return Response(read_serializer.data, status=status.HTTP_200_OK)
+        return Response(self.serializar_cargado(orden), status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], url_path='aprobar-venta-bajo-costo',
             permission_classes=[IsAuthenticated, CanApproveLowCostSale])
@@ -166,9 +215,9 @@ class OrdenViewSet(viewsets.ModelViewSet):
         with auditoria_context(request.user, motivo=f"Orden {orden.orden_compra_cliente_id} aprobada bajo costo"):
             pass
 
-        read_serializer = OrdenReadSerializer(orden)
+        respuesta = self.serializar_cargado(orden)
         return Response(
-            {"detail": "Venta bajo costo aprobada.", "orden": read_serializer.data},
+            {"detail": "Venta bajo costo aprobada.", "orden": respuesta},
             status=status.HTTP_200_OK
         )
 
@@ -190,47 +239,49 @@ class OrdenViewSet(viewsets.ModelViewSet):
         except Http404:
             return Response({"detail": "Lista de Precio no encontrada."}, status=status.HTTP_404_NOT_FOUND)
 
-        simulated_total = Decimal('0.0')
-        simulated_items = []
+        if solicitado(request):
+            pedido = explicar_pedido(serializer.validated_data, lista_precio, canal)
+        else:
+            pedido = calculate_order_prices(serializer.validated_data, lista_precio, canal)
+        if "error" in pedido:
+            return Response({"detail": pedido["error"]}, status=status.HTTP_400_BAD_REQUEST)
 
-        for item_data in serializer.validated_data:
-            articulo_id = item_data['articulo_id']
-            cantidad = item_data['cantidad']
-            try:
-                articulo = get_object_or_404(Articulo, articulo_id=articulo_id)
-            except Http404:
-                return Response({"detail": f"Artículo con ID {articulo_id} no encontrado."},
-                                status=status.HTTP_404_NOT_FOUND)
+        return Response(respuesta_simulacion(pedido), status=status.HTTP_200_OK)
 
-            price_data = calculate_price(
-                articulo=articulo,
-                lista_precio=lista_precio,
-                canal=canal,
-                cantidad=cantidad
-            )
 
-            if "error" in price_data:
-                return Response({"detail": price_data["error"]}, status=status.HTTP_400_BAD_REQUEST)
+def respuesta_simulacion(pedido):
+    """Cuerpo de la respuesta de simular_pedido a partir de calculate_order_prices"""
+    simulated_total = Decimal('0.0')
+    simulated_items = []
 
-            total_item = price_data["precio_final"] * cantidad
-            simulated_total += total_item
+    for price_data in pedido["lineas"]:
 
-            simulated_items.append({
-                "articulo_id": str(articulo.articulo_id),
-                "descripcion": articulo.descripcion,
-                "cantidad": cantidad,
-                "precio_base": price_data["precio_base"],
-                "precio_unitario_calculado": price_data["precio_final"],
-                "descuento_aplicado": price_data["descuento_total"],
-                "total_item": total_item,
-                "reglas_aplicadas": price_data["reglas_aplicadas"]
-            })
+        articulo = price_data["articulo"]
+        cantidad = price_data["cantidad"]
+        total_item = price_data["precio_final"] * cantidad
+        simulated_total += total_item
 
-        return Response({
-            "detail": "Simulación de pedido exitosa.",
-            "simulated_total": simulated_total,
-            "simulated_items": simulated_items
-        }, status=status.HTTP_200_OK)
+        simulated_items.append({
+            "articulo_id": str(articulo.articulo_id),
+            "descripcion": articulo.descripcion,
+            "cantidad": cantidad,
+            "precio_base": price_data["precio_base"],
+            "precio_unitario_calculado": price_data["precio_final"],
+            "descuento_aplicado": price_data["descuento_total"],
+            "total_item": total_item,
+            "reglas_aplicadas": price_data["reglas_aplicadas"]
+        })
+
+    respuesta = {
+        "detail": "Simulación de pedido exitosa.",
+        "simulated_subtotal": pedido["subtotal"],
+        "simulated_total": simulated_total,
+        "reglas_pedido": pedido["reglas_pedido"],
+        "simulated_items": simulated_items
+    }
+    if "explicacion" in pedido:
+        respuesta["explain"] = pedido["explicacion"]
+    return respuesta
 
 
 class CalcularPrecioArticuloAPIView(APIView):
@@ -246,24 +297,56 @@ class CalcularPrecioArticuloAPIView(APIView):
         canal = validated_data['canal']
         cantidad = validated_data['cantidad']
 
+        traza = Traza() if solicitado(request) else None
+
+        # Lectura indexada sobre la tabla materializada, vigente solo para hoy
+        with medir(traza, 'precio_efectivo'):
+            efectivo = PrecioEfectivo.objects.select_related('articulo').filter(
+                lista_precio_id=lista_precio_id,
+                articulo_id=articulo_id,
+                canal=canal,
+                cantidad_desde__lte=cantidad,
+                fecha_calculo=date.today()
+            ).order_by('-cantidad_desde').first()
+
+        if efectivo is not None and traza is None:
+            return Response(self._respuesta_efectivo(efectivo, articulo_id, cantidad), status=status.HTTP_200_OK)
+
         try:
             articulo = get_object_or_404(Articulo, articulo_id=articulo_id)
             lista_precio = get_object_or_404(ListaPrecio, lista_precio_id=lista_precio_id)
         except Http404:
             return Response({"detail": "Artículo o Lista de Precio no encontrados."}, status=status.HTTP_404_NOT_FOUND)
 
-        price_data = calculate_price(
-            articulo=articulo,
-            lista_precio=lista_precio,
-            canal=canal,
-            cantidad=cantidad
-        )
+        if efectivo is not None:
+            respuesta = self._respuesta_efectivo(efectivo, articulo_id, cantidad)
+        else:
+            price_data = calculate_price(
+                articulo=articulo,
+                lista_precio=lista_precio,
+                canal=canal,
+                cantidad=cantidad
+            )
 
-        if "error" in price_data:
-            return Response({"detail": price_data["error"]}, status=status.HTTP_400_BAD_REQUEST)
+            if "error" in price_data:
+                return Response({"detail": price_data["error"]}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({
-            "articulo_id": str(articulo_id),
+            respuesta = self._respuesta_calculo(price_data, articulo, cantidad)
+
+        if traza is not None:
+            # El cálculo se repite paso a paso aunque el precio venga de la tabla materializada
+            explicado = explicar_precio(articulo, lista_precio, canal, cantidad, traza)
+            respuesta["explain"] = {
+                "fuente": "precio_efectivo" if efectivo is not None else "calculo",
+                **explicado.get("explicacion", {"error": explicado.get("error")}),
+            }
+
+        return Response(respuesta, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def _respuesta_calculo(price_data, articulo, cantidad):
+        return {
+            "articulo_id": str(articulo.articulo_id),
             "descripcion_articulo": articulo.descripcion,
             "cantidad": cantidad,
             "precio_base_unitario": price_data["precio_base"],
@@ -272,7 +355,113 @@ class CalcularPrecioArticuloAPIView(APIView):
             "total_calculado": price_data["precio_final"] * cantidad,
             "reglas_aplicadas": price_data["reglas_aplicadas"],
             "vendido_bajo_costo": price_data["vendido_bajo_costo"]
-        }, status=status.HTTP_200_OK)
+        }
+
+    @staticmethod
+    def _respuesta_efectivo(efectivo, articulo_id, cantidad):
+        return {
+            "articulo_id": str(articulo_id),
+            "descripcion_articulo": efectivo.articulo.descripcion,
+            "cantidad": cantidad,
+            "precio_base_unitario": efectivo.precio_base,
+            "precio_unitario_calculado": efectivo.precio_final,
+            "descuento_aplicado": efectivo.descuento_total,
+            "total_calculado": efectivo.precio_final * cantidad,
+            "reglas_aplicadas": efectivo.reglas_aplicadas,
+            "vendido_bajo_costo": efectivo.vendido_bajo_costo
+        }
+
+
+class CalcularPrecioArticuloAsyncAPIView(AsyncAPIView):
+    """
+    POST /api/async/calcular-precio-articulo/
+    Versión asíncrona de CalcularPrecioArticuloAPIView para servir con ASGI:
+    mismas entradas y respuesta, con el ORM asíncrono y el índice compilado.
+    """
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request, *args, **kwargs):
+        serializer = ArticuloPrecioCalculateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        validated_data = serializer.validated_data
+        articulo_id = validated_data['articulo_id']
+        lista_precio_id = validated_data['lista_precio_id']
+        canal = validated_data['canal']
+        cantidad = validated_data['cantidad']
+        explicar = solicitado(request)
+
+        efectivo = await PrecioEfectivo.objects.select_related('articulo').filter(
+            lista_precio_id=lista_precio_id,
+            articulo_id=articulo_id,
+            canal=canal,
+            cantidad_desde__lte=cantidad,
+            fecha_calculo=date.today()
+        ).order_by('-cantidad_desde').afirst()
+
+        if efectivo is not None and not explicar:
+            return self.respuesta(CalcularPrecioArticuloAPIView._respuesta_efectivo(efectivo, articulo_id, cantidad))
+
+        try:
+            articulo = await Articulo.objects.select_related('grupo_id__linea').filter(articulo_id=articulo_id).afirst()
+            lista_precio = await ListaPrecio.objects.filter(lista_precio_id=lista_precio_id).afirst()
+        except ValidationError:
+            articulo = lista_precio = None
+        if articulo is None or lista_precio is None:
+            return self.respuesta({"detail": "Artículo o Lista de Precio no encontrados."}, status=status.HTTP_404_NOT_FOUND)
+
+        if efectivo is not None:
+            respuesta = CalcularPrecioArticuloAPIView._respuesta_efectivo(efectivo, articulo_id, cantidad)
+        else:
+            price_data = await acalculate_price(articulo, lista_precio, canal, cantidad)
+            if "error" in price_data:
+                return self.respuesta({"detail": price_data["error"]}, status=status.HTTP_400_BAD_REQUEST)
+            respuesta = CalcularPrecioArticuloAPIView._respuesta_calculo(price_data, articulo, cantidad)
+
+        if explicar:
+            explicado = await sync_to_async(explicar_precio)(articulo, lista_precio, canal, cantidad)
+            respuesta["explain"] = {
+                "fuente": "precio_efectivo" if efectivo is not None else "calculo",
+                **explicado.get("explicacion", {"error": explicado.get("error")}),
+            }
+
+        return self.respuesta(respuesta)
+
+
+class SimularPedidoAsyncAPIView(AsyncAPIView):
+    """
+    POST /api/async/simular-pedido/
+    Versión asíncrona de OrdenViewSet.simular_pedido para servir con ASGI.
+    """
+    permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
+
+    async def post(self, request, *args, **kwargs):
+        serializer = DetalleOrdenWriteSerializer(data=request.data.get('detalles', []), many=True)
+        serializer.is_valid(raise_exception=True)
+
+        lista_precio_id = request.data.get('lista_precio_id')
+        canal = request.data.get('canal')
+        if not lista_precio_id or not canal:
+            return self.respuesta(
+                {"detail": "Se requiere 'lista_precio_id' y 'canal' para la simulación."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            lista_precio = await ListaPrecio.objects.filter(lista_precio_id=lista_precio_id).afirst()
+        except ValidationError:
+            lista_precio = None
+        if lista_precio is None:
+            return self.respuesta({"detail": "Lista de Precio no encontrada."}, status=status.HTTP_404_NOT_FOUND)
+
+        if solicitado(request):
+            pedido = await sync_to_async(explicar_pedido)(serializer.validated_data, lista_precio, canal)
+        else:
+            pedido = await acalculate_order_prices(serializer.validated_data, lista_precio, canal)
+        if "error" in pedido:
+            return self.respuesta({"detail": pedido["error"]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.respuesta(respuesta_simulacion(pedido))
 
 
 class EstadisticasGeneralesAPIView(APIView):
@@ -309,4 +498,15 @@ class EstadisticasGeneralesAPIView(APIView):
             "ordenes_hoy": stats_hoy['cantidad_ordenes'] or 0,
             "ventas_mes": stats_mes['total_ventas'] or 0,
             "ordenes_mes": stats_mes['cantidad_ordenes'] or 0,
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+
+class EstadisticasCacheCotizacionesAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        cache = obtener_cache()
+        if cache is None:
+            return Response({"habilitado": False}, status=status.HTTP_200_OK)
+
+        return Response({"habilitado": True, **cache.estadisticas()}, status=status.HTTP_200_OK)